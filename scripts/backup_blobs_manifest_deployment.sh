@@ -0,0 +1,12 @@
+#!/bin/bash
+#SBATCH --partition mit_preemptable
+#SBATCH --array 0-15
+#SBATCH --mem=1GB
+#SBATCH --cpus-per-task 1
+#SBATCH --time=02:00:00
+
+source /etc/profile.d/modules.sh  # When run via crontab, this is needed to load the modules
+module load miniforge
+conda activate /orcd/data/dandi/001/environments/name-s3+backup_env
+
+flock -n /orcd/data/dandi/001/backup/flocks/backup_blobs_batch_$SLURM_ARRAY_TASK_ID.lock s3backup dandi blobs $SLURM_ARRAY_TASK_ID --from-manifest
@@ -0,0 +1,13 @@
+#!/bin/bash
+#SBATCH --partition mit_preemptable
+#SBATCH --array 0-15
+#SBATCH --mem=1GB
+#SBATCH --cpus-per-task 1
+#SBATCH --time=12:00:00
+
+# Requires a current plan, created beforehand with `s3backup dandi plan blobs`
+source /etc/profile.d/modules.sh  # When run via crontab, this is needed to load the modules
+module load miniforge
+conda activate /orcd/data/dandi/001/environments/name-s3+backup_env
+
+flock -n /orcd/data/dandi/001/backup/flocks/backup_blobs_work_$SLURM_ARRAY_TASK_ID.lock s3backup dandi work blobs
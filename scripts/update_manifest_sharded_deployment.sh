@@ -0,0 +1,13 @@
+#!/bin/bash
+#SBATCH --partition mit_preemptable
+#SBATCH --array 0-15
+#SBATCH --mem=2GB
+#SBATCH --cpus-per-task 8
+#SBATCH --time=04:00:00
+
+# Once all shards have completed, combine them with `s3backup dandi merge-manifest 16`
+source /etc/profile.d/modules.sh  # When run via crontab, this is needed to load the modules
+module load miniforge
+conda activate /orcd/data/dandi/001/environments/name-s3+backup_env
+
+flock -n /orcd/data/dandi/001/backup/flocks/update_manifest_$SLURM_ARRAY_TASK_ID.lock s3backup dandi manifest --shard $SLURM_ARRAY_TASK_ID/16
@@ -1,11 +1,26 @@
+from ._benchmark import benchmark_dandi_backup, benchmark_dandi_component
 from ._dandi import backup_dandi_blobs, backup_dandi_nonblobs, backup_dandi_zarr
 from ._display import update_display
-from ._update_manifest import update_manifest
+from ._inventory_index import diff_dandi_blobs
+from ._quarantine import collect_dandi_garbage
+from ._scheduler import plan_dandi_backup, work_dandi_backup
+from ._simulation import simulate_transfer_controller
+from ._stats import summarize_dandi_metrics
+from ._update_manifest import merge_manifest_shards, update_manifest
 
 __all__ = [
     "backup_dandi_blobs",
     "backup_dandi_zarr",
     "backup_dandi_nonblobs",
+    "diff_dandi_blobs",
+    "collect_dandi_garbage",
+    "plan_dandi_backup",
+    "work_dandi_backup",
     "update_display",
+    "summarize_dandi_metrics",
+    "benchmark_dandi_backup",
+    "benchmark_dandi_component",
+    "simulate_transfer_controller",
     "update_manifest",
+    "merge_manifest_shards",
 ]
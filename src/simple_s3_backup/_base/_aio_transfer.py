@@ -0,0 +1,267 @@
+import asyncio
+import collections
+import concurrent.futures
+import os
+import pathlib
+import time
+
+from ._globals import DANDI_BUCKET
+from ._metrics import _measure
+from ._utils import _human_readable_size
+
+_PART_SIZE_IN_BYTES = 67_108_864  # 64 MiB
+_READ_SIZE_IN_BYTES = 1_048_576  # 1 MiB
+
+
+def _sync_prefixes_with_aio(
+    prefix_to_destination: dict[str, pathlib.Path],
+    bucket: str = DANDI_BUCKET,
+    max_concurrency: int = 64,
+    part_size_in_bytes: int = _PART_SIZE_IN_BYTES,
+) -> collections.Counter:
+    """
+    Copy every object under the given prefixes with a native asyncio S3 client instead of shelling out to s5cmd.
+
+    Objects are skipped under the same rules as `s5cmd cp --if-size-differ --if-source-newer`. Each object is
+    streamed straight to a `.partial` file next to its destination, using concurrent range GETs for objects larger
+    than `part_size_in_bytes`, and atomically renamed into place once complete. Every filesystem call (`stat`,
+    `mkdir`, writes, `fsync`, and renames) runs on a pool of threads, so that a slow filesystem never stalls the event
+    loop and with it every other download.
+
+    Requires the optional `aiobotocore` dependency. Requests are signed with the standard AWS credentials if any are
+    configured and unsigned otherwise (the DANDI bucket is public). They are sent to `S3_ENDPOINT_URL` if set (the
+    same variable honored by s5cmd), for example to target a local moto server.
+
+    Parameters
+    ----------
+    prefix_to_destination : dict of str to pathlib.Path
+        The key prefixes to copy (for example `blobs/abc/`) and the local directory each one is copied into.
+        The part of each key after its prefix is preserved under the destination.
+    bucket : str, default: DANDI_BUCKET
+        The name of the bucket (`dandiarchive` unless overridden by `S3BACKUP_DANDI_BUCKET`).
+    max_concurrency : int, default: 64
+        The maximum number of GET requests in flight at any time.
+    part_size_in_bytes : int, default: 64 MiB
+        The size of each range GET for large objects.
+
+    Returns
+    -------
+    collections.Counter
+        The number of objects listed, copied, and skipped, the number of bytes copied, and the number of requests
+        retried by the client.
+    """
+    prefix = os.path.commonprefix(list(prefix_to_destination))
+    with _measure(kind="command", name="aio cp", prefix=prefix) as metric:
+        start_time = time.time()
+        summary = asyncio.run(
+            _sync_prefixes(
+                prefix_to_destination=prefix_to_destination,
+                bucket=bucket,
+                max_concurrency=max_concurrency,
+                part_size_in_bytes=part_size_in_bytes,
+            )
+        )
+        duration_in_seconds = max(time.time() - start_time, 1e-6)
+        metric.update(
+            bytes=summary["bytes"], objects=summary["copied"], errors=summary["errors"], retries=summary["retries"]
+        )
+
+    print(
+        f"Listed {summary['listed']} objects, copied {summary['copied']} "
+        f"({_human_readable_size(size_in_bytes=summary['bytes'])}) and skipped {summary['skipped']} "
+        f"in {duration_in_seconds:.1f} s "
+        f"({_human_readable_size(size_in_bytes=int(summary['bytes'] / duration_in_seconds))}/s), "
+        f"{summary['errors']} errors"
+    )
+    return summary
+
+
+async def _sync_prefixes(
+    prefix_to_destination: dict[str, pathlib.Path],
+    bucket: str,
+    max_concurrency: int,
+    part_size_in_bytes: int,
+) -> collections.Counter:
+    try:
+        from aiobotocore.session import get_session
+        from botocore import UNSIGNED
+        from botocore.config import Config
+    except ImportError as exception:
+        message = (
+            "The asyncio transfer backend requires `aiobotocore`; install with `pip install simple-s3-backup[aio]`."
+        )
+        raise ImportError(message) from exception
+
+    summary = collections.Counter(listed=0, copied=0, skipped=0, errors=0, bytes=0, retries=0)
+    request_semaphore = asyncio.Semaphore(max_concurrency)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=4 * max_concurrency)
+
+    # One thread per request in flight, so that every download may be writing at once
+    asyncio.get_running_loop().set_default_executor(
+        concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="aio_transfer")
+    )
+
+    session = get_session()
+    config = Config(max_pool_connections=max_concurrency)
+    if await session.get_credentials() is None:
+        config = config.merge(Config(signature_version=UNSIGNED))
+    async with session.create_client(
+        "s3", endpoint_url=os.environ.get("S3_ENDPOINT_URL", None), config=config
+    ) as client:
+        workers = [
+            asyncio.create_task(
+                _download_worker(
+                    client=client,
+                    bucket=bucket,
+                    queue=queue,
+                    request_semaphore=request_semaphore,
+                    part_size_in_bytes=part_size_in_bytes,
+                    summary=summary,
+                )
+            )
+            for _ in range(max_concurrency)
+        ]
+
+        # All prefixes are paginated concurrently, feeding a bounded queue of objects to download
+        await asyncio.gather(
+            *(
+                _list_prefix(client=client, bucket=bucket, prefix=prefix, destination=destination, queue=queue)
+                for prefix, destination in prefix_to_destination.items()
+            )
+        )
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+
+    return summary
+
+
+async def _list_prefix(client, bucket: str, prefix: str, destination: pathlib.Path, queue: asyncio.Queue) -> None:
+    paginator = client.get_paginator("list_objects_v2")
+    async for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for content in page.get("Contents", []):
+            file_path = destination / content["Key"].removeprefix(prefix)
+            await queue.put((content["Key"], content["Size"], content["LastModified"].timestamp(), file_path))
+
+
+async def _download_worker(
+    client,
+    bucket: str,
+    queue: asyncio.Queue,
+    request_semaphore: asyncio.Semaphore,
+    part_size_in_bytes: int,
+    summary: collections.Counter,
+) -> None:
+    while (item := await queue.get()) is not None:
+        key, size, mtime, file_path = item
+        summary["listed"] += 1
+
+        # Same rules as `s5cmd cp --if-size-differ --if-source-newer`
+        local_stat = await asyncio.to_thread(_stat_or_none, file_path)
+        if local_stat is not None and local_stat.st_size == size and local_stat.st_mtime >= mtime:
+            summary["skipped"] += 1
+            continue
+
+        try:
+            summary["retries"] += await _download_object(
+                client=client,
+                bucket=bucket,
+                key=key,
+                size=size,
+                file_path=file_path,
+                request_semaphore=request_semaphore,
+                part_size_in_bytes=part_size_in_bytes,
+            )
+        except Exception as exception:
+            print(f"ERROR: Unable to copy s3://{bucket}/{key}: {exception}")
+            summary["errors"] += 1
+            continue
+
+        summary["copied"] += 1
+        summary["bytes"] += size
+
+
+async def _download_object(
+    client,
+    bucket: str,
+    key: str,
+    size: int,
+    file_path: pathlib.Path,
+    request_semaphore: asyncio.Semaphore,
+    part_size_in_bytes: int,
+) -> int:
+    """Download an object to its file path, returning the number of requests the client had to retry."""
+    partial_file_path = file_path.with_name(f"{file_path.name}.partial")
+
+    file_descriptor = await asyncio.to_thread(_open_partial_file, partial_file_path, size)
+    try:
+        ranges = [(start, min(start + part_size_in_bytes, size) - 1) for start in range(0, size, part_size_in_bytes)]
+        retries_per_range = await asyncio.gather(
+            *(
+                _download_range(
+                    client=client,
+                    bucket=bucket,
+                    key=key,
+                    byte_range=byte_range if len(ranges) > 1 else None,
+                    file_descriptor=file_descriptor,
+                    request_semaphore=request_semaphore,
+                )
+                for byte_range in ranges
+            )
+        )
+        await asyncio.to_thread(os.fsync, file_descriptor)
+    except BaseException:
+        # Also reached on cancellation, when nothing more may be awaited
+        os.close(file_descriptor)
+        partial_file_path.unlink(missing_ok=True)
+        raise
+
+    await asyncio.to_thread(_close_and_rename, file_descriptor, partial_file_path, file_path)
+
+    return sum(retries_per_range)
+
+
+async def _download_range(
+    client,
+    bucket: str,
+    key: str,
+    byte_range: tuple[int, int] | None,
+    file_descriptor: int,
+    request_semaphore: asyncio.Semaphore,
+) -> int:
+    request = {"Bucket": bucket, "Key": key}
+    if byte_range is not None:
+        request["Range"] = f"bytes={byte_range[0]}-{byte_range[1]}"
+
+    offset = byte_range[0] if byte_range is not None else 0
+    async with request_semaphore:
+        response = await client.get_object(**request)
+        async with response["Body"] as body:
+            while chunk := await body.read(_READ_SIZE_IN_BYTES):
+                await asyncio.to_thread(os.pwrite, file_descriptor, chunk, offset)
+                offset += len(chunk)
+
+    return response["ResponseMetadata"].get("RetryAttempts", 0)
+
+
+def _stat_or_none(file_path: pathlib.Path) -> os.stat_result | None:
+    try:
+        return file_path.stat()
+    except FileNotFoundError:
+        return None
+
+
+def _open_partial_file(partial_file_path: pathlib.Path, size: int) -> int:
+    partial_file_path.parent.mkdir(parents=True, exist_ok=True)
+    file_descriptor = os.open(partial_file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        os.ftruncate(file_descriptor, size)
+    except BaseException:
+        os.close(file_descriptor)
+        raise
+    return file_descriptor
+
+
+def _close_and_rename(file_descriptor: int, partial_file_path: pathlib.Path, file_path: pathlib.Path) -> None:
+    os.close(file_descriptor)
+    partial_file_path.replace(file_path)
@@ -0,0 +1,616 @@
+import collections
+import datetime
+import hashlib
+import importlib.metadata
+import json
+import os
+import pathlib
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import typing
+import uuid
+
+from tabulate2 import tabulate
+
+from ._globals import DANDI_BUCKET
+from ._utils import _deploy_subprocess
+
+_CLI_ENTRY_POINT = "from simple_s3_backup._command_line_interface._cli import _s3backup; _s3backup()"
+
+
+def benchmark_dandi_backup(
+    directory: pathlib.Path | None = None,
+    number_of_blobs: int = 1_000,
+    number_of_zarrs: int = 4,
+    number_of_chunks_per_zarr: int = 1_000,
+    number_of_nonblob_files: int = 100,
+    object_size_in_bytes: int = 65_536,
+    count_syscalls: bool = False,
+    output_file_path: pathlib.Path | None = None,
+    seed: int = 0,
+) -> list[dict]:
+    """
+    Run the backup against a synthetic DANDI-shaped bucket served locally, and report how each operation performs.
+
+    A bucket of hex-prefixed blobs, Zarr chunk trees, and Dandiset files is generated, served by a local moto
+    server, and backed up into a local root by the `nonblobs`, `blobs`, `zarr`, `manifest`, and `dashboard`
+    commands, in that order. Each command runs in its own process, pointed at the server through `S3_ENDPOINT_URL`
+    and at the local root through `S3BACKUP_DANDI_ROOT`, so that its peak memory can be measured in isolation.
+
+    Requires the optional `moto[server]` dependency and `s5cmd`; counting system calls also requires `strace`.
+
+    Parameters
+    ----------
+    directory : pathlib.Path, optional
+        The directory in which to generate the bucket and the local root. Defaults to a new temporary directory.
+    number_of_blobs : int, default: 1,000
+        The number of blobs to generate.
+    number_of_zarrs : int, default: 4
+        The number of Zarr stores to generate.
+    number_of_chunks_per_zarr : int, default: 1,000
+        The number of chunks in each Zarr store.
+    number_of_nonblob_files : int, default: 100
+        The number of Dandiset files to generate.
+    object_size_in_bytes : int, default: 64 KiB
+        The average size of each object; sizes are drawn uniformly from 1 byte to twice this.
+    count_syscalls : bool, default: False
+        Whether to count the system calls of each operation (and its subprocesses) with `strace`.
+        Tracing slows operations down, so only compare timings between runs made with the same setting.
+    output_file_path : pathlib.Path, optional
+        A JSON file to write the parameters and results to, for comparison between versions.
+    seed : int, default: 0
+        The seed of the generated content, so that runs are comparable.
+
+    Returns
+    -------
+    list of dict
+        One row per operation, with its wall time, objects and MB per second, peak RSS, system calls (if counted),
+        and the number of its commands that failed.
+    """
+    try:
+        from moto.server import ThreadedMotoServer
+    except ImportError as exception:
+        message = "The benchmark requires `moto`; install with `pip install simple-s3-backup[benchmark]`."
+        raise ImportError(message) from exception
+
+    if count_syscalls is True and shutil.which("strace") is None:
+        message = "Counting system calls requires `strace` to be installed."
+        raise RuntimeError(message)
+
+    directory = pathlib.Path(tempfile.mkdtemp(prefix="s3backup_benchmark_")) if directory is None else directory
+    bucket_directory = directory / "bucket"
+    root = directory / "root"
+    log_directory = directory / "logs"
+    print(f"Generating synthetic archive in {bucket_directory}...")
+    kind_to_summary, blob_id_to_checksum = _generate_synthetic_dandi_archive(
+        directory=bucket_directory,
+        number_of_blobs=number_of_blobs,
+        number_of_zarrs=number_of_zarrs,
+        number_of_chunks_per_zarr=number_of_chunks_per_zarr,
+        number_of_nonblob_files=number_of_nonblob_files,
+        object_size_in_bytes=object_size_in_bytes,
+        seed=seed,
+    )
+
+    for partition in ("001", "002"):
+        (root / partition / "s3dandiarchive").mkdir(parents=True, exist_ok=True)
+    for subdirectory in ("manifests", "batches", "checkpoints", "flocks", "plans", "backup-status/data"):
+        (root / "001" / "backup" / subdirectory).mkdir(parents=True, exist_ok=True)
+    with (root / "001" / "backup" / "manifests" / "remote_checksums.json").open(mode="w") as file_stream:
+        json.dump(obj=blob_id_to_checksum, fp=file_stream)
+    log_directory.mkdir(exist_ok=True)
+
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=port, verbose=False)
+    server.start()
+    try:
+        environment_variables = {
+            **os.environ,
+            "S3_ENDPOINT_URL": f"http://127.0.0.1:{port}",
+            "AWS_ACCESS_KEY_ID": "benchmark",
+            "AWS_SECRET_ACCESS_KEY": "benchmark",
+            "AWS_DEFAULT_REGION": "us-east-1",
+            "S3BACKUP_DANDI_ROOT": str(root),
+        }
+        print(f"Serving it from {environment_variables['S3_ENDPOINT_URL']}...")
+        _deploy_subprocess(command=f"s5cmd mb s3://{DANDI_BUCKET}", environment_variables=environment_variables)
+        _deploy_subprocess(
+            command=f"s5cmd cp '{bucket_directory}/*' s3://{DANDI_BUCKET}/", environment_variables=environment_variables
+        )
+
+        zarr_heads = sorted({int(zarr_id[:2], 16) for zarr_id in kind_to_summary["zarr"]["ids"]})
+        all_objects = collections.Counter()
+        for summary in kind_to_summary.values():
+            all_objects.update(objects=summary["objects"], bytes=summary["bytes"])
+        operations = [
+            ("nonblobs", [["dandi", "nonblobs"]], kind_to_summary["nonblobs"]),
+            ("blobs", [["dandi", "blobs", str(task_id)] for task_id in range(16)], kind_to_summary["blobs"]),
+            ("zarr", [["dandi", "zarr", str(head)] for head in zarr_heads], kind_to_summary["zarr"]),
+            ("manifest", [["dandi", "manifest"]], kind_to_summary["blobs"]),
+            ("dashboard", [["dandi", "dashboard"]], all_objects),
+        ]
+
+        rows = []
+        for name, commands, summary in operations:
+            print(f"Running {name}...")
+            measurement = collections.Counter(duration=0.0, max_rss_in_kilobytes=0, syscalls=0, failures=0)
+            for index, arguments in enumerate(commands):
+                duration, max_rss_in_kilobytes, syscalls, return_code = _run_measured(
+                    command=[sys.executable, "-c", _CLI_ENTRY_POINT, *arguments],
+                    environment_variables=environment_variables,
+                    log_file_path=log_directory / f"{name}_{index}.log",
+                    count_syscalls=count_syscalls,
+                )
+                measurement["duration"] += duration
+                measurement["max_rss_in_kilobytes"] = max(measurement["max_rss_in_kilobytes"], max_rss_in_kilobytes)
+                measurement["syscalls"] += syscalls or 0
+                measurement["failures"] += return_code != 0
+
+            rows.append(
+                _summarize_measurement(
+                    name=name,
+                    commands=len(commands),
+                    measurement=measurement,
+                    summary=summary,
+                    count_syscalls=count_syscalls,
+                )
+            )
+    finally:
+        server.stop()
+
+    _report_results(
+        rows=rows,
+        parameters={
+            "number_of_blobs": number_of_blobs,
+            "number_of_zarrs": number_of_zarrs,
+            "number_of_chunks_per_zarr": number_of_chunks_per_zarr,
+            "number_of_nonblob_files": number_of_nonblob_files,
+            "object_size_in_bytes": object_size_in_bytes,
+            "count_syscalls": count_syscalls,
+            "seed": seed,
+        },
+        log_directory=log_directory,
+        output_file_path=output_file_path,
+    )
+
+    return rows
+
+
+def benchmark_dandi_component(
+    component: typing.Literal["listing", "hashing", "scan", "pack"],
+    directory: pathlib.Path | None = None,
+    number_of_objects: int = 1_000,
+    object_size_in_bytes: int = 65_536,
+    count_syscalls: bool = False,
+    output_file_path: pathlib.Path | None = None,
+    seed: int = 0,
+) -> list[dict]:
+    """
+    Measure a single component of the backup against synthetic local input, without any S3 server.
+
+    The input is generated once, then each operation of the component runs in its own process, as in
+    `benchmark_dandi_backup`, so that its peak memory can be measured in isolation. The components are:
+
+    - "listing": parsing an `s5cmd ls --etag` listing of `number_of_objects` blobs into the columnar inventory used by
+      `backup dandi manifest`, and summing it as the dashboard does.
+    - "hashing": calculating the SHA-256 checksums of `number_of_objects` files one at a time, across the process
+      pool of `backup dandi manifest`, and across the pool along with their single-part ETags. The files were just
+      written, so they are likely read from the page cache; drop it beforehand to measure the storage instead.
+    - "scan": measuring a `blobs/abc/def/<ID>` tree of `number_of_objects` files with `rglob` and `stat` (as the
+      dashboard used to), `du`, the `os.scandir` scanner of the dashboard (whole and per prefix), and the scan of
+      `backup dandi manifest`. Each logs the sizes it found, for comparison of apparent and allocated sizes.
+    - "pack": ingesting a Zarr store of `number_of_objects` chunk files from a staging directory, either as one file
+      per chunk (as `backup dandi zarr --nested` stores them) or appended to pack files (as `--packed` does), then
+      scanning each layout with the `os.scandir` scanner of the dashboard and, for the packs, loading their index.
+
+    Parameters
+    ----------
+    component : str
+        The component to measure; see above.
+    directory : pathlib.Path, optional
+        The directory in which to generate the input. Defaults to a new temporary directory.
+    number_of_objects : int, default: 1,000
+        The number of objects (listing lines or files) to generate.
+    object_size_in_bytes : int, default: 64 KiB
+        The average size of each object; sizes are drawn uniformly from 1 byte to twice this.
+    count_syscalls : bool, default: False
+        Whether to count the system calls of each operation with `strace`.
+    output_file_path : pathlib.Path, optional
+        A JSON file to write the parameters and results to, for comparison between versions.
+    seed : int, default: 0
+        The seed of the generated input, so that runs are comparable.
+
+    Returns
+    -------
+    list of dict
+        One row per operation, with its wall time, objects and MB per second, peak RSS, system calls (if counted),
+        and whether it failed.
+    """
+    if count_syscalls is True and shutil.which("strace") is None:
+        message = "Counting system calls requires `strace` to be installed."
+        raise RuntimeError(message)
+
+    directory = pathlib.Path(tempfile.mkdtemp(prefix="s3backup_benchmark_")) if directory is None else directory
+    input_directory = directory / "input"
+    log_directory = directory / "logs"
+    input_directory.mkdir(parents=True, exist_ok=True)
+    log_directory.mkdir(parents=True, exist_ok=True)
+
+    print(f"Generating synthetic {component} input in {input_directory}...")
+    component_to_preparation = {
+        "listing": _prepare_listing_benchmark,
+        "hashing": _prepare_hashing_benchmark,
+        "scan": _prepare_scan_benchmark,
+        "pack": _prepare_pack_benchmark,
+    }
+    operations = component_to_preparation[component](
+        directory=input_directory,
+        number_of_objects=number_of_objects,
+        object_size_in_bytes=object_size_in_bytes,
+        seed=seed,
+    )
+
+    rows = []
+    for name, code, summary in operations:
+        print(f"Running {name}...")
+        duration, max_rss_in_kilobytes, syscalls, return_code = _run_measured(
+            command=[sys.executable, "-c", code, str(input_directory)],
+            environment_variables=dict(os.environ),
+            log_file_path=log_directory / f"{name}.log",
+            count_syscalls=count_syscalls,
+        )
+        measurement = {
+            "duration": duration,
+            "max_rss_in_kilobytes": max_rss_in_kilobytes,
+            "syscalls": syscalls or 0,
+            "failures": int(return_code != 0),
+        }
+        rows.append(
+            _summarize_measurement(
+                name=name, commands=1, measurement=measurement, summary=summary, count_syscalls=count_syscalls
+            )
+        )
+
+    _report_results(
+        rows=rows,
+        parameters={
+            "component": component,
+            "number_of_objects": number_of_objects,
+            "object_size_in_bytes": object_size_in_bytes,
+            "count_syscalls": count_syscalls,
+            "seed": seed,
+        },
+        log_directory=log_directory,
+        output_file_path=output_file_path,
+    )
+
+    return rows
+
+
+def _prepare_listing_benchmark(
+    directory: pathlib.Path, number_of_objects: int, object_size_in_bytes: int, seed: int
+) -> list[tuple[str, str, dict]]:
+    """
+    Write an `s5cmd ls --etag` listing of synthetic blobs, sorted by blob ID as `s5cmd` lists them.
+
+    Blob IDs are generated one `abc` prefix at a time so that the listing can be far larger than memory allows.
+    One blob in eight has a multipart ETag.
+
+    Returns
+    -------
+    list of tuple of str, str, and dict
+        The name, code (run with the input directory as its first argument), and number of objects and bytes of
+        each operation.
+    """
+    random_generator = random.Random(seed)
+    file_path = directory / "s5cmd_ls_blobs.txt"
+    with file_path.open(mode="w") as file_stream:
+        for head in range(4_096):
+            count = number_of_objects // 4_096 + (head < number_of_objects % 4_096)
+            blob_ids = sorted(
+                f"{head:03x}{str(uuid.UUID(int=random_generator.getrandbits(128), version=4))[3:]}"
+                for _ in range(count)
+            )
+            for blob_id in blob_ids:
+                size = random_generator.randint(1, 2 * object_size_in_bytes)
+                etag = f"{random_generator.getrandbits(128):032x}"
+                if random_generator.random() < 0.125:
+                    etag += f"-{random_generator.randint(2, 100)}"
+                timestamp = datetime.datetime.fromtimestamp(
+                    1_600_000_000 + random_generator.randrange(100_000_000), tz=datetime.timezone.utc
+                )
+                file_stream.write(
+                    f"{timestamp:%Y/%m/%d %H:%M:%S} {etag} {size:>16} {blob_id[:3]}/{blob_id[3:6]}/{blob_id}\n"
+                )
+
+    summary = {"objects": number_of_objects, "bytes": file_path.stat().st_size}
+    preamble = "import pathlib, sys; file_path = pathlib.Path(sys.argv[1]) / 's5cmd_ls_blobs.txt'; "
+    return [
+        (
+            "listing.parse",
+            preamble + "from simple_s3_backup._base._inventory import _read_s5cmd_ls_blobs; "
+            "inventory = _read_s5cmd_ls_blobs(file_path=file_path); print(f'{len(inventory)} blobs parsed.')",
+            summary,
+        ),
+        (
+            "listing.summarize",
+            preamble + "from simple_s3_backup._base._inventory import _summarize_s5cmd_ls_blobs; "
+            "print(_summarize_s5cmd_ls_blobs(file_path=file_path))",
+            summary,
+        ),
+    ]
+
+
+def _prepare_hashing_benchmark(
+    directory: pathlib.Path, number_of_objects: int, object_size_in_bytes: int, seed: int
+) -> list[tuple[str, str, dict]]:
+    """Write files of random content to checksum; see `_prepare_listing_benchmark` for the operations returned."""
+    random_generator = random.Random(seed)
+    files_directory = directory / "files"
+    files_directory.mkdir(exist_ok=True)
+    summary = {"objects": number_of_objects, "bytes": 0}
+    for index in range(number_of_objects):
+        data = random_generator.randbytes(random_generator.randint(1, 2 * object_size_in_bytes))
+        (files_directory / f"{index:09d}").write_bytes(data)
+        summary["bytes"] += len(data)
+
+    preamble = (
+        "import pathlib, sys; "
+        "from simple_s3_backup._base._checksums import _calculate_checksums, _calculate_digests; "
+        "file_paths = sorted((pathlib.Path(sys.argv[1]) / 'files').iterdir()); "
+        "key_to_file_path = {file_path.name: file_path for file_path in file_paths}; "
+    )
+    return [
+        (
+            "hashing.serial",
+            preamble + "buffer = bytearray(16_777_216); "
+            "print(sum(1 for file_path in file_paths if _calculate_digests(file_path=file_path, buffer=buffer)))",
+            summary,
+        ),
+        (
+            "hashing.pool",
+            preamble + "print(sum(1 for _ in _calculate_checksums(key_to_file_path=key_to_file_path)))",
+            summary,
+        ),
+        (
+            "hashing.pool_with_etags",
+            preamble + "print(sum(1 for _ in _calculate_checksums(key_to_file_path=key_to_file_path, "
+            "key_to_part_sizes={key: (0,) for key in key_to_file_path})))",
+            summary,
+        ),
+    ]
+
+
+def _prepare_scan_benchmark(
+    directory: pathlib.Path, number_of_objects: int, object_size_in_bytes: int, seed: int
+) -> list[tuple[str, str, dict]]:
+    """Write a tree of synthetic blobs to scan; see `_prepare_listing_benchmark` for the operations returned."""
+    random_generator = random.Random(seed)
+    blobs_directory = directory / "blobs"
+    summary = {"objects": number_of_objects, "bytes": 0}
+    for _ in range(number_of_objects):
+        blob_id = str(uuid.UUID(int=random_generator.getrandbits(128), version=4))
+        file_path = blobs_directory / blob_id[:3] / blob_id[3:6] / blob_id
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        data = random_generator.randbytes(random_generator.randint(1, 2 * object_size_in_bytes))
+        file_path.write_bytes(data)
+        summary["bytes"] += len(data)
+
+    preamble = "import pathlib, sys; blobs_directory = pathlib.Path(sys.argv[1]) / 'blobs'; "
+    return [
+        (
+            "scan.rglob",
+            preamble + "file_paths = [path for path in blobs_directory.rglob('*') if path.is_file()]; "
+            "print(len(file_paths), sum(path.stat().st_size for path in file_paths))",
+            summary,
+        ),
+        (
+            "scan.du",
+            preamble + "import subprocess; "
+            "print(subprocess.run(['du', '-sB1', blobs_directory], capture_output=True, text=True).stdout)",
+            summary,
+        ),
+        (
+            "scan.scandir",
+            preamble + "from simple_s3_backup._base._scan import _scan_tree; print(_scan_tree(path=blobs_directory))",
+            summary,
+        ),
+        (
+            "scan.scandir_by_prefix",
+            preamble + "from simple_s3_backup._base._scan import _scan_tree_by_prefix, _TreeUsage; "
+            "print(sum(_scan_tree_by_prefix(path=blobs_directory).values(), start=_TreeUsage()))",
+            summary,
+        ),
+        (
+            "scan.local_blobs",
+            preamble + "from simple_s3_backup._base._scan import _scan_local_blobs; "
+            "print(len(_scan_local_blobs(blobs_directories=[blobs_directory])))",
+            summary,
+        ),
+    ]
+
+
+def _prepare_pack_benchmark(
+    directory: pathlib.Path, number_of_objects: int, object_size_in_bytes: int, seed: int
+) -> list[tuple[str, str, dict]]:
+    """Stage the chunks of a synthetic Zarr store to ingest; see `_prepare_listing_benchmark` for the operations."""
+    random_generator = random.Random(seed)
+    staging_directory = directory / "staging"
+    summary = {"objects": number_of_objects, "bytes": 0}
+    for chunk_index in range(number_of_objects):
+        file_path = staging_directory / "0" / str(chunk_index // 100) / str(chunk_index % 100)
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        data = random_generator.randbytes(random_generator.randint(1, 2 * object_size_in_bytes))
+        file_path.write_bytes(data)
+        summary["bytes"] += len(data)
+
+    # Each ingest starts from an empty destination, and keeps the staged chunks for the other one
+    preamble = (
+        "import pathlib, shutil, sys; directory = pathlib.Path(sys.argv[1]); "
+        "staging_directory = directory / 'staging'; files_directory = directory / 'files'; "
+        "pack_directory = directory / 'pack'; "
+    )
+    return [
+        (
+            "pack.ingest_files",
+            preamble + "shutil.rmtree(files_directory, ignore_errors=True); "
+            "shutil.copytree(staging_directory, files_directory)",
+            summary,
+        ),
+        (
+            "pack.ingest_pack",
+            preamble + "from simple_s3_backup._base._zarr_pack import _ZarrPack; "
+            "shutil.rmtree(pack_directory, ignore_errors=True); "
+            "print(_ZarrPack(directory=pack_directory).append_files(source_directory=staging_directory, remove=False))",
+            summary,
+        ),
+        (
+            "pack.scan_files",
+            preamble + "from simple_s3_backup._base._scan import _scan_tree; print(_scan_tree(path=files_directory))",
+            summary,
+        ),
+        (
+            "pack.scan_pack",
+            preamble + "from simple_s3_backup._base._scan import _scan_tree; "
+            "from simple_s3_backup._base._zarr_pack import _ZarrPack; "
+            "print(_scan_tree(path=pack_directory), len(_ZarrPack(directory=pack_directory)))",
+            summary,
+        ),
+    ]
+
+
+def _summarize_measurement(name: str, commands: int, measurement: dict, summary: dict, count_syscalls: bool) -> dict:
+    duration_in_seconds = max(measurement["duration"], 1e-6)
+    return {
+        "operation": name,
+        "commands": commands,
+        "wall time (s)": round(duration_in_seconds, 3),
+        "objects/s": round(summary["objects"] / duration_in_seconds, 1),
+        "MB/s": round(summary["bytes"] / duration_in_seconds / 1e6, 2),
+        "peak RSS (MiB)": round(measurement["max_rss_in_kilobytes"] / 1024, 1),
+        "syscalls": measurement["syscalls"] if count_syscalls is True else None,
+        "failures": measurement["failures"],
+    }
+
+
+def _report_results(
+    rows: list[dict], parameters: dict, log_directory: pathlib.Path, output_file_path: pathlib.Path | None
+) -> None:
+    print(tabulate([list(row.values()) for row in rows], headers=list(rows[0].keys()), tablefmt="github"))
+    print(f"Logs of each command are in {log_directory}.")
+
+    if output_file_path is None:
+        return
+
+    try:
+        version = importlib.metadata.version("simple-s3-backup")
+    except importlib.metadata.PackageNotFoundError:
+        version = "unknown"
+    results = {
+        "version": version,
+        "generated": datetime.datetime.now(tz=datetime.timezone.utc).isoformat(timespec="seconds"),
+        "parameters": parameters,
+        "results": rows,
+    }
+    with output_file_path.open(mode="w") as file_stream:
+        json.dump(obj=results, fp=file_stream, indent=1)
+
+
+def _generate_synthetic_dandi_archive(
+    directory: pathlib.Path,
+    number_of_blobs: int,
+    number_of_zarrs: int,
+    number_of_chunks_per_zarr: int,
+    number_of_nonblob_files: int,
+    object_size_in_bytes: int,
+    seed: int,
+) -> tuple[dict[str, dict], dict[str, str]]:
+    """
+    Write a DANDI-shaped bucket to a local directory.
+
+    Blobs are laid out as `blobs/<abc>/<def>/<ID>`, each Zarr store as `zarr/<ID>/.zarray` plus a two-level tree
+    of chunks, and the Dandiset files as `dandisets/<number>/draft/...`.
+
+    Returns
+    -------
+    dict of str to dict
+        For each kind ("blobs", "zarr", "nonblobs"), the number of objects and bytes written, and the blob and Zarr
+        IDs generated.
+    dict of str to str
+        The SHA-256 checksum of each blob, as expected in `remote_checksums.json`.
+    """
+    random_generator = random.Random(seed)
+    kind_to_summary = {kind: {"objects": 0, "bytes": 0, "ids": list()} for kind in ("blobs", "zarr", "nonblobs")}
+
+    def write_object(kind: str, key: str) -> bytes:
+        data = random_generator.randbytes(random_generator.randint(1, 2 * object_size_in_bytes))
+        file_path = directory / key
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.write_bytes(data)
+        kind_to_summary[kind]["objects"] += 1
+        kind_to_summary[kind]["bytes"] += len(data)
+        return data
+
+    blob_id_to_checksum = dict()
+    for _ in range(number_of_blobs):
+        blob_id = str(uuid.UUID(int=random_generator.getrandbits(128), version=4))
+        data = write_object(kind="blobs", key=f"blobs/{blob_id[:3]}/{blob_id[3:6]}/{blob_id}")
+        blob_id_to_checksum[blob_id] = hashlib.sha256(data).hexdigest()
+        kind_to_summary["blobs"]["ids"].append(blob_id)
+
+    for _ in range(number_of_zarrs):
+        zarr_id = str(uuid.UUID(int=random_generator.getrandbits(128), version=4))
+        write_object(kind="zarr", key=f"zarr/{zarr_id}/.zarray")
+        for chunk_index in range(number_of_chunks_per_zarr):
+            write_object(kind="zarr", key=f"zarr/{zarr_id}/0/{chunk_index // 100}/{chunk_index % 100}")
+        kind_to_summary["zarr"]["ids"].append(zarr_id)
+
+    for file_index in range(number_of_nonblob_files):
+        dandiset_id = f"{file_index // 4 + 1:06d}"
+        file_name = ("dandiset.yaml", "assets.yaml", "assets.jsonld", "dandiset.jsonld")[file_index % 4]
+        write_object(kind="nonblobs", key=f"dandisets/{dandiset_id}/draft/{file_name}")
+
+    return kind_to_summary, blob_id_to_checksum
+
+
+def _run_measured(
+    command: list[str],
+    environment_variables: dict[str, str],
+    log_file_path: pathlib.Path,
+    count_syscalls: bool,
+) -> tuple[float, int, int | None, int]:
+    """
+    Run a command in its own process.
+
+    Returns
+    -------
+    tuple of float, int, int or None, and int
+        The wall time in seconds, the peak RSS in kilobytes of the process and any subprocess it waited on, the
+        number of system calls (if counted), and the return code.
+    """
+    strace_file_path = log_file_path.with_suffix(".strace")
+    if count_syscalls is True:
+        command = ["strace", "-f", "-c", "-o", str(strace_file_path), *command]
+
+    with log_file_path.open(mode="w") as log_stream:
+        start_time = time.perf_counter()
+        process = subprocess.Popen(command, env=environment_variables, stdout=log_stream, stderr=subprocess.STDOUT)
+        _, status, resource_usage = os.wait4(process.pid, 0)
+        duration_in_seconds = time.perf_counter() - start_time
+    process.returncode = os.waitstatus_to_exitcode(status)
+
+    syscalls = None
+    if count_syscalls is True:
+        # The last line of the `strace -c` summary is `<%> <seconds> <usecs/call> <calls> [<errors>] total`
+        with strace_file_path.open(mode="r") as file_stream:
+            total_line = [line for line in file_stream if line.rstrip().endswith("total")][-1]
+        syscalls = int(total_line.split()[3])
+
+    return duration_in_seconds, resource_usage.ru_maxrss, syscalls, process.returncode
@@ -0,0 +1,100 @@
+import contextlib
+import json
+import os
+import signal
+import time
+from collections.abc import Iterator
+
+from ._globals import BACKUP_DIRECTORY
+from ._utils import _get_today
+
+_CHECKPOINTS_DIRECTORY = BACKUP_DIRECTORY / "checkpoints"
+
+
+class _TaskCheckpoint:
+    """
+    Record of the sub-prefixes a backup task has finished during the current backup cycle.
+
+    The record is rewritten atomically (to a temporary file that is synced and then renamed over the previous one)
+    each time a sub-prefix completes, so that a task preempted at any point resumes from its last finished
+    sub-prefix rather than from the first. A checkpoint written during another cycle is discarded on open, so every
+    cycle still visits each sub-prefix once.
+
+    The cycle is identified explicitly rather than by the age of the checkpoint: by `S3BACKUP_CYCLE` when the wrapper
+    submitting the jobs sets it (see the crontab in the README; SLURM keeps the environment of a job when requeuing
+    it after preemption), or by the date otherwise.
+
+    Parameters
+    ----------
+    name : str
+        The name of the task, for example `blobs_a`; the checkpoint is stored as `<name>.json`.
+    cycle : str, optional
+        The identifier of the current backup cycle. Defaults to `S3BACKUP_CYCLE`, or to today's date if unset.
+    """
+
+    def __init__(self, name: str, cycle: str | None = None) -> None:
+        self.file_path = _CHECKPOINTS_DIRECTORY / f"{name}.json"
+        self.cycle = cycle if cycle is not None else os.environ.get("S3BACKUP_CYCLE", None) or _get_today()
+
+        self.started = time.time()
+        self.completed: dict[str, int] = dict()
+        if self.file_path.exists():
+            with self.file_path.open(mode="r") as file_stream:
+                checkpoint = json.load(fp=file_stream)
+            if checkpoint.get("cycle", None) == self.cycle:
+                self.started = checkpoint["started"]
+                self.completed = checkpoint["completed"]
+
+    def __contains__(self, unit: str) -> bool:
+        """Whether the unit, or a coarser unit whose prefix it shares, has completed."""
+        return any(unit.startswith(completed_unit) for completed_unit in self.completed)
+
+    @property
+    def bytes_moved(self) -> int:
+        return sum(self.completed.values())
+
+    def mark_completed(self, unit: str, bytes_moved: int = 0) -> None:
+        self.completed[unit] = bytes_moved
+        self.flush()
+
+    def flush(self) -> None:
+        self.file_path.parent.mkdir(parents=True, exist_ok=True)
+        temporary_file_path = self.file_path.with_suffix(".tmp")
+        with temporary_file_path.open(mode="w") as file_stream:
+            json.dump(
+                obj={
+                    "cycle": self.cycle,
+                    "started": self.started,
+                    "bytes_moved": self.bytes_moved,
+                    "completed": self.completed,
+                },
+                fp=file_stream,
+            )
+            file_stream.flush()
+            os.fsync(file_stream.fileno())
+        temporary_file_path.replace(self.file_path)
+
+
+@contextlib.contextmanager
+def _flush_on_sigterm(checkpoint: _TaskCheckpoint) -> Iterator[None]:
+    """
+    Flush the checkpoint and exit cleanly when SLURM preempts the task.
+
+    SLURM sends SIGTERM to every process of the job step (including any running s5cmd) and only follows with SIGKILL
+    after a grace period. Without a handler the interpreter dies immediately; with one, the checkpoint is flushed and
+    the task exits with the conventional status for SIGTERM.
+    """
+
+    def handle_sigterm(signal_number: int, frame) -> None:
+        checkpoint.flush()
+        print(
+            f"Received SIGTERM; saved checkpoint with {len(checkpoint.completed)} completed sub-prefixes "
+            f"to {checkpoint.file_path}."
+        )
+        raise SystemExit(128 + signal_number)
+
+    previous_handler = signal.signal(signal.SIGTERM, handle_sigterm)
+    try:
+        yield
+    finally:
+        signal.signal(signal.SIGTERM, previous_handler)
@@ -0,0 +1,337 @@
+import mmap
+import os
+import pathlib
+import struct
+import zlib
+from collections.abc import Iterator
+
+from ._checksums import _load_local_checksums
+from ._inventory import _BLOB_ID_WIDTH
+
+_SNAPSHOT_MAGIC = b"S3BCKS01"
+_SNAPSHOT_HEADER = struct.Struct("<8sQQ")  # magic, capacity, count
+_CRC = struct.Struct("<I")
+_ETAG_VALUE = struct.Struct("<16sI")  # MD5 digest, number of parts (0 for a single-part upload)
+
+
+class _ChecksumStore:
+    """
+    Persistent mapping of blob ID to a fixed-size digest that is safe against preemption mid-write.
+
+    New entries are appended to `<name>.log` as fixed-size records, each followed by a CRC32 of its contents, and
+    flushed immediately. On open, the log is replayed up to the last intact record and any torn tail is truncated.
+    Once the log grows past `compaction_threshold` records, it is folded into `<name>.snapshot`: an open-addressing
+    hash table that is memory-mapped rather than loaded, so that opening the store and looking up an entry are O(1)
+    regardless of how many blobs it holds.
+
+    Entries are removed with `delete`, which appends a tombstone record (the entry with every byte of its value set),
+    so that a blob whose local copy is replaced is hashed again rather than compared with the digest of the copy it
+    replaced. Tombstones hide the entries of the snapshot and of the fallback store, and are dropped on compaction.
+
+    Parameters
+    ----------
+    directory : pathlib.Path
+        The directory holding the log and snapshot files.
+    name : str
+        The stem of the log and snapshot file names.
+    value_size : int, default: 32
+        The size in bytes of each stored digest; the default fits a raw SHA-256.
+    compaction_threshold : int, default: 1,000,000
+        The number of log records above which the log is compacted into the snapshot on close.
+    read_only : bool, default: False
+        Whether to only look up entries, leaving the files untouched, so that other processes may write to the store.
+    fallback : _ChecksumStore, optional
+        Another store to look up entries in when they are not found in this one.
+    """
+
+    def __init__(
+        self,
+        directory: pathlib.Path,
+        name: str,
+        value_size: int = 32,
+        compaction_threshold: int = 1_000_000,
+        read_only: bool = False,
+        fallback: "_ChecksumStore | None" = None,
+    ) -> None:
+        self.value_size = value_size
+        self.compaction_threshold = compaction_threshold
+        self.read_only = read_only
+        self.fallback = fallback
+        self.log_file_path = directory / f"{name}.log"
+        self.snapshot_file_path = directory / f"{name}.snapshot"
+
+        self._record = struct.Struct(f"<{_BLOB_ID_WIDTH}s{value_size}s")
+        self._slot_size = _BLOB_ID_WIDTH + value_size
+        self._empty_key = bytes(_BLOB_ID_WIDTH)
+        self._tombstone = b"\xff" * value_size
+
+        self._snapshot: mmap.mmap | None = None
+        self._snapshot_capacity = 0
+        self._snapshot_count = 0
+        self._open_snapshot()
+
+        self._log_entries: dict[bytes, bytes] = dict()
+        self._replay_log()
+        self._log_stream = None if read_only is True else self.log_file_path.open(mode="ab")
+
+    def __enter__(self) -> "_ChecksumStore":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __contains__(self, blob_id: str) -> bool:
+        return self.get(blob_id=blob_id) is not None
+
+    def get(self, blob_id: str) -> bytes | None:
+        key = blob_id.encode("ascii")
+        value = self._log_entries.get(key, None)
+        if value == self._tombstone:
+            return None
+        if value is not None:
+            return value
+
+        value = self._find_in_snapshot(key=key)
+        if value is None and self.fallback is not None:
+            return self.fallback.get(blob_id=blob_id)
+        return value
+
+    def items(self) -> Iterator[tuple[str, bytes | None]]:
+        """
+        Iterate over the entries of this store (not its fallback); the same blob ID may appear more than once.
+
+        The entries of the snapshot come before those of the log, whose latest value (None for an entry deleted since)
+        supersedes them, so that replaying them into another store with `put`, or with `delete` for None, reproduces
+        this one.
+        """
+        for key, value in self._iter_snapshot_entries():
+            yield key.decode("ascii"), value
+        for key, value in self._log_entries.items():
+            yield key.decode("ascii"), value if value != self._tombstone else None
+
+    def put(self, blob_id: str, value: bytes) -> None:
+        if self.read_only is True:
+            message = f"The checksum store at {self.log_file_path} was opened as read-only."
+            raise ValueError(message)
+
+        key = blob_id.encode("ascii")
+        if len(key) != _BLOB_ID_WIDTH or len(value) != self.value_size:
+            message = f"Blob ID {blob_id!r} or its value of length {len(value)} does not fit the store's record size."
+            raise ValueError(message)
+        if value == self._tombstone:
+            message = f"A value with every byte set is reserved for deleted entries of {self.log_file_path}."
+            raise ValueError(message)
+
+        self._append(key=key, value=value)
+
+    def delete(self, blob_id: str) -> None:
+        """Remove the entry of a blob, if any, by appending a tombstone record."""
+        if self.read_only is True:
+            message = f"The checksum store at {self.log_file_path} was opened as read-only."
+            raise ValueError(message)
+
+        self._append(key=blob_id.encode("ascii"), value=self._tombstone)
+
+    def _append(self, key: bytes, value: bytes) -> None:
+        record = self._record.pack(key, value)
+        self._log_stream.write(record + _CRC.pack(zlib.crc32(record)))
+        self._log_stream.flush()
+        self._log_entries[key] = value
+
+    def close(self) -> None:
+        if self.read_only is False:
+            self._log_stream.close()
+            if len(self._log_entries) > self.compaction_threshold:
+                self.compact()
+        if self._snapshot is not None:
+            self._snapshot.close()
+            self._snapshot = None
+        if self.fallback is not None:
+            self.fallback.close()
+
+    def compact(self) -> None:
+        """
+        Fold the log into a new snapshot and empty the log.
+
+        The new snapshot is fully written and synced to a temporary file before it replaces the old one, and the log
+        is only emptied afterwards. A crash at any point therefore leaves either the old snapshot with the full log,
+        or the new snapshot with a log whose entries it already contains.
+        """
+        if self.read_only is True:
+            message = f"The checksum store at {self.log_file_path} was opened as read-only."
+            raise ValueError(message)
+
+        count = self._snapshot_count + len(self._log_entries)
+        capacity = 1024
+        while capacity < 2 * count:
+            capacity *= 2
+
+        temporary_snapshot_file_path = self.snapshot_file_path.with_suffix(".tmp")
+        with temporary_snapshot_file_path.open(mode="w+b") as file_stream:
+            file_stream.truncate(_SNAPSHOT_HEADER.size + capacity * self._slot_size)
+            with mmap.mmap(file_stream.fileno(), 0) as new_snapshot:
+                new_count = 0
+                for key, value in self._iter_snapshot_entries():
+                    if self._log_entries.get(key, None) == self._tombstone:
+                        continue
+                    new_count += _insert(
+                        table=new_snapshot, capacity=capacity, slot_size=self._slot_size, key=key, value=value
+                    )
+                for key, value in self._log_entries.items():
+                    if value == self._tombstone:
+                        continue
+                    new_count += _insert(
+                        table=new_snapshot, capacity=capacity, slot_size=self._slot_size, key=key, value=value
+                    )
+                new_snapshot[: _SNAPSHOT_HEADER.size] = _SNAPSHOT_HEADER.pack(_SNAPSHOT_MAGIC, capacity, new_count)
+                new_snapshot.flush()
+            os.fsync(file_stream.fileno())
+
+        if self._snapshot is not None:
+            self._snapshot.close()
+        temporary_snapshot_file_path.replace(self.snapshot_file_path)
+        self._open_snapshot()
+
+        reopen_log = not self._log_stream.closed
+        self._log_stream.close()
+        with self.log_file_path.open(mode="wb") as file_stream:
+            os.fsync(file_stream.fileno())
+        self._log_entries = dict()
+        if reopen_log is True:
+            self._log_stream = self.log_file_path.open(mode="ab")
+
+    def _open_snapshot(self) -> None:
+        if not self.snapshot_file_path.exists():
+            return
+
+        with self.snapshot_file_path.open(mode="rb") as file_stream:
+            self._snapshot = mmap.mmap(file_stream.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._snapshot_capacity, self._snapshot_count = _SNAPSHOT_HEADER.unpack_from(self._snapshot)
+        if magic != _SNAPSHOT_MAGIC:
+            message = f"The file at {self.snapshot_file_path} is not a checksum snapshot."
+            raise ValueError(message)
+
+    def _replay_log(self) -> None:
+        if not self.log_file_path.exists():
+            return
+
+        record_size = self._record.size + _CRC.size
+        intact_size = 0
+        with self.log_file_path.open(mode="rb") as file_stream:
+            while len(chunk := file_stream.read(record_size)) == record_size:
+                record = chunk[: self._record.size]
+                (crc,) = _CRC.unpack_from(chunk, self._record.size)
+                if zlib.crc32(record) != crc:
+                    break
+
+                key, value = self._record.unpack(record)
+                self._log_entries[key] = value
+                intact_size += record_size
+
+        # Drop any record torn by an interrupted write so that new records stay aligned
+        if self.read_only is False and intact_size != self.log_file_path.stat().st_size:
+            os.truncate(self.log_file_path, intact_size)
+
+    def _find_in_snapshot(self, key: bytes) -> bytes | None:
+        if self._snapshot is None:
+            return None
+
+        slot = _hash(key=key) & (self._snapshot_capacity - 1)
+        while True:
+            offset = _SNAPSHOT_HEADER.size + slot * self._slot_size
+            slot_key = self._snapshot[offset : offset + _BLOB_ID_WIDTH]
+            if slot_key == key:
+                return self._snapshot[offset + _BLOB_ID_WIDTH : offset + self._slot_size]
+            if slot_key == self._empty_key:
+                return None
+            slot = (slot + 1) & (self._snapshot_capacity - 1)
+
+    def _iter_snapshot_entries(self) -> Iterator[tuple[bytes, bytes]]:
+        if self._snapshot is None:
+            return
+
+        for slot in range(self._snapshot_capacity):
+            offset = _SNAPSHOT_HEADER.size + slot * self._slot_size
+            key = self._snapshot[offset : offset + _BLOB_ID_WIDTH]
+            if key != self._empty_key:
+                yield key, self._snapshot[offset + _BLOB_ID_WIDTH : offset + self._slot_size]
+
+
+def _hash(key: bytes) -> int:
+    return zlib.crc32(key)
+
+
+def _insert(table: mmap.mmap, capacity: int, slot_size: int, key: bytes, value: bytes) -> int:
+    """Insert or overwrite an entry in an open-addressing table; return 1 if the key is new, otherwise 0."""
+    slot = _hash(key=key) & (capacity - 1)
+    while True:
+        offset = _SNAPSHOT_HEADER.size + slot * slot_size
+        slot_key = table[offset : offset + _BLOB_ID_WIDTH]
+        if slot_key == key:
+            table[offset + _BLOB_ID_WIDTH : offset + slot_size] = value
+            return 0
+        if slot_key == bytes(_BLOB_ID_WIDTH):
+            table[offset : offset + slot_size] = key + value
+            return 1
+        slot = (slot + 1) & (capacity - 1)
+
+
+def _open_local_checksum_store(
+    manifests_directory: pathlib.Path,
+    shard_directory: pathlib.Path | None = None,
+    name: str = "local_checksums",
+    value_size: int = 32,
+) -> _ChecksumStore:
+    """
+    Open a store of digests of the local blobs, migrating any legacy `local_checksums.json` file into it.
+
+    Parameters
+    ----------
+    manifests_directory : pathlib.Path
+        The directory holding the manifests.
+    shard_directory : pathlib.Path, optional
+        When evaluating a single shard, new checksums are written to a store of its own in this directory, falling
+        back to the shared store (opened read-only) for lookups, so that concurrent shards never write to the same
+        files. Shard stores are folded into the shared one by `merge_manifest_shards`.
+    name : str, default: "local_checksums"
+        The name of the store: `local_checksums` for SHA-256 checksums, or `local_etags` for S3 ETags (see
+        `_encode_etag`).
+    value_size : int, default: 32
+        The size in bytes of each digest in the store.
+
+    Returns
+    -------
+    _ChecksumStore
+        The store of raw digests keyed by blob ID.
+    """
+    if shard_directory is not None:
+        shared_local_checksum_store = _ChecksumStore(
+            directory=manifests_directory, name=name, value_size=value_size, read_only=True
+        )
+        return _ChecksumStore(
+            directory=shard_directory, name=name, value_size=value_size, fallback=shared_local_checksum_store
+        )
+
+    local_checksum_store = _ChecksumStore(directory=manifests_directory, name=name, value_size=value_size)
+
+    legacy_local_checksums_file_path = manifests_directory / "local_checksums.json"
+    if name == "local_checksums" and legacy_local_checksums_file_path.exists():
+        legacy_blob_id_to_checksum = _load_local_checksums(file_path=legacy_local_checksums_file_path)
+        for blob_id, checksum in legacy_blob_id_to_checksum.items():
+            local_checksum_store.put(blob_id=blob_id, value=bytes.fromhex(checksum))
+        local_checksum_store.compact()
+        legacy_local_checksums_file_path.rename(legacy_local_checksums_file_path.with_suffix(".json.migrated"))
+
+    return local_checksum_store
+
+
+def _encode_etag(etag: str) -> bytes:
+    """Pack an ETag (`<md5>` or `<md5>-<parts>`) into the fixed-size value of a `local_etags` store."""
+    digest, _, number_of_parts = etag.partition("-")
+    return _ETAG_VALUE.pack(bytes.fromhex(digest), int(number_of_parts or 0))
+
+
+def _decode_etag(value: bytes) -> str:
+    """Unpack a value of a `local_etags` store back into the ETag S3 would report."""
+    digest, number_of_parts = _ETAG_VALUE.unpack(value)
+    return f"{digest.hex()}-{number_of_parts}" if number_of_parts > 0 else digest.hex()
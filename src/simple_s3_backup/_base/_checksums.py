@@ -0,0 +1,235 @@
+import concurrent.futures
+import hashlib
+import json
+import math
+import os
+import pathlib
+import time
+from collections.abc import Iterator
+
+_CHUNK_SIZE_IN_BYTES = 16_777_216  # 16 MiB
+_MEBIBYTE = 1_048_576
+_DANDI_PART_SIZE_IN_BYTES = 64 * _MEBIBYTE
+_MAX_NUMBER_OF_PARTS = 10_000
+_COMMON_PART_SIZES_IN_BYTES = tuple(size * _MEBIBYTE for size in (8, 16, 5, 32, 100, 128, 256, 512))
+_MAX_PART_SIZE_CANDIDATES = 4
+
+# Read buffer owned by each worker process; allocated once by `_initialize_worker`
+_worker_buffer: bytearray | None = None
+
+
+class _ETagHasher:
+    """
+    Incremental calculation of the ETag S3 assigns to an object, given the part size it was uploaded with.
+
+    A part size of 0 stands for a single-part upload, whose ETag is the MD5 of the whole object. Otherwise the ETag
+    is that of a multipart upload: the MD5 of the concatenated MD5 digests of each part, followed by `-<parts>`.
+    """
+
+    def __init__(self, part_size_in_bytes: int) -> None:
+        self.part_size_in_bytes = part_size_in_bytes
+        self._part_hasher = hashlib.md5()
+        self._part_digests: list[bytes] = list()
+        self._bytes_in_part = 0
+
+    def update(self, data: memoryview) -> None:
+        if self.part_size_in_bytes == 0:
+            self._part_hasher.update(data)
+            return
+
+        offset = 0
+        while offset < len(data):
+            length = min(len(data) - offset, self.part_size_in_bytes - self._bytes_in_part)
+            self._part_hasher.update(data[offset : offset + length])
+            self._bytes_in_part += length
+            offset += length
+            if self._bytes_in_part == self.part_size_in_bytes:
+                self._part_digests.append(self._part_hasher.digest())
+                self._part_hasher = hashlib.md5()
+                self._bytes_in_part = 0
+
+    def hexdigest(self) -> str:
+        if self.part_size_in_bytes == 0:
+            return self._part_hasher.hexdigest()
+
+        part_digests = self._part_digests
+        if self._bytes_in_part > 0 or len(part_digests) == 0:
+            part_digests = [*part_digests, self._part_hasher.digest()]
+        return f"{hashlib.md5(b''.join(part_digests)).hexdigest()}-{len(part_digests)}"
+
+
+def _infer_part_sizes(size_in_bytes: int, etag: str) -> tuple[int, ...]:
+    """
+    The part sizes an object of this size may have been uploaded with to end up with this ETag, most likely first.
+
+    Single-part ETags only allow 0 (see `_ETagHasher`). For multipart ETags, the candidates are the part size chosen
+    by the DANDI clients (64 MiB, grown to stay within 10,000 parts), the defaults of common S3 clients, and the even
+    split of the object into its number of parts; only those that yield the same number of parts are kept.
+    """
+    if "-" not in etag:
+        return (0,)
+
+    number_of_parts = int(etag.rsplit("-", maxsplit=1)[1])
+    even_part_size_in_bytes = math.ceil(size_in_bytes / number_of_parts)
+    candidates = (
+        max(_DANDI_PART_SIZE_IN_BYTES, math.ceil(size_in_bytes / _MAX_NUMBER_OF_PARTS)),
+        *_COMMON_PART_SIZES_IN_BYTES,
+        math.ceil(even_part_size_in_bytes / _MEBIBYTE) * _MEBIBYTE,
+        even_part_size_in_bytes,
+    )
+
+    part_sizes = []
+    for part_size_in_bytes in candidates:
+        if part_size_in_bytes <= 0 or part_size_in_bytes in part_sizes:
+            continue
+        if max(math.ceil(size_in_bytes / part_size_in_bytes), 1) == number_of_parts:
+            part_sizes.append(part_size_in_bytes)
+
+    return tuple(part_sizes[:_MAX_PART_SIZE_CANDIDATES])
+
+
+def _calculate_digests(
+    file_path: pathlib.Path, part_sizes_in_bytes: tuple[int, ...] = (), buffer: bytearray | None = None
+) -> tuple[str, dict[int, str]]:
+    """
+    Calculate the SHA-256 checksum of a file, along with its S3 ETag for each of the given part sizes.
+
+    All digests are updated from the same reads, so the file is only read once. It is processed in chunks read
+    directly into a reusable buffer to avoid memory issues with large files and allocation churn across many files.
+
+    Parameters
+    ----------
+    file_path : pathlib.Path
+        The path to the file.
+    part_sizes_in_bytes : tuple of int, default: ()
+        The part sizes to calculate ETags for; 0 stands for a single-part upload (see `_ETagHasher`).
+    buffer : bytearray, optional
+        A preallocated buffer to read into. If not specified, one of 16 MiB is allocated for this call.
+
+    Returns
+    -------
+    str
+        The SHA-256 checksum of the file.
+    dict of int to str
+        The ETag of the file for each part size.
+    """
+    buffer = buffer if buffer is not None else bytearray(_CHUNK_SIZE_IN_BYTES)
+    view = memoryview(buffer)
+
+    hasher = hashlib.sha256()
+    etag_hashers = [_ETagHasher(part_size_in_bytes=part_size_in_bytes) for part_size_in_bytes in part_sizes_in_bytes]
+    with file_path.open(mode="rb", buffering=0) as file_stream:
+        while number_of_bytes_read := file_stream.readinto(view):
+            hasher.update(view[:number_of_bytes_read])
+            for etag_hasher in etag_hashers:
+                etag_hasher.update(view[:number_of_bytes_read])
+
+    part_size_to_etag = {etag_hasher.part_size_in_bytes: etag_hasher.hexdigest() for etag_hasher in etag_hashers}
+    return hasher.hexdigest(), part_size_to_etag
+
+
+def _calculate_checksums(
+    key_to_file_path: dict[str, pathlib.Path],
+    max_workers: int | None = None,
+    deadline: float | None = None,
+    key_to_part_sizes: dict[str, tuple[int, ...]] | None = None,
+) -> Iterator[tuple[str, str, dict[int, str]]]:
+    """
+    Calculate the SHA-256 checksums (and, optionally, S3 ETags) of many files across a bounded pool of processes.
+
+    Results are yielded as soon as each file finishes so that callers can persist them immediately; an interrupted
+    run then only loses the files that were in flight.
+
+    Parameters
+    ----------
+    key_to_file_path : dict of str to pathlib.Path
+        The files to checksum, keyed by an identifier (such as the blob ID) that is yielded alongside each result.
+    max_workers : int, optional
+        The number of worker processes. Defaults to the number of CPUs available to this process.
+    deadline : float, optional
+        A `time.time()` value after which no new files are submitted. Files already in flight are still finished.
+    key_to_part_sizes : dict of str to tuple of int, optional
+        The part sizes to calculate ETags for, per key, in the same pass as the checksum (see `_calculate_digests`).
+
+    Yields
+    ------
+    tuple of str, str, and dict of int to str
+        The key, the SHA-256 checksum of the corresponding file, and its ETag for each part size requested.
+    """
+    key_to_part_sizes = key_to_part_sizes or dict()
+    if len(key_to_file_path) == 0:
+        return
+
+    max_workers = max_workers or len(os.sched_getaffinity(0))
+    max_in_flight = 2 * max_workers
+
+    key_and_file_paths = iter(key_to_file_path.items())
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, initializer=_initialize_worker) as executor:
+        future_to_key: dict[concurrent.futures.Future, str] = dict()
+        while True:
+            while len(future_to_key) < max_in_flight and (deadline is None or time.time() < deadline):
+                key_and_file_path = next(key_and_file_paths, None)
+                if key_and_file_path is None:
+                    break
+                key, file_path = key_and_file_path
+                part_sizes_in_bytes = key_to_part_sizes.get(key, ())
+                future_to_key[executor.submit(_calculate_digests_in_worker, file_path, part_sizes_in_bytes)] = key
+
+            if len(future_to_key) == 0:
+                break
+
+            done, _ = concurrent.futures.wait(future_to_key, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                key = future_to_key.pop(future)
+                try:
+                    checksum, part_size_to_etag = future.result()
+                except OSError as exception:
+                    print(f"PROBLEM: Unable to calculate checksum for {key}: {exception}")
+                    continue
+                yield key, checksum, part_size_to_etag
+
+
+def _initialize_worker() -> None:
+    global _worker_buffer
+    _worker_buffer = bytearray(_CHUNK_SIZE_IN_BYTES)
+
+
+def _calculate_digests_in_worker(
+    file_path: pathlib.Path, part_sizes_in_bytes: tuple[int, ...]
+) -> tuple[str, dict[int, str]]:
+    return _calculate_digests(file_path=file_path, part_sizes_in_bytes=part_sizes_in_bytes, buffer=_worker_buffer)
+
+
+def _load_local_checksums(file_path: pathlib.Path) -> dict[str, str]:
+    """
+    Load the local checksums recorded in a legacy `local_checksums.json` file.
+
+    That file starts with a JSON object followed by one `<blob ID>: <checksum>` line per checksum appended as it was
+    calculated. A trailing line that was only partially written (for instance, due to preemption) is ignored.
+
+    Parameters
+    ----------
+    file_path : pathlib.Path
+        The path to the legacy local checksums file.
+
+    Returns
+    -------
+    dict of str to str
+        The mapping of blob ID to SHA-256 checksum.
+    """
+    local_blob_id_to_checksum: dict[str, str] = dict()
+    with file_path.open(mode="r") as file_stream:
+        for line in file_stream:
+            line = line.strip()
+            if line.startswith("{"):
+                try:
+                    local_blob_id_to_checksum.update(json.loads(line))
+                except json.JSONDecodeError:
+                    pass
+                continue
+
+            blob_id, _, checksum = line.partition(": ")
+            if len(checksum) == 64:
+                local_blob_id_to_checksum[blob_id] = checksum
+
+    return local_blob_id_to_checksum
@@ -0,0 +1,382 @@
+import collections
+import contextlib
+import dataclasses
+import fcntl
+import json
+import math
+import os
+import pathlib
+import time
+from collections.abc import Iterator
+
+from ._globals import BACKUP_DIRECTORY, MAX_BANDWIDTH_IN_BYTES_PER_SECOND, MAX_WORKERS
+from ._metrics import _get_task_name, _record_metric
+from ._s5cmd import _run_s5cmd_batch
+
+_MEBIBYTE = 1_048_576
+_THROTTLE_DIRECTORY = BACKUP_DIRECTORY / "throttle"
+_PROBE_SIZE_IN_BYTES = _MEBIBYTE
+
+
+@dataclasses.dataclass
+class _AIMDController:
+    """
+    Additive-increase, multiplicative-decrease control of the number of workers and the bandwidth of each.
+
+    After each interval of transfers, the observed throughput, error rates, and local write latency decide the next
+    setting:
+
+    - If S3 throttled (503 SlowDown) or failed more than its share of requests, the number of workers is cut.
+    - Otherwise, if writing to the local filesystem became slow, the bandwidth of each worker is cut, starting from
+      the bandwidth they actually achieved, so that the backup backs off before it hurts other users of the
+      filesystem.
+    - Otherwise, if the workers were held back by their bandwidth, it is raised by a step.
+    - Otherwise, the number of workers is raised by a step, unless the last increase did not raise the throughput
+      (then the workers are held for an interval before probing again).
+
+    Parameters
+    ----------
+    workers : int, default: 32
+        The current number of workers.
+    bandwidth_per_worker_in_bytes_per_second : float, default: 256 MiB/s
+        The current bandwidth allowed to each worker.
+    min_workers, max_workers : int, default: 4 and 256
+        The bounds on the number of workers.
+    min_bandwidth_per_worker_in_bytes_per_second, max_bandwidth_per_worker_in_bytes_per_second : float
+        The bounds on the bandwidth of each worker; default: 1 MiB/s and 256 MiB/s.
+    worker_step : int, default: 4
+        The number of workers added on each increase.
+    bandwidth_step_in_bytes_per_second : float, default: 1 MiB/s
+        The bandwidth added to each worker on each increase.
+    decrease_factor : float, default: 0.7
+        The factor applied on each decrease.
+    max_throttled_rate : float, default: 0.01
+        The fraction of requests throttled by S3 above which the workers are cut.
+    max_error_rate : float, default: 0.05
+        The fraction of requests failed for any reason above which the workers are cut.
+    max_write_latency_in_seconds : float, default: 0.5
+        The local write latency above which the bandwidth is cut.
+    min_throughput_gain : float, default: 0.05
+        The relative gain in throughput an increase in workers must bring for the next one to follow immediately.
+    """
+
+    workers: int = 32
+    bandwidth_per_worker_in_bytes_per_second: float = 256 * _MEBIBYTE
+    min_workers: int = 4
+    max_workers: int = 256
+    min_bandwidth_per_worker_in_bytes_per_second: float = _MEBIBYTE
+    max_bandwidth_per_worker_in_bytes_per_second: float = 256 * _MEBIBYTE
+    worker_step: int = 4
+    bandwidth_step_in_bytes_per_second: float = _MEBIBYTE
+    decrease_factor: float = 0.7
+    max_throttled_rate: float = 0.01
+    max_error_rate: float = 0.05
+    max_write_latency_in_seconds: float = 0.5
+    min_throughput_gain: float = 0.05
+
+    last_decision: str = "start"
+    last_throughput_in_bytes_per_second: float = 0.0
+
+    def update(
+        self,
+        bytes_transferred: int,
+        duration_in_seconds: float,
+        requests: int,
+        throttled: int,
+        errors: int,
+        write_latency_in_seconds: float,
+    ) -> str:
+        """
+        Adjust the workers and bandwidth after an interval of transfers.
+
+        Parameters
+        ----------
+        bytes_transferred : int
+            The bytes transferred during the interval.
+        duration_in_seconds : float
+            The length of the interval.
+        requests : int
+            The number of requests (or operations) made during the interval.
+        throttled : int
+            How many of them S3 throttled.
+        errors : int
+            How many of them failed for any reason, including throttling.
+        write_latency_in_seconds : float
+            The latency of a small synchronous write to the local filesystem at the end of the interval.
+
+        Returns
+        -------
+        str
+            The decision taken: "throttled", "errors", "filesystem", "increase", or "hold".
+        """
+        throughput_in_bytes_per_second = bytes_transferred / max(duration_in_seconds, 1e-6)
+        requests = max(requests, 1)
+
+        if throttled / requests > self.max_throttled_rate or errors / requests > self.max_error_rate:
+            decision = "throttled" if throttled / requests > self.max_throttled_rate else "errors"
+            self.workers = max(self.min_workers, math.floor(self.workers * self.decrease_factor))
+        elif write_latency_in_seconds > self.max_write_latency_in_seconds:
+            decision = "filesystem"
+            achieved_bandwidth_per_worker = throughput_in_bytes_per_second / self.workers
+            self.bandwidth_per_worker_in_bytes_per_second = max(
+                self.min_bandwidth_per_worker_in_bytes_per_second,
+                min(self.bandwidth_per_worker_in_bytes_per_second, achieved_bandwidth_per_worker)
+                * self.decrease_factor,
+            )
+        elif throughput_in_bytes_per_second / self.workers >= 0.9 * self.bandwidth_per_worker_in_bytes_per_second:
+            decision = "increase"
+            self.bandwidth_per_worker_in_bytes_per_second = min(
+                self.max_bandwidth_per_worker_in_bytes_per_second,
+                self.bandwidth_per_worker_in_bytes_per_second + self.bandwidth_step_in_bytes_per_second,
+            )
+        else:
+            has_plateaued = self.last_decision == "increase" and throughput_in_bytes_per_second < (
+                self.last_throughput_in_bytes_per_second * (1 + self.min_throughput_gain)
+            )
+            decision = "hold" if has_plateaued is True else "increase"
+            if decision == "increase":
+                self.workers = min(self.max_workers, self.workers + self.worker_step)
+
+        self.last_decision = decision
+        self.last_throughput_in_bytes_per_second = throughput_in_bytes_per_second
+        return decision
+
+
+class _SharedTokenBucket:
+    """
+    Token bucket held in a file on the shared filesystem, so that global caps apply across all array tasks.
+
+    Bytes are drawn from the bucket, which refills at `rate_in_bytes_per_second` up to `capacity_in_bytes`. Drawing
+    more than is available puts the bucket in debt and returns how long the caller must wait for it to be repaid, so
+    that each draw costs a single locked read and write of the file. The same file apportions a global cap on the
+    number of workers: each task leases the workers it runs, and leases that are not renewed expire.
+
+    Parameters
+    ----------
+    file_path : pathlib.Path
+        The path to the state of the bucket; it is created if needed and locked with `flock` on each access.
+    rate_in_bytes_per_second : float, optional
+        The global bandwidth cap. If not specified, bytes are never waited for.
+    capacity_in_bytes : float, optional
+        The most bytes that may be drawn at once without waiting. Defaults to one second at the full rate.
+    max_workers : int, optional
+        The global cap on the number of workers. If not specified, every lease is granted in full.
+    lease_in_seconds : float, default: 3,600
+        How long a lease of workers lasts without being renewed; leases are renewed before each `s5cmd run`.
+    """
+
+    def __init__(
+        self,
+        file_path: pathlib.Path,
+        rate_in_bytes_per_second: float | None = None,
+        capacity_in_bytes: float | None = None,
+        max_workers: int | None = None,
+        lease_in_seconds: float = 3_600,
+    ) -> None:
+        self.file_path = file_path
+        self.rate_in_bytes_per_second = rate_in_bytes_per_second
+        self.capacity_in_bytes = capacity_in_bytes if capacity_in_bytes is not None else rate_in_bytes_per_second
+        self.max_workers = max_workers
+        self.lease_in_seconds = lease_in_seconds
+
+    def acquire(self, amount_in_bytes: int, now: float | None = None) -> float:
+        """Draw bytes from the bucket, returning the number of seconds to wait before using them."""
+        if self.rate_in_bytes_per_second is None:
+            return 0.0
+
+        now = now if now is not None else time.time()
+        with self._lock() as state:
+            elapsed_in_seconds = max(now - state.get("time", now), 0.0)
+            tokens = min(
+                self.capacity_in_bytes,
+                state.get("tokens", self.capacity_in_bytes) + elapsed_in_seconds * self.rate_in_bytes_per_second,
+            )
+            tokens -= amount_in_bytes
+            state.update(tokens=tokens, time=now)
+
+        return max(-tokens / self.rate_in_bytes_per_second, 0.0)
+
+    def lease_workers(self, task: str, workers: int, now: float | None = None) -> int:
+        """
+        Lease up to `workers` workers for a task (replacing its previous lease), returning how many were granted.
+
+        Each lease is granted what is left under `max_workers` after the live leases of the other tasks, except that
+        every task is granted at least one worker so that none is starved. This floor is the one exception to the
+        cap: a task that starts while the others hold every worker may take the total over `max_workers`, by at most
+        one worker per task. The excess is only transient, since each task renewing its lease is then only granted
+        what is left, so the total is back within the cap once every lease has been renewed (provided there are no
+        more tasks than `max_workers`).
+        """
+        if self.max_workers is None:
+            return workers
+
+        now = now if now is not None else time.time()
+        with self._lock() as state:
+            task_to_lease = {
+                other_task: lease
+                for other_task, lease in state.get("leases", dict()).items()
+                if other_task != task and now - lease[1] < self.lease_in_seconds
+            }
+            # Every task keeps at least one worker, so that none is starved by the others, even over the cap
+            leased_workers = sum(lease[0] for lease in task_to_lease.values())
+            granted_workers = max(1, min(workers, self.max_workers - leased_workers))
+            task_to_lease[task] = [granted_workers, now]
+            state["leases"] = task_to_lease
+
+        return granted_workers
+
+    def release_workers(self, task: str) -> None:
+        if self.max_workers is None:
+            return
+
+        with self._lock() as state:
+            state.get("leases", dict()).pop(task, None)
+
+    @contextlib.contextmanager
+    def _lock(self) -> Iterator[dict]:
+        """Hold an exclusive `flock` on the state file, yielding its contents and writing them back on exit."""
+        self.file_path.parent.mkdir(parents=True, exist_ok=True)
+        with self.file_path.open(mode="a+") as file_stream:
+            fcntl.flock(file_stream, fcntl.LOCK_EX)
+            try:
+                file_stream.seek(0)
+                content = file_stream.read()
+                state = json.loads(content) if content else dict()
+                yield state
+
+                file_stream.seek(0)
+                file_stream.truncate()
+                file_stream.write(json.dumps(state))
+                file_stream.flush()
+            finally:
+                fcntl.flock(file_stream, fcntl.LOCK_UN)
+
+
+def _get_shared_token_bucket() -> _SharedTokenBucket:
+    """The bucket enforcing the caps set by `S3BACKUP_MAX_BANDWIDTH` and `S3BACKUP_MAX_WORKERS`, if any."""
+    return _SharedTokenBucket(
+        file_path=_THROTTLE_DIRECTORY / "transfers.json",
+        rate_in_bytes_per_second=MAX_BANDWIDTH_IN_BYTES_PER_SECOND,
+        max_workers=MAX_WORKERS,
+    )
+
+
+def _measure_write_latency(directory: pathlib.Path) -> float:
+    """The time it takes to write and `fsync` a small file in a directory, as a probe of filesystem saturation."""
+    probe_file_path = directory / f".write_probe_{os.getpid()}"
+    data = os.urandom(_PROBE_SIZE_IN_BYTES)
+
+    start_time = time.perf_counter()
+    file_descriptor = os.open(probe_file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        os.write(file_descriptor, data)
+        os.fsync(file_descriptor)
+    finally:
+        os.close(file_descriptor)
+        probe_file_path.unlink(missing_ok=True)
+
+    return time.perf_counter() - start_time
+
+
+def _run_s5cmd_batch_adaptively(
+    commands: list[str],
+    command_file_path: pathlib.Path,
+    destination: pathlib.Path,
+    controller: _AIMDController | None = None,
+    token_bucket: _SharedTokenBucket | None = None,
+    commands_per_run: int | None = None,
+) -> collections.Counter:
+    """
+    Run many s5cmd operations as a sequence of `s5cmd run` invocations, adapting the workers between them.
+
+    After each run, the controller adjusts the number of workers of the next one from the throughput, the throttling
+    and errors reported by s5cmd, and the write latency of the destination. Since s5cmd cannot limit its own
+    bandwidth, the bandwidth of each worker, and the global bandwidth cap of the token bucket, are enforced on average
+    by pausing between runs.
+
+    Parameters
+    ----------
+    commands : list of str
+        The s5cmd operations to run, without the leading `s5cmd`.
+    command_file_path : pathlib.Path
+        The base path of the command files; each run writes its own, suffixed with its index.
+    destination : pathlib.Path
+        A directory on the filesystem being written to, where the write latency is probed.
+    controller : _AIMDController, optional
+        The controller to use, carrying its state across calls. Defaults to a new one.
+    token_bucket : _SharedTokenBucket, optional
+        The global caps to respect. Defaults to those set by `S3BACKUP_MAX_BANDWIDTH` and `S3BACKUP_MAX_WORKERS`.
+    commands_per_run : int, optional
+        The number of operations in each run. Defaults to four per worker, so that runs with more workers last
+        about as long.
+
+    Returns
+    -------
+    collections.Counter
+        The number of successful operations (`objects`), failed operations (`errors`), failures due to throttling
+        (`throttled`), and bytes transferred, over all runs.
+    """
+    controller = controller if controller is not None else _AIMDController()
+    token_bucket = token_bucket if token_bucket is not None else _get_shared_token_bucket()
+    task = _get_task_name()
+    destination.mkdir(parents=True, exist_ok=True)
+
+    summary = collections.Counter(objects=0, errors=0, throttled=0, bytes=0)
+    start = 0
+    run_index = 0
+    try:
+        while start < len(commands):
+            controller.workers = token_bucket.lease_workers(task=task, workers=controller.workers)
+            workers = controller.workers
+            run_commands = commands[start : start + (commands_per_run or 4 * workers)]
+            start += len(run_commands)
+
+            start_time = time.perf_counter()
+            run_summary = _run_s5cmd_batch(
+                commands=run_commands,
+                command_file_path=command_file_path.with_name(f"{command_file_path.stem}_{run_index}.txt"),
+                number_of_workers=workers,
+                prefix=command_file_path.stem,
+            )
+            duration_in_seconds = time.perf_counter() - start_time
+            summary.update(run_summary)
+            run_index += 1
+
+            # Pause for as long as the run went over its share of bandwidth, or for the global cap to be repaid
+            bandwidth_in_bytes_per_second = workers * controller.bandwidth_per_worker_in_bytes_per_second
+            wait_in_seconds = max(
+                run_summary["bytes"] / bandwidth_in_bytes_per_second - duration_in_seconds,
+                token_bucket.acquire(amount_in_bytes=run_summary["bytes"]),
+            )
+
+            write_latency_in_seconds = _measure_write_latency(directory=destination)
+            decision = controller.update(
+                bytes_transferred=run_summary["bytes"],
+                duration_in_seconds=duration_in_seconds,
+                requests=run_summary["objects"] + run_summary["errors"],
+                throttled=run_summary["throttled"],
+                errors=run_summary["errors"],
+                write_latency_in_seconds=write_latency_in_seconds,
+            )
+            _record_metric(
+                kind="phase",
+                name="transfer_controller",
+                duration_in_seconds=duration_in_seconds,
+                prefix=command_file_path.stem,
+                decision=decision,
+                workers=controller.workers,
+                bandwidth_per_worker=int(controller.bandwidth_per_worker_in_bytes_per_second),
+                write_latency=round(write_latency_in_seconds, 6),
+                wait=round(max(wait_in_seconds, 0.0), 3),
+            )
+            print(
+                f"Controller: {decision} to {controller.workers} workers at "
+                f"{controller.bandwidth_per_worker_in_bytes_per_second / _MEBIBYTE:.1f} MiB/s each "
+                f"(write latency {write_latency_in_seconds * 1_000:.0f} ms)."
+            )
+            if wait_in_seconds > 0 and start < len(commands):
+                time.sleep(wait_in_seconds)
+    finally:
+        token_bucket.release_workers(task=task)
+
+    return summary
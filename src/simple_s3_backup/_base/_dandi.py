@@ -1,53 +1,268 @@
-import pathlib
+import collections
+import concurrent.futures
+import typing
 
-from ._globals import BLOBS_HEAD_TO_PARTITION, ZARR_HEAD_TO_PARTITION
-from ._utils import _deploy_subprocess
+from ._aio_transfer import _sync_prefixes_with_aio
+from ._checkpoint import _flush_on_sigterm, _TaskCheckpoint
+from ._controller import _AIMDController, _run_s5cmd_batch_adaptively
+from ._globals import BACKUP_DIRECTORY, BLOBS_HEAD_TO_PARTITION, DANDI_BUCKET, DANDI_ROOT, ZARR_HEAD_TO_PARTITION
+from ._nonblobs import _get_nonblob_locations, _list_nonblob_prefix, _sync_nonblob_location
+from ._s5cmd import _run_s5cmd_batch, _run_s5cmd_command
+from ._zarr import _get_nested_zarr_directory, _list_zarr_ids, _sync_zarr
 
 
-def backup_dandi_nonblobs() -> None:
-    backup_directory = pathlib.Path("/orcd/data/dandi/001/s3dandiarchive")
+def backup_dandi_nonblobs(max_workers: int = 16, number_of_workers: int = 64) -> None:
+    """
+    Backup all DANDI bucket non-blob locations, copying only the objects that changed since the last run.
 
-    ls_command = "s5cmd ls s3://dandiarchive"
-    ls_output = _deploy_subprocess(command=ls_command, ignore_errors=True)
+    Directory locations are split into their sub-directories, which are listed concurrently on a pool of threads.
+    Each location is then diffed against its manifest and its changes copied, also concurrently; an unchanged
+    location costs only its listing (see `_sync_nonblob_location`).
 
-    skip_keys = ("blobs", "zarr", "dandiarchive")
-    ls_locations = [
-        line.split(" ")[-1] for line in ls_output.splitlines() if not any(skip_key in line for skip_key in skip_keys)
-    ]
+    Parameters
+    ----------
+    max_workers : int, default: 16
+        The number of listings, or of locations being synced, at a time.
+    number_of_workers : int, default: 64
+        The number of s5cmd workers copying the changes of each location.
+    """
+    backup_directory = DANDI_ROOT / "001" / "s3dandiarchive"
+    locations = _get_nonblob_locations()
 
-    for location in ls_locations:
-        source = f"{location}*" if location.endswith("/") else location
-        destination = f"{backup_directory}/{location}"
-        command = f"s5cmd cp --if-size-differ --if-source-newer s3://dandiarchive/{source} {destination}"
-        print(command)
-        _deploy_subprocess(command=command, ignore_errors=True)
+    summary = collections.Counter(listed=0, changed=0, deleted=0, objects=0, errors=0, bytes=0)
+    location_to_entries = {entry[1]: [entry] for entry in locations if entry[0] == "file"}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # Directory locations are first listed one level down, to fan their sub-directories out across the pool
+        location_to_future = {
+            key: executor.submit(_list_nonblob_prefix, prefix=key, recursive=False)
+            for entry_type, key, _, _ in locations
+            if entry_type == "directory"
+        }
+        unit_to_future = dict()
+        for location, future in location_to_future.items():
+            try:
+                entries = future.result()
+            except RuntimeError as exception:
+                print(f"ERROR: Unable to list {location}: {exception}")
+                summary["errors"] += 1
+                continue
 
+            location_to_entries[location] = [entry for entry in entries if entry[0] == "file"]
+            for entry_type, key, _, _ in entries:
+                if entry_type == "directory":
+                    unit_to_future[(location, key)] = executor.submit(_list_nonblob_prefix, prefix=key, recursive=True)
+
+        for (location, unit), future in unit_to_future.items():
+            if location not in location_to_entries:  # A previous sub-directory failed to list
+                continue
+
+            try:
+                location_to_entries[location].extend(future.result())
+            except RuntimeError as exception:
+                print(f"ERROR: Unable to list {unit}: {exception}")
+                summary["errors"] += 1
+                del location_to_entries[location]
+
+        sync_futures = [
+            executor.submit(
+                _sync_nonblob_location,
+                location=location,
+                entries=sorted(entries, key=lambda entry: entry[1].encode("utf-8")),
+                destination=backup_directory,
+                number_of_workers=number_of_workers,
+            )
+            for location, entries in location_to_entries.items()
+        ]
+        for future in concurrent.futures.as_completed(sync_futures):
+            summary.update(future.result())
+
+    print(
+        f"Non-blobs: {summary['listed']} objects listed across {len(locations)} locations, "
+        f"{summary['changed']} new or modified, {summary['objects']} copied, {summary['errors']} errors"
+    )
+
+
+def backup_dandi_blobs(
+    task_id: int,
+    batch: bool = False,
+    from_manifest: bool = False,
+    number_of_workers: int = 256,
+    backend: typing.Literal["s5cmd", "aio"] = "s5cmd",
+    adaptive: bool = False,
+) -> None:
+    """
+    Backup the blobs whose IDs start with the hex digit corresponding to the `task_id`.
+
+    Progress is checkpointed after each group of sub-prefixes (or each sub-prefix, when copied one at a time), and
+    finished ones are skipped when a preempted task restarts within the same daily backup cycle.
+
+    Parameters
+    ----------
+    task_id : int
+        The first hex digit of the blob IDs to backup, as an integer from 0 to 15.
+    batch : bool, default: False
+        Whether to copy the sub-prefixes through one `s5cmd run` per group of 16 instead of one `s5cmd cp` each.
+    from_manifest : bool, default: False
+        Whether to only copy the blobs of this task listed in `blobs_to_update.txt` by `s3backup dandi manifest`.
+        These are copied to their exact destinations through a single `s5cmd run`.
+    number_of_workers : int, default: 256
+        The number of s5cmd workers to use when `batch` or `from_manifest` is True, or the maximum number of
+        concurrent requests when `backend` is "aio".
+    backend : "s5cmd" or "aio", default: "s5cmd"
+        Whether to shell out to s5cmd or to use the native asyncio S3 client (requires `aiobotocore`).
+        The "aio" backend does not support `from_manifest`.
+    adaptive : bool, default: False
+        Whether to copy the blobs listed in the manifest in a sequence of runs, adjusting the number of workers (up
+        to `number_of_workers`) and their bandwidth in between (see `_run_s5cmd_batch_adaptively`).
+        Only used with `from_manifest`.
+    """
+    if backend == "aio" and from_manifest is True:
+        message = "The 'aio' backend does not support `from_manifest`."
+        raise ValueError(message)
 
-def backup_dandi_blobs(task_id: int) -> None:
     partition = BLOBS_HEAD_TO_PARTITION[task_id]
-    blobs_backup_directory = pathlib.Path(f"/orcd/data/dandi/{partition}/s3dandiarchive/blobs")
+    blobs_backup_directory = DANDI_ROOT / partition / "s3dandiarchive" / "blobs"
 
     top_blob_hexcode = f"{task_id:01x}"
-    for sub_blob_hexcode_1 in range(16):
-        for sub_blob_hexcode_2 in range(16):
-            blob_subdirectory = f"{top_blob_hexcode}{sub_blob_hexcode_1:01x}{sub_blob_hexcode_2:01x}"
-            source = f"s3://dandiarchive/blobs/{blob_subdirectory}/*"
-            destination = f"{blobs_backup_directory}/{blob_subdirectory}/"
-            command = f"s5cmd cp --if-size-differ --if-source-newer {source} {destination}"
-            print(command)
-            _deploy_subprocess(command=command, ignore_errors=True)
+    if from_manifest is True:
+        blobs_to_update_file_path = BACKUP_DIRECTORY / "manifests" / "blobs_to_update.txt"
+        commands = []
+        with blobs_to_update_file_path.open(mode="r") as file_stream:
+            for line in file_stream:
+                blob_id = line.strip()
+                if not blob_id.startswith(top_blob_hexcode):
+                    continue
+
+                blob_key = f"{blob_id[:3]}/{blob_id[3:6]}/{blob_id}"
+                commands.append(f"cp s3://{DANDI_BUCKET}/blobs/{blob_key} {blobs_backup_directory}/{blob_key}")
+
+        if len(commands) == 0:
+            print(f"No blobs starting with `{top_blob_hexcode}` are listed in {blobs_to_update_file_path}.")
+            return
+
+        command_file_path = BACKUP_DIRECTORY / "batches" / f"blobs_manifest_{top_blob_hexcode}.txt"
+        if adaptive is True:
+            _run_s5cmd_batch_adaptively(
+                commands=commands,
+                command_file_path=command_file_path,
+                destination=blobs_backup_directory,
+                controller=_AIMDController(workers=min(32, number_of_workers), max_workers=number_of_workers),
+            )
+            return
+
+        _run_s5cmd_batch(commands=commands, command_file_path=command_file_path, number_of_workers=number_of_workers)
+        return
+
+    # Sub-prefixes are copied in 16 groups (one per second hex digit) so that a preempted task loses at most one
+    # group of progress; the checkpoint records each finished group, or each sub-prefix when copied one at a time
+    checkpoint = _TaskCheckpoint(name=f"blobs_{top_blob_hexcode}")
+    with _flush_on_sigterm(checkpoint=checkpoint):
+        for sub_blob_hexcode_1 in range(16):
+            blob_group = f"{top_blob_hexcode}{sub_blob_hexcode_1:01x}"
+            blob_subdirectories = [
+                f"{blob_group}{sub_blob_hexcode_2:01x}"
+                for sub_blob_hexcode_2 in range(16)
+                if f"{blob_group}{sub_blob_hexcode_2:01x}" not in checkpoint
+            ]
+            if len(blob_subdirectories) == 0:
+                continue
 
+            if backend == "aio":
+                prefix_to_destination = {
+                    f"blobs/{blob_subdirectory}/": blobs_backup_directory / blob_subdirectory
+                    for blob_subdirectory in blob_subdirectories
+                }
+                summary = _sync_prefixes_with_aio(
+                    prefix_to_destination=prefix_to_destination, max_concurrency=number_of_workers
+                )
+                if summary["errors"] == 0:
+                    checkpoint.mark_completed(unit=blob_group, bytes_moved=summary["bytes"])
+                continue
 
-def backup_dandi_zarr(task_id: int) -> None:
+            commands = []
+            for blob_subdirectory in blob_subdirectories:
+                source = f"s3://{DANDI_BUCKET}/blobs/{blob_subdirectory}/*"
+                destination = f"{blobs_backup_directory}/{blob_subdirectory}/"
+                commands.append(f"cp --if-size-differ --if-source-newer {source} {destination}")
+
+            if batch is True:
+                command_file_path = BACKUP_DIRECTORY / "batches" / f"blobs_{blob_group}.txt"
+                summary = _run_s5cmd_batch(
+                    commands=commands, command_file_path=command_file_path, number_of_workers=number_of_workers
+                )
+                if summary["errors"] == 0:
+                    checkpoint.mark_completed(unit=blob_group, bytes_moved=summary["bytes"])
+                continue
+
+            for blob_subdirectory, command in zip(blob_subdirectories, commands):
+                summary = _run_s5cmd_command(command=command, prefix=f"blobs/{blob_subdirectory}")
+                if summary["errors"] == 0:
+                    checkpoint.mark_completed(unit=blob_subdirectory, bytes_moved=summary["bytes"])
+
+    print(f"Blobs task {top_blob_hexcode} complete: {checkpoint.bytes_moved} bytes moved this cycle.")
+
+
+def backup_dandi_zarr(task_id: int, nested: bool = False, packed: bool = False, number_of_workers: int = 256) -> None:
+    """
+    Backup the Zarr stores whose IDs start with the two hex digits corresponding to the `task_id`.
+
+    Parameters
+    ----------
+    task_id : int
+        The first two hex digits of the Zarr IDs to backup, as an integer from 0 to 255.
+    nested : bool, default: False
+        Whether to sync each Zarr store incrementally against its own manifest, into the hex-nested
+        `zarr/abc/def/<ID>` layout, instead of copying every store flat into the `zarr` directory with `s5cmd cp`.
+    packed : bool, default: False
+        Whether to store the chunks of each Zarr store in append-only pack files, at `zarr/abc/def/<ID>.zpack`,
+        instead of one file per chunk. Implies `nested`.
+    number_of_workers : int, default: 256
+        The number of s5cmd workers used to copy the changed chunks of each store when `nested` is True.
+    """
     top_zarr_hexcode = f"{task_id:02x}"
     partition_key = int(top_zarr_hexcode[0], 16)
     partition = ZARR_HEAD_TO_PARTITION[partition_key]
-    zarr_backup_directory = pathlib.Path(f"/orcd/data/dandi/{partition}/s3dandiarchive/zarr")
-
-    for sub_zarr_hexcode_1 in range(16):
-        zarr_subdirectory = f"{top_zarr_hexcode}{sub_zarr_hexcode_1:01x}"
-        source = f"s3://dandiarchive/zarr/{zarr_subdirectory}*"
-        destination = zarr_backup_directory  # No nested structure yet
-        command = f"s5cmd cp --if-size-differ --if-source-newer {source} {destination}"
-        print(command)
-        _deploy_subprocess(command=command, ignore_errors=True)
+    zarr_backup_directory = DANDI_ROOT / partition / "s3dandiarchive" / "zarr"
+
+    checkpoint = _TaskCheckpoint(name=f"zarr_{top_zarr_hexcode}")
+    with _flush_on_sigterm(checkpoint=checkpoint):
+        for sub_zarr_hexcode_1 in range(16):
+            zarr_subdirectory = f"{top_zarr_hexcode}{sub_zarr_hexcode_1:01x}"
+            if zarr_subdirectory in checkpoint:
+                continue
+
+            if nested is True or packed is True:
+                for zarr_id in _list_zarr_ids(prefix=zarr_subdirectory):
+                    if zarr_id in checkpoint:
+                        continue
+
+                    nested_zarr_directory = _get_nested_zarr_directory(
+                        zarr_backup_directory=zarr_backup_directory, zarr_id=zarr_id
+                    )
+                    flat_zarr_directory = zarr_backup_directory / zarr_id
+                    if packed is True:
+                        nested_zarr_directory = nested_zarr_directory.with_name(f"{zarr_id}.zpack")
+                    elif flat_zarr_directory.is_dir() and not nested_zarr_directory.exists():
+                        nested_zarr_directory.parent.mkdir(parents=True, exist_ok=True)
+                        flat_zarr_directory.rename(nested_zarr_directory)
+
+                    summary = _sync_zarr(
+                        zarr_id=zarr_id,
+                        destination=nested_zarr_directory,
+                        number_of_workers=number_of_workers,
+                        packed=packed,
+                    )
+                    if summary["errors"] == 0:
+                        checkpoint.mark_completed(unit=zarr_id, bytes_moved=summary["bytes"])
+                continue
+
+            source = f"s3://{DANDI_BUCKET}/zarr/{zarr_subdirectory}*"
+            destination = zarr_backup_directory  # Flat layout; see `nested`
+            summary = _run_s5cmd_command(
+                command=f"cp --if-size-differ --if-source-newer {source} {destination}",
+                prefix=f"zarr/{zarr_subdirectory}",
+            )
+            if summary["errors"] == 0:
+                checkpoint.mark_completed(unit=zarr_subdirectory, bytes_moved=summary["bytes"])
+
+    print(f"Zarr task {top_zarr_hexcode} complete: {checkpoint.bytes_moved} bytes moved this cycle.")
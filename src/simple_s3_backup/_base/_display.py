@@ -1,15 +1,23 @@
 import collections
+import concurrent.futures
 import datetime
 import json
 import math
 import pathlib
+import threading
 import zoneinfo
 
 import yaml
 from tabulate2 import tabulate
 
-from ._globals import BLOBS_HEAD_TO_PARTITION
-from ._utils import _deploy_subprocess, _get_today
+from ._globals import BACKUP_DIRECTORY, BLOBS_HEAD_TO_PARTITION, DANDI_BUCKET, DANDI_ROOT
+from ._history import _HISTORY_FILE_PATH, _format_sparkline, _get_catch_up_rate, _get_transferred_bytes, _UsageHistory
+from ._listing import _get_listing_source
+from ._metrics import _measure
+from ._s5cmd import _NO_OBJECT_FOUND_ERROR
+from ._scan import _scan_tree, _scan_tree_by_prefix, _TreeUsage
+from ._streaming import _stream_subprocess
+from ._utils import _deploy_subprocess, _get_today, _human_readable_size
 
 
 def update_display(use_cache: bool = True) -> None:
@@ -63,7 +71,7 @@ def update_display(use_cache: bool = True) -> None:
             ],
         },
     }
-    disk_space_json_file_path = pathlib.Path("/orcd/data/dandi/001/backup/backup-status/data/disk.json")
+    disk_space_json_file_path = BACKUP_DIRECTORY / "backup-status" / "data" / "disk.json"
     with disk_space_json_file_path.open(mode="w") as file_stream:
         json.dump(obj=disk_space_json, fp=file_stream)
 
@@ -89,21 +97,111 @@ def update_display(use_cache: bool = True) -> None:
             ],
         },
     }
-    content_json_file_path = pathlib.Path("/orcd/data/dandi/001/backup/backup-status/data/content.json")
+    content_json_file_path = BACKUP_DIRECTORY / "backup-status" / "data" / "content.json"
     with content_json_file_path.open(mode="w") as file_stream:
         json.dump(obj=content_json, fp=file_stream)
 
     readme_lines += json_to_markdown_table(json_table=content_json)
 
+    readme_lines += ["", "", ""]
+    trends_json = _build_trends_json(data=data, locations=outer_ls_locations)
+    trends_json_file_path = BACKUP_DIRECTORY / "backup-status" / "data" / "trends.json"
+    with trends_json_file_path.open(mode="w") as file_stream:
+        json.dump(obj=trends_json, fp=file_stream)
+
+    readme_lines += json_to_markdown_table(json_table=trends_json)
+
     readme_lines += ["", "", ""]
     readme_lines += json_to_markdown_table(json_table=_build_blob_partition_json())
 
     readme = "\n".join(readme_lines)
-    readme_file_path = pathlib.Path("/orcd/data/dandi/001/backup/backup-status/README.md")
+    readme_file_path = BACKUP_DIRECTORY / "backup-status" / "README.md"
     with readme_file_path.open(mode="w") as file_stream:
         file_stream.write(readme)
 
 
+def _build_trends_json(data: dict, locations: list[str], sparkline_days: int = 30) -> dict:
+    """
+    Record today's usage of each location in the usage history and summarize its recent trends.
+
+    The bytes transferred yesterday are refreshed too, since the run logs of that day may have grown since the last
+    update. Rates and ETAs are derived from the last week of history.
+    """
+    today = _get_today()
+    yesterday = (datetime.date.fromisoformat(today) - datetime.timedelta(days=1)).isoformat()
+
+    history = _UsageHistory(file_path=_HISTORY_FILE_PATH)
+    location_to_transferred_bytes = _get_transferred_bytes(day=today, locations=locations)
+    history.record(
+        day=today,
+        location_to_values={
+            location: {
+                "local_size": data["outer_directory_to_local_size"][location],
+                "remote_size": data["outer_directory_to_remote_size"][location],
+                "local_object_count": data["outer_directory_to_local_object_count"][location],
+                "remote_object_count": data["outer_directory_to_remote_object_count"][location],
+                "transferred_bytes": location_to_transferred_bytes.get(location, 0),
+            }
+            for location in locations
+        },
+    )
+    if yesterday in history.days:
+        history.record(
+            day=yesterday,
+            location_to_values={
+                location: {"transferred_bytes": transferred_bytes}
+                for location, transferred_bytes in _get_transferred_bytes(day=yesterday, locations=locations).items()
+            },
+        )
+    history.save()
+
+    columns = collections.defaultdict(list)
+    for location in locations:
+        backlog_in_bytes = max(
+            data["outer_directory_to_remote_size"][location] - data["outer_directory_to_local_size"][location], 0
+        )
+        transferred_series = history.get_series(location=location, field="transferred_bytes", days=7)
+        transferred_values = [value for _, value in transferred_series if value is not None]
+        rate_in_bytes_per_day = sum(transferred_values) / len(transferred_values) if transferred_values else 0
+        catch_up_rate = _get_catch_up_rate(history=history, location=location)
+
+        if backlog_in_bytes == 0:
+            eta = "Caught up"
+        elif catch_up_rate is not None and catch_up_rate > 0:
+            eta = f"~{math.ceil(backlog_in_bytes / catch_up_rate)} days"
+        else:
+            eta = "-"
+
+        field_to_recent_values = {
+            field: [value for _, value in history.get_series(location=location, field=field, days=sparkline_days)]
+            for field in ("local_size", "remote_size", "transferred_bytes")
+        }
+        backlog_values = [
+            max(remote_size - local_size, 0) if local_size is not None and remote_size is not None else None
+            for local_size, remote_size in zip(
+                field_to_recent_values["local_size"], field_to_recent_values["remote_size"]
+            )
+        ]
+
+        columns["Location"].append(location)
+        columns["Backlog"].append(_human_readable_size(size_in_bytes=backlog_in_bytes))
+        columns["Rate (7 days)"].append(f"{_human_readable_size(size_in_bytes=int(rate_in_bytes_per_day))}/day")
+        columns["ETA"].append(eta)
+        columns[f"Local Size ({sparkline_days} days)"].append(
+            _format_sparkline(values=field_to_recent_values["local_size"])
+        )
+        columns[f"Backlog ({sparkline_days} days)"].append(_format_sparkline(values=backlog_values))
+        columns[f"Transferred ({sparkline_days} days)"].append(
+            _format_sparkline(values=field_to_recent_values["transferred_bytes"])
+        )
+
+    return {
+        "subtitle": "Trends",
+        "tails": ["ETA extrapolates the rate at which the backlog shrank over the last week."],
+        "data": dict(columns),
+    }
+
+
 def _build_blob_partition_json() -> dict:
     partition_to_hex_digits = collections.defaultdict(list)
     for task_id, partition in BLOBS_HEAD_TO_PARTITION.items():
@@ -164,84 +262,82 @@ def json_to_markdown_table(json_table: dict) -> list[str]:
 
 
 def _load_data(use_cache: bool = True) -> dict:
-    backup_directory = pathlib.Path("/orcd/data/dandi/001/s3dandiarchive")
+    backup_directory = DANDI_ROOT / "001" / "s3dandiarchive"
     cache_directory = backup_directory.parent / "display_cache"
     cache_directory.mkdir(exist_ok=True)
+    usage_cache_directory = backup_directory.parent / "usage_cache"
+    usage_cache_directory.mkdir(exist_ok=True)
 
     today = _get_today()
     filename = f"{today}.yaml"
 
     collections.deque(
-        (path.unlink() for path in cache_directory.iterdir() if path.name != filename),
+        (path.unlink() for path in cache_directory.iterdir() if not path.name.startswith(today)),
         maxlen=0,
     )
     daily_cache_file_path = cache_directory / filename
 
     if use_cache is False or not daily_cache_file_path.exists():
-        df_command_001 = "df -B1 /orcd/data/dandi/001"
+        df_command_001 = f"df -B1 {DANDI_ROOT / '001'}"
         df_output_001 = _deploy_subprocess(command=df_command_001)
         df_output_001_lines = df_output_001.splitlines()
         df_values_001_split = df_output_001_lines[1].split(" ")
         partition_001_used = int(df_values_001_split[2])
         partition_001_total = int(df_values_001_split[1])
 
-        df_command_002 = "df -B1 /orcd/data/dandi/002"
+        df_command_002 = f"df -B1 {DANDI_ROOT / '002'}"
         df_output_002 = _deploy_subprocess(command=df_command_002)
         df_output_002_lines = df_output_002.splitlines()
         df_values_002_split = df_output_002_lines[1].split(" ")
         partition_002_used = int(df_values_002_split[2])
         partition_002_total = int(df_values_002_split[1])
 
-        outer_ls_command = "s5cmd ls s3://dandiarchive"
-        outer_ls_output = _deploy_subprocess(command=outer_ls_command)
+        outer_ls_command = f"s5cmd ls s3://{DANDI_BUCKET}"
+        outer_ls_lines = _stream_subprocess(command=outer_ls_command)
 
         skip_outer_keys = ("zarr", "dandiarchive")
         outer_ls_locations = [
-            line.split(" ")[-1]
-            for line in outer_ls_output.splitlines()
-            if not any(skip_key in line for skip_key in skip_outer_keys)
+            line.split(" ")[-1] for line in outer_ls_lines if not any(skip_key in line for skip_key in skip_outer_keys)
         ]
 
-        outer_directory_to_remote_size = dict()
-        outer_directory_to_remote_object_count = dict()
-        for location in outer_ls_locations:
-            du_command = f"s5cmd du s3://dandiarchive/{location}*"
-            du_output = _deploy_subprocess(command=du_command)
-            du_output_split = du_output.split(" ")
-
-            remote_size_in_bytes = int(du_output_split[0])
-            remote_object_count = int(du_output_split[3])
-
-            outer_directory_to_remote_size[location] = remote_size_in_bytes
-            outer_directory_to_remote_object_count[location] = remote_object_count
+        remote_usage_cache_file_path = cache_directory / f"{today}_remote_usage.json"
+        location_to_remote_usage = _get_remote_usage(
+            locations=outer_ls_locations, cache_file_path=remote_usage_cache_file_path, use_cache=use_cache
+        )
+        outer_directory_to_remote_size = {
+            location: remote_size_in_bytes for location, (remote_size_in_bytes, _) in location_to_remote_usage.items()
+        }
+        outer_directory_to_remote_object_count = {
+            location: remote_object_count for location, (_, remote_object_count) in location_to_remote_usage.items()
+        }
 
         outer_directory_to_local_size = dict()
         outer_directory_to_local_object_count = dict()
         for location in outer_ls_locations:
-            local_path = backup_directory / location.removesuffix("/")
-            local_size_in_bytes, local_object_count = _get_local_size_in_bytes_and_object_count(path=local_path)
-
-            outer_directory_to_local_size[location] = local_size_in_bytes
-            outer_directory_to_local_object_count[location] = local_object_count
-
-        # Update blobs/ with object count from second partition
-        other_blobs_backup_directory = pathlib.Path("/orcd/data/dandi/002/s3dandiarchive/blobs")
-        _, local_object_count = _get_local_size_in_bytes_and_object_count(path=other_blobs_backup_directory)
-        outer_directory_to_local_object_count["blobs/"] += local_object_count
-
-        # Local pathlib st_size method reports larger than accurate amounts for blobs only...
-        # Still unsure why...
-        # TODO: investigate
-        # For now just override with du
-        local_du_command = "du -sB1 /orcd/data/dandi/001/s3dandiarchive/blobs/"
-        local_du_output = _deploy_subprocess(command=local_du_command)
-        local_blob_size_in_bytes = int(local_du_output.split("\t")[0])
-
-        local_du_command = "du -sB1 /orcd/data/dandi/002/s3dandiarchive/blobs/"
-        local_du_output = _deploy_subprocess(command=local_du_command)
-        other_blob_size_in_bytes = int(local_du_output.split("\t")[0])
-
-        outer_directory_to_local_size["blobs/"] = local_blob_size_in_bytes + other_blob_size_in_bytes
+            if location == "blobs/":
+                continue
+
+            local_usage = _get_local_usage(
+                path=backup_directory / location.removesuffix("/"), usage_cache_directory=usage_cache_directory
+            )
+            outer_directory_to_local_size[location] = local_usage.size_in_bytes
+            outer_directory_to_local_object_count[location] = local_usage.object_count
+
+        # Blobs are split across both partitions
+        # Their size is reported as allocated on disk (as by `du`) rather than apparent, as it has been historically
+        blobs_usage = sum(
+            (
+                _get_local_usage(
+                    path=DANDI_ROOT / partition / "s3dandiarchive" / "blobs",
+                    usage_cache_directory=usage_cache_directory,
+                    signature_depth=1,
+                )
+                for partition in sorted(set(BLOBS_HEAD_TO_PARTITION.values()))
+            ),
+            start=_TreeUsage(),
+        )
+        outer_directory_to_local_size["blobs/"] = blobs_usage.allocated_in_bytes
+        outer_directory_to_local_object_count["blobs/"] = blobs_usage.object_count
 
         cache_data = {
             "partition_001_used": partition_001_used,
@@ -262,70 +358,124 @@ def _load_data(use_cache: bool = True) -> dict:
     return cache_data
 
 
-def _get_local_size_in_bytes_and_object_count(path: pathlib.Path) -> tuple[int, int]:
-    if not path.exists():
-        return 0, 0
-
-    if path.is_file():
-        return path.stat().st_size, 1
-
-    if path.is_dir():
-        sizes = [subpath.stat().st_size for subpath in path.rglob(pattern="*") if subpath.is_file()]
-        return sum(sizes), len(sizes)
+def _get_remote_usage(
+    locations: list[str], cache_file_path: pathlib.Path, max_workers: int = 16, use_cache: bool = True
+) -> dict[str, tuple[int, int]]:
+    """
+    Get the remote size and object count of each top-level location of the bucket.
 
+    Locations are measured concurrently with `s5cmd du`, with `blobs/` split into its 256 two-hex-digit sub-prefixes
+    and summed. The result of each unit of work is saved to a cache file as soon as it completes, so that a preempted
+    dashboard job resumes where it stopped. Locations whose usage the listing source already knows are summed from it
+    instead of listed again: every location if an S3 Inventory report is configured, or the blobs if a listing from
+    the last day is already on disk (from `s3backup dandi manifest` or `s3backup dandi diff`).
 
-def _format_ratio(numerator: int, denominator: int) -> str:
-    ratio = f"{numerator / denominator:.2%}"
-    if ratio == "100%" and numerator != denominator:
-        ratio = "99.99%"
-    return ratio
-
+    Parameters
+    ----------
+    locations : list of str
+        The top-level locations of the bucket (for example `blobs/` or `dandiarchive.json`).
+    cache_file_path : pathlib.Path
+        The JSON file caching the result of each unit of work.
+    max_workers : int, default: 16
+        The number of `s5cmd du` commands to run concurrently.
+    use_cache : bool, default: True
+        Whether to resume from the units already saved to the cache file. If False, every unit is measured again
+        (and the cache file rewritten).
 
-def _human_readable_size(size_in_bytes: int, binary: bool = False) -> str:
+    Returns
+    -------
+    dict of str to tuple of int and int
+        The size in bytes and object count of each location.
+    """
+    unit_to_usage: dict[str, list[int]] = dict()
+    if use_cache is True and cache_file_path.exists():
+        with cache_file_path.open(mode="r") as file_stream:
+            unit_to_usage = json.load(fp=file_stream)
+
+    listing_source = _get_listing_source(manifests_directory=BACKUP_DIRECTORY / "manifests")
+    known_location_to_usage = listing_source.get_usage()
+    location_to_units = {location: [location] for location in locations}
+    for location in locations:
+        if location in known_location_to_usage:
+            unit_to_usage[location] = list(known_location_to_usage[location])
+        elif location == "blobs/":
+            location_to_units["blobs/"] = [f"blobs/{head:02x}" for head in range(256)]
+
+    units_to_measure = [unit for units in location_to_units.values() for unit in units if unit not in unit_to_usage]
+    cache_lock = threading.Lock()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        unit_to_future = {unit: executor.submit(_get_remote_du, unit) for unit in units_to_measure}
+        for future in concurrent.futures.as_completed(unit_to_future.values()):
+            unit, usage = future.result()
+            with cache_lock:
+                unit_to_usage[unit] = list(usage)
+                temporary_cache_file_path = cache_file_path.with_suffix(".tmp")
+                with temporary_cache_file_path.open(mode="w") as file_stream:
+                    json.dump(obj=unit_to_usage, fp=file_stream)
+                temporary_cache_file_path.replace(cache_file_path)
+
+    location_to_remote_usage = dict()
+    for location, units in location_to_units.items():
+        usages = [unit_to_usage[unit] for unit in units]
+        location_to_remote_usage[location] = (sum(usage[0] for usage in usages), sum(usage[1] for usage in usages))
+    return location_to_remote_usage
+
+
+def _get_remote_du(unit: str) -> tuple[str, tuple[int, int]]:
+    """Measure the size and object count of a prefix with `s5cmd du`, where an empty prefix measures (0, 0)."""
+    du_command = f"s5cmd du s3://{DANDI_BUCKET}/{unit}*"
+    with _measure(kind="command", name="s5cmd du", prefix=unit) as metric:
+        try:
+            du_output = _deploy_subprocess(command=du_command)
+        except RuntimeError as exception:
+            if _NO_OBJECT_FOUND_ERROR not in str(exception):
+                raise
+            metric.update(objects=0)
+            return unit, (0, 0)
+        du_output_split = du_output.split(" ")
+
+        remote_size_in_bytes = int(du_output_split[0])
+        remote_object_count = int(du_output_split[3])
+        metric.update(surveyed_bytes=remote_size_in_bytes, objects=remote_object_count)
+    return unit, (remote_size_in_bytes, remote_object_count)
+
+
+def _get_local_usage(
+    path: pathlib.Path, usage_cache_directory: pathlib.Path, signature_depth: int | None = None
+) -> _TreeUsage:
     """
-    Convert a file size given in bytes to a human-readable format using division
-    and remainder instead of iteration.
+    Get the usage of a local backup location, re-scanning only the prefixes that changed since the last call.
 
     Parameters
     ----------
-    size_in_bytes : int
-        The size in bytes.
-    binary : bool, default=False
-        If True, use binary prefixes (KiB, MiB, etc.). If False, use SI prefixes (KB, MB, etc.).
+    path : pathlib.Path
+        The local backup location.
+    usage_cache_directory : pathlib.Path
+        The directory holding the per-prefix usage caches, one file per location.
+    signature_depth : int, optional
+        How many levels of directories below each prefix are checked for changes. Defaults to all of them.
 
     Returns
     -------
-    str
-        A human-readable string representation of the size.
-
-    Examples
-    --------
-    >>> human_readable_size(123)
-    '123 B'
-    >>> human_readable_size(1234, binary=True)
-    '1.21 KiB'
-    >>> human_readable_size(123456789)
-    '123.46 MB'
+    _TreeUsage
+        The total usage of the location.
     """
-    # Check if size is negative
-    if size_in_bytes < 0:
-        raise ValueError("Size must be non-negative")
-
-    if size_in_bytes == 0:
-        return "0 B"
-
-    # Define the suffixes for each size unit
-    suffixes = ["", "K", "M", "G", "T", "P", "E", "Z", "Y"]
+    cache_file_path = usage_cache_directory / f"{'_'.join(path.parts[1:])}.json"
+    with _measure(kind="phase", name="dashboard.local_scan", prefix=str(path)) as metric:
+        prefix_to_usage = _scan_tree_by_prefix(
+            path=path, cache_file_path=cache_file_path, signature_depth=signature_depth
+        )
+        if len(prefix_to_usage) == 0:
+            usage = _scan_tree(path=path)
+        else:
+            usage = sum(prefix_to_usage.values(), start=_TreeUsage())
+        metric.update(surveyed_bytes=usage.size_in_bytes, objects=usage.object_count)
 
-    # Calculate base and the exponent
-    base = 1024 if binary else 1000
-    exponent = int(math.log(size_in_bytes, base))
+    return usage
 
-    if exponent == 0:
-        return f"{size_in_bytes} B"
 
-    # Calculate the human-readable size
-    human_readable_value = size_in_bytes / (base**exponent)
-
-    # Return formatted size with suffix
-    return f"{human_readable_value:.2f} {suffixes[exponent]}{'i' if binary else ''}B"
+def _format_ratio(numerator: int, denominator: int) -> str:
+    ratio = f"{numerator / denominator:.2%}"
+    if ratio == "100%" and numerator != denominator:
+        ratio = "99.99%"
+    return ratio
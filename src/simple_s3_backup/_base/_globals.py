@@ -1,3 +1,24 @@
+import os
+import pathlib
+
+# The parent of the partition directories (`001`, `002`) and the bucket being backed up
+# Both may be overridden, for example to run against a synthetic archive served locally
+DANDI_ROOT = pathlib.Path(os.environ.get("S3BACKUP_DANDI_ROOT", "/orcd/data/dandi"))
+DANDI_BUCKET = os.environ.get("S3BACKUP_DANDI_BUCKET", "dandiarchive")
+BACKUP_DIRECTORY = DANDI_ROOT / "001" / "backup"
+
+# The S3 Inventory configuration of the bucket, either a local directory or an `s3://` URL, holding the dated
+# directories of `manifest.json` files and the `data/` files they reference (for example
+# `s3://<destination bucket>/<prefix>/dandiarchive/<configuration ID>/`); if unset, the bucket is listed with s5cmd
+DANDI_INVENTORY = os.environ.get("S3BACKUP_DANDI_INVENTORY", None)
+
+# Caps on the total bandwidth (in bytes per second) and number of s5cmd workers of adaptive transfers, shared by all
+# array tasks through `BACKUP_DIRECTORY/throttle`; unset means uncapped
+MAX_BANDWIDTH_IN_BYTES_PER_SECOND = (
+    int(os.environ["S3BACKUP_MAX_BANDWIDTH"]) if "S3BACKUP_MAX_BANDWIDTH" in os.environ else None
+)
+MAX_WORKERS = int(os.environ["S3BACKUP_MAX_WORKERS"]) if "S3BACKUP_MAX_WORKERS" in os.environ else None
+
 BLOBS_HEAD_TO_PARTITION = {
     0: "001",
     1: "001",
@@ -0,0 +1,136 @@
+import bisect
+import datetime
+import json
+import pathlib
+
+from ._globals import BACKUP_DIRECTORY
+from ._metrics import _METRICS_DIRECTORY, _iter_metric_records
+
+_HISTORY_FILE_PATH = BACKUP_DIRECTORY / "backup-status" / "data" / "history.json"
+_HISTORY_FIELDS = ("local_size", "remote_size", "local_object_count", "remote_object_count", "transferred_bytes")
+_MAX_HISTORY_DAYS = 730
+_TRANSFER_METRIC_NAMES = ("s5cmd cp", "s5cmd run", "aio cp")
+
+
+class _UsageHistory:
+    """
+    Compact time series of the daily usage of each backup location.
+
+    The whole history is a single JSON file of columns: the sorted list of days and, for each location and field, a
+    list of values aligned with those days (null where the location was not measured that day). Recording a day that
+    is already present replaces its values, so the dashboard may be updated several times a day.
+
+    Parameters
+    ----------
+    file_path : pathlib.Path
+        The path to the JSON file; it is created on the first `save`.
+    max_days : int, default: 730
+        The number of most recent days kept.
+    """
+
+    def __init__(self, file_path: pathlib.Path, max_days: int = _MAX_HISTORY_DAYS) -> None:
+        self.file_path = file_path
+        self.max_days = max_days
+
+        self.days: list[str] = list()
+        self.location_to_field_to_values: dict[str, dict[str, list[int | None]]] = dict()
+        if file_path.exists():
+            with file_path.open(mode="r") as file_stream:
+                history = json.load(fp=file_stream)
+            self.days = history["days"]
+            self.location_to_field_to_values = history["locations"]
+
+    def record(self, day: str, location_to_values: dict[str, dict[str, int]]) -> None:
+        """Set the given fields of each location on a day, leaving any other fields of that day as they were."""
+        index = bisect.bisect_left(self.days, day)
+        if index == len(self.days) or self.days[index] != day:
+            self.days.insert(index, day)
+            for field_to_values in self.location_to_field_to_values.values():
+                for values in field_to_values.values():
+                    values.insert(index, None)
+
+        for location, field_to_value in location_to_values.items():
+            field_to_values = self.location_to_field_to_values.setdefault(
+                location, {field: [None] * len(self.days) for field in _HISTORY_FIELDS}
+            )
+            for field, value in field_to_value.items():
+                field_to_values[field][index] = value
+
+        excess = len(self.days) - self.max_days
+        if excess > 0:
+            del self.days[:excess]
+            for field_to_values in self.location_to_field_to_values.values():
+                for values in field_to_values.values():
+                    del values[:excess]
+
+    def get_series(self, location: str, field: str, days: int | None = None) -> list[tuple[str, int | None]]:
+        """The (day, value) pairs of a field of a location, limited to the last `days` recorded days if given."""
+        values = self.location_to_field_to_values.get(location, dict()).get(field, [None] * len(self.days))
+        series = list(zip(self.days, values))
+        return series[-days:] if days is not None else series
+
+    def save(self) -> None:
+        history = {"days": self.days, "locations": self.location_to_field_to_values}
+
+        self.file_path.parent.mkdir(parents=True, exist_ok=True)
+        temporary_file_path = self.file_path.with_suffix(".tmp")
+        with temporary_file_path.open(mode="w") as file_stream:
+            json.dump(obj=history, fp=file_stream, separators=(",", ":"))
+        temporary_file_path.replace(self.file_path)
+
+
+def _get_transferred_bytes(day: str, locations: list[str]) -> dict[str, int]:
+    """
+    Sum the bytes copied on a day into each location, from the transfer records of the run logs.
+
+    Records are attributed by their prefix (for example `blobs/abc`), or by the first part of the name of the batch
+    file they ran (for example `blobs_3`). Nothing is returned for a day without run logs.
+    """
+    if not (_METRICS_DIRECTORY / day).exists():
+        return dict()
+
+    location_to_transferred_bytes = {location: 0 for location in locations}
+    for record in _iter_metric_records(day=day):
+        if record.get("kind", None) != "command" or record.get("name", None) not in _TRANSFER_METRIC_NAMES:
+            continue
+
+        prefix = record.get("prefix", None) or ""
+        for location in locations:
+            if prefix.startswith(location) or f"{prefix.split('_', maxsplit=1)[0]}/" == location:
+                location_to_transferred_bytes[location] += record.get("bytes", 0)
+                break
+
+    return location_to_transferred_bytes
+
+
+def _get_catch_up_rate(history: _UsageHistory, location: str, window_in_days: int = 7) -> float | None:
+    """
+    The bytes per day by which the backlog of a location (remote size minus local size) shrank over the last days.
+
+    Returns None if fewer than two of the recorded days in the window have both sizes.
+    """
+    local_series = history.get_series(location=location, field="local_size", days=window_in_days)
+    remote_series = history.get_series(location=location, field="remote_size", days=window_in_days)
+    day_to_backlog = {
+        day: remote_size - local_size
+        for (day, local_size), (_, remote_size) in zip(local_series, remote_series)
+        if local_size is not None and remote_size is not None
+    }
+    if len(day_to_backlog) < 2:
+        return None
+
+    first_day, last_day = min(day_to_backlog), max(day_to_backlog)
+    elapsed_days = (datetime.date.fromisoformat(last_day) - datetime.date.fromisoformat(first_day)).days
+    return (day_to_backlog[first_day] - day_to_backlog[last_day]) / elapsed_days
+
+
+def _format_sparkline(values: list[int | None]) -> str:
+    """Render values as a line of block characters scaled between their minimum and maximum, blank where missing."""
+    blocks = "▁▂▃▄▅▆▇█"
+    known_values = [value for value in values if value is not None]
+    if len(known_values) == 0:
+        return ""
+
+    low, high = min(known_values), max(known_values)
+    scale = (len(blocks) - 1) / (high - low) if high > low else 0
+    return "".join(" " if value is None else blocks[round((value - low) * scale)] for value in values)
@@ -0,0 +1,322 @@
+import array
+import calendar
+import dataclasses
+import pathlib
+import re
+import time
+import typing
+from collections.abc import Iterator
+
+from ._globals import DANDI_BUCKET
+from ._utils import _deploy_subprocess, _lock_file
+
+_BLOB_ID_WIDTH = 36  # DANDI blob IDs are UUIDs
+_ETAG_DIGEST_WIDTH = 16  # MD5
+_ETAG_PATTERN = re.compile(rb"[0-9a-f]{32}(-[0-9]+)?")
+
+
+@dataclasses.dataclass
+class _BlobInventory:
+    """
+    Columnar representation of the remote blob listing, sorted by blob ID.
+
+    Blob IDs are stored back-to-back as fixed-width ASCII bytes in a single buffer, while sizes (in bytes) and
+    modification times (integer seconds since the epoch, UTC) are stored in int64 arrays aligned with them.
+    ETags are split into their MD5 digest, stored back-to-back in another buffer, and their number of parts (0 for a
+    single-part upload, -1 if the ETag is unknown). This costs ~72 bytes per blob instead of the several hundred
+    bytes of a dictionary of dictionaries.
+    """
+
+    blob_ids: bytearray = dataclasses.field(default_factory=bytearray)
+    sizes: array.array = dataclasses.field(default_factory=lambda: array.array("q"))
+    mtimes: array.array = dataclasses.field(default_factory=lambda: array.array("q"))
+    etag_digests: bytearray = dataclasses.field(default_factory=bytearray)
+    etag_parts: array.array = dataclasses.field(default_factory=lambda: array.array("l"))
+
+    def __len__(self) -> int:
+        return len(self.sizes)
+
+    def __iter__(self) -> Iterator[tuple[str, int, int]]:
+        for index in range(len(self)):
+            yield self.blob_id(index=index), self.sizes[index], self.mtimes[index]
+
+    def append(self, blob_id: bytes, size: int, mtime: int, etag: bytes | None = None) -> None:
+        if len(blob_id) != _BLOB_ID_WIDTH:
+            message = f"Blob ID {blob_id!r} is not {_BLOB_ID_WIDTH} characters long."
+            raise ValueError(message)
+
+        self.blob_ids += blob_id
+        self.sizes.append(size)
+        self.mtimes.append(mtime)
+        if etag is None:
+            self.etag_digests += bytes(_ETAG_DIGEST_WIDTH)
+            self.etag_parts.append(-1)
+        else:
+            digest, _, number_of_parts = etag.partition(b"-")
+            self.etag_digests += bytes.fromhex(digest.decode("ascii"))
+            self.etag_parts.append(int(number_of_parts) if number_of_parts else 0)
+
+    def blob_id_bytes(self, index: int) -> bytes:
+        start = index * _BLOB_ID_WIDTH
+        return bytes(self.blob_ids[start : start + _BLOB_ID_WIDTH])
+
+    def blob_id(self, index: int) -> str:
+        return self.blob_id_bytes(index=index).decode("ascii")
+
+    def etag(self, index: int) -> str | None:
+        """The ETag of a blob as reported by S3 (without quotes), or None if it is unknown."""
+        number_of_parts = self.etag_parts[index]
+        if number_of_parts < 0:
+            return None
+
+        start = index * _ETAG_DIGEST_WIDTH
+        digest = self.etag_digests[start : start + _ETAG_DIGEST_WIDTH].hex()
+        return f"{digest}-{number_of_parts}" if number_of_parts > 0 else digest
+
+    def find(self, blob_id: str) -> int | None:
+        """
+        Binary search for the position of a blob ID.
+
+        Parameters
+        ----------
+        blob_id : str
+            The blob ID to look up.
+
+        Returns
+        -------
+        int or None
+            The index of the blob ID, or None if it is not part of the inventory.
+        """
+        target = blob_id.encode("ascii")
+        low = self.bisect(prefix=blob_id)
+        if low < len(self) and self.blob_id_bytes(index=low) == target:
+            return low
+        return None
+
+    def bisect(self, prefix: str) -> int:
+        """The index of the first blob ID that is not less than the given prefix (or full blob ID)."""
+        target = prefix.encode("ascii")
+        low = 0
+        high = len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self.blob_id_bytes(index=middle) < target:
+                low = middle + 1
+            else:
+                high = middle
+
+        return low
+
+    def select(self, indices: list[int]) -> "_BlobInventory":
+        """A new inventory holding the blobs at the given indices, in that order."""
+        blob_ids = bytearray()
+        etag_digests = bytearray()
+        for index in indices:
+            blob_ids += self.blob_id_bytes(index=index)
+            etag_digests += self.etag_digests[index * _ETAG_DIGEST_WIDTH : (index + 1) * _ETAG_DIGEST_WIDTH]
+        return _BlobInventory(
+            blob_ids=blob_ids,
+            sizes=array.array("q", (self.sizes[index] for index in indices)),
+            mtimes=array.array("q", (self.mtimes[index] for index in indices)),
+            etag_digests=etag_digests,
+            etag_parts=array.array("l", (self.etag_parts[index] for index in indices)),
+        )
+
+    def sort(self) -> None:
+        sorted_inventory = self.select(indices=sorted(range(len(self)), key=self.blob_id_bytes))
+        for field in dataclasses.fields(self):
+            setattr(self, field.name, getattr(sorted_inventory, field.name))
+
+
+def _refresh_s5cmd_ls_blobs(manifests_directory: pathlib.Path, max_age_in_seconds: int = 86_400) -> pathlib.Path:
+    """
+    Ensure a recent `s5cmd ls --etag` listing of all remote blobs exists in the manifests directory.
+
+    The listing is written to a temporary file and renamed into place once complete, under a `flock` shared by every
+    process refreshing it, so that concurrent shards never read a partial listing and only the first to find it
+    stale lists the bucket again; the others wait for it, then find the listing recent.
+
+    Parameters
+    ----------
+    manifests_directory : pathlib.Path
+        The directory in which to store the listing.
+    max_age_in_seconds : int, default: 86,400
+        The listing is regenerated if it is older than this.
+
+    Returns
+    -------
+    pathlib.Path
+        The path to the listing.
+    """
+    s5cmd_ls_blobs_file_path = manifests_directory / "s5cmd_ls_blobs.txt"
+
+    def needs_update() -> bool:
+        return (
+            not s5cmd_ls_blobs_file_path.exists()
+            or (time.time() - s5cmd_ls_blobs_file_path.stat().st_mtime) > max_age_in_seconds
+        )
+
+    if needs_update() is False:
+        return s5cmd_ls_blobs_file_path
+
+    with _lock_file(lock_file_path=s5cmd_ls_blobs_file_path.with_suffix(".lock")):
+        # Another process may have refreshed the listing while this one waited for the lock
+        if needs_update() is True:
+            temporary_file_path = s5cmd_ls_blobs_file_path.with_suffix(".tmp")
+            command = f"s5cmd ls --etag s3://{DANDI_BUCKET}/blobs/* > {temporary_file_path}"
+            print(f"Updating local `s5cmd ls` copy!\n{command}")
+            _deploy_subprocess(command=command)
+            temporary_file_path.replace(s5cmd_ls_blobs_file_path)
+
+    return s5cmd_ls_blobs_file_path
+
+
+def _read_s5cmd_ls_blobs(
+    file_path: pathlib.Path,
+    chunk_size_in_bytes: int = 16_777_216,
+    prefix_range: tuple[str, str | None] | None = None,
+) -> _BlobInventory:
+    """
+    Stream an `s5cmd ls` listing of blobs into a columnar inventory.
+
+    The listing is read in fixed-size binary chunks so that memory usage is bounded by the size of the resulting
+    inventory rather than by the size of the text file.
+
+    Parameters
+    ----------
+    file_path : pathlib.Path
+        The path to the output of `s5cmd ls s3://dandiarchive/blobs/*`.
+    chunk_size_in_bytes : int, default: 16 MiB
+        The number of bytes to read from the listing at a time.
+    prefix_range : tuple of str and str or None, optional
+        Only keep the blob IDs from the first prefix up to, but excluding, the second (or to the end if None). The
+        other lines are skipped as they are parsed, so that memory usage is bounded by the blobs kept.
+
+    Returns
+    -------
+    _BlobInventory
+        The remote blob inventory, sorted by blob ID.
+    """
+    inventory = _BlobInventory()
+    day_to_epoch: dict[bytes, int] = dict()
+    is_sorted = True
+    previous_blob_id = b""
+
+    with file_path.open(mode="rb") as file_stream:
+        for line in _iter_lines(file_stream=file_stream, chunk_size_in_bytes=chunk_size_in_bytes):
+            blob_id = _process_s5cmd_ls_line(
+                line=line, inventory=inventory, day_to_epoch=day_to_epoch, prefix_range=prefix_range
+            )
+            if blob_id is not None and is_sorted is True:
+                is_sorted = previous_blob_id <= blob_id
+                previous_blob_id = blob_id
+
+    if is_sorted is False:
+        inventory.sort()
+
+    return inventory
+
+
+def _summarize_s5cmd_ls_blobs(file_path: pathlib.Path, chunk_size_in_bytes: int = 16_777_216) -> tuple[int, int]:
+    """
+    Stream an `s5cmd ls` listing of blobs to total its sizes, without building an inventory.
+
+    Parameters
+    ----------
+    file_path : pathlib.Path
+        The path to the output of `s5cmd ls s3://dandiarchive/blobs/*`.
+    chunk_size_in_bytes : int, default: 16 MiB
+        The number of bytes to read from the listing at a time.
+
+    Returns
+    -------
+    tuple of int and int
+        The total size in bytes and the number of blobs.
+    """
+    total_size_in_bytes = 0
+    blob_count = 0
+    with file_path.open(mode="rb") as file_stream:
+        for line in _iter_lines(file_stream=file_stream, chunk_size_in_bytes=chunk_size_in_bytes):
+            parts = line.split()
+            if len(parts) < 4 or parts[-2] == b"DIR":
+                continue
+
+            total_size_in_bytes += int(parts[-2])
+            blob_count += 1
+
+    return total_size_in_bytes, blob_count
+
+
+def _iter_lines(file_stream: typing.BinaryIO, chunk_size_in_bytes: int) -> Iterator[bytes]:
+    remainder = b""
+    while chunk := file_stream.read(chunk_size_in_bytes):
+        lines = (remainder + chunk).split(b"\n")
+        remainder = lines.pop()
+        yield from lines
+    if remainder:
+        yield remainder
+
+
+def _process_s5cmd_ls_line(
+    line: bytes,
+    inventory: _BlobInventory,
+    day_to_epoch: dict[bytes, int],
+    prefix_range: tuple[str, str | None] | None = None,
+) -> bytes | None:
+    """
+    Process a line from the `s5cmd ls` output.
+
+    Lines have the form `2024/01/31 12:34:56        1234  abc/def/abcdef01-...`, where the timestamp is in UTC.
+    Listings made with `--etag` also hold the ETag of each blob between the timestamp and the size.
+
+    Parameters
+    ----------
+    line : bytes
+        A line from the `s5cmd ls` output.
+    inventory : _BlobInventory
+        The inventory to append the parsed blob to.
+    day_to_epoch : dict of bytes to int
+        A cache of the epoch time at the start of each day seen so far, shared across calls.
+    prefix_range : tuple of str and str or None, optional
+        Only append the blob if its ID is from the first prefix up to, but excluding, the second (or to the end if
+        None).
+
+    Returns
+    -------
+    bytes or None
+        The blob ID, or None if the line does not describe a blob or the blob is out of range. Objects whose name is
+        not a blob ID (such as a stray file uploaded under `blobs/`) are reported and skipped.
+    """
+    parts = line.split()
+    if len(parts) < 4 or parts[-2] == b"DIR":
+        return None
+
+    blob_id = parts[-1].rsplit(b"/", 1)[-1]
+    if len(blob_id) != _BLOB_ID_WIDTH:
+        print(f"Skipping object {parts[-1].decode('utf-8', errors='replace')} that is not a blob.")
+        return None
+    if prefix_range is not None and not _is_in_prefix_range(blob_id=blob_id, prefix_range=prefix_range):
+        return None
+
+    day, clock = parts[0], parts[1]
+    day_epoch = day_to_epoch.get(day, None)
+    if day_epoch is None:
+        day_epoch = calendar.timegm((int(day[0:4]), int(day[5:7]), int(day[8:10]), 0, 0, 0))
+        day_to_epoch[day] = day_epoch
+    mtime = day_epoch + int(clock[0:2]) * 3600 + int(clock[3:5]) * 60 + int(clock[6:8])
+
+    size = int(parts[-2])
+    etag = None
+    for part in parts[2:-2]:
+        part = part.strip(b'"')
+        if _ETAG_PATTERN.fullmatch(part) is not None:
+            etag = part
+            break
+
+    inventory.append(blob_id=blob_id, size=size, mtime=mtime, etag=etag)
+    return blob_id
+
+
+def _is_in_prefix_range(blob_id: bytes, prefix_range: tuple[str, str | None]) -> bool:
+    start, stop = prefix_range
+    return blob_id >= start.encode("ascii") and (stop is None or blob_id < stop.encode("ascii"))
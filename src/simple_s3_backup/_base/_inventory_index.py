@@ -0,0 +1,234 @@
+import collections
+import json
+import os
+import pathlib
+import shutil
+import struct
+import typing
+from collections.abc import Iterator
+
+from ._globals import BACKUP_DIRECTORY
+from ._inventory import _BLOB_ID_WIDTH, _BlobInventory
+from ._listing import _get_listing_source
+from ._utils import _get_today
+
+_INDEX_MAGIC = b"S3BINV01"
+_INDEX_RECORD = struct.Struct(f"<{_BLOB_ID_WIDTH}sqq")  # blob ID, size, mtime
+
+
+def diff_dandi_blobs() -> collections.Counter:
+    """
+    Merge the latest remote blob listing into the persistent inventory index and record what changed.
+
+    The delta since the previous run is added to `inventory_deltas/<today>.txt` in the manifests directory, one
+    `<added|changed|deleted> <blob ID> <size> <mtime>` line per blob. `s3backup dandi manifest --incremental`
+    merges the listing in the same way and then only evaluates the blobs added or changed in the deltas it has not
+    yet consumed, so that daily work scales with churn instead of with the size of the archive.
+
+    Returns
+    -------
+    collections.Counter
+        The number of added, changed, and deleted blobs.
+    """
+    manifests_directory = BACKUP_DIRECTORY / "manifests"
+    manifests_directory.mkdir(exist_ok=True)
+
+    listing_source = _get_listing_source(manifests_directory=manifests_directory)
+    listing_source.refresh()
+    remote_inventory = listing_source.read_blob_inventory()
+
+    change_counts, delta_file_path = _update_inventory_index(
+        manifests_directory=manifests_directory, inventory=remote_inventory
+    )
+
+    print(
+        f"Inventory index updated with {len(remote_inventory)} blobs: "
+        f"{change_counts['added']} added, {change_counts['changed']} changed, {change_counts['deleted']} deleted.\n"
+        f"Delta written to {delta_file_path}"
+    )
+    return change_counts
+
+
+def _update_inventory_index(
+    manifests_directory: pathlib.Path, inventory: _BlobInventory
+) -> tuple[collections.Counter, pathlib.Path]:
+    """
+    Merge a remote inventory into the inventory index of the manifests directory, adding the delta to today's file.
+
+    Returns
+    -------
+    collections.Counter
+        The number of added, changed, and deleted blobs.
+    pathlib.Path
+        The delta file of today.
+    """
+    deltas_directory = manifests_directory / "inventory_deltas"
+    deltas_directory.mkdir(exist_ok=True)
+    delta_file_path = deltas_directory / f"{_get_today()}.txt"
+
+    change_counts = _merge_inventory_into_index(
+        inventory=inventory,
+        index_file_path=manifests_directory / "inventory_index.bin",
+        delta_file_path=delta_file_path,
+    )
+    return change_counts, delta_file_path
+
+
+def _read_inventory_deltas(deltas_directory: pathlib.Path) -> tuple[set[str], dict[str, str | int]]:
+    """
+    Collect the blobs added or changed in the deltas recorded since the cursor of `s3backup dandi manifest`.
+
+    The cursor (`cursor.json`) holds the name of the last delta file consumed and how far into it. Delta files are
+    only ever extended, so the blobs recorded after that point are exactly those not yet evaluated.
+
+    Parameters
+    ----------
+    deltas_directory : pathlib.Path
+        The directory of the daily delta files.
+
+    Returns
+    -------
+    set of str
+        The IDs of the blobs added or changed since the cursor.
+    dict
+        The cursor at the end of the latest delta, to be saved with `_save_inventory_delta_cursor` once the blobs
+        have been evaluated.
+    """
+    cursor = {"file_name": "", "offset": 0}
+    cursor_file_path = deltas_directory / "cursor.json"
+    if cursor_file_path.exists():
+        with cursor_file_path.open(mode="r") as file_stream:
+            cursor = json.load(fp=file_stream)
+
+    blob_ids = set()
+    for delta_file_path in sorted(deltas_directory.glob("????-??-??.txt")):
+        if delta_file_path.name < cursor["file_name"]:
+            continue
+
+        with delta_file_path.open(mode="rb") as file_stream:
+            if delta_file_path.name == cursor["file_name"]:
+                file_stream.seek(cursor["offset"])
+            for line in file_stream:
+                change, blob_id, _, _ = line.decode("ascii").split()
+                if change != "deleted":
+                    blob_ids.add(blob_id)
+            cursor = {"file_name": delta_file_path.name, "offset": file_stream.tell()}
+
+    return blob_ids, cursor
+
+
+def _save_inventory_delta_cursor(deltas_directory: pathlib.Path, cursor: dict[str, str | int]) -> None:
+    cursor_file_path = deltas_directory / "cursor.json"
+    temporary_cursor_file_path = cursor_file_path.with_suffix(".tmp")
+    with temporary_cursor_file_path.open(mode="w") as file_stream:
+        json.dump(obj=cursor, fp=file_stream)
+    temporary_cursor_file_path.replace(cursor_file_path)
+
+
+def _iter_index_records(file_path: pathlib.Path, records_per_chunk: int = 65_536) -> Iterator[tuple[bytes, int, int]]:
+    """
+    Stream the (blob ID, size, mtime) records of an inventory index in sorted order.
+
+    Parameters
+    ----------
+    file_path : pathlib.Path
+        The path to the inventory index. If it does not exist, no records are produced.
+    records_per_chunk : int, default: 65,536
+        The number of records to read from disk at a time.
+    """
+    if not file_path.exists():
+        return
+
+    with file_path.open(mode="rb") as file_stream:
+        magic = file_stream.read(len(_INDEX_MAGIC))
+        if magic != _INDEX_MAGIC:
+            message = f"The file at {file_path} is not a blob inventory index."
+            raise ValueError(message)
+
+        while chunk := file_stream.read(_INDEX_RECORD.size * records_per_chunk):
+            yield from _INDEX_RECORD.iter_unpack(chunk)
+
+
+def _merge_inventory_into_index(
+    inventory: _BlobInventory, index_file_path: pathlib.Path, delta_file_path: pathlib.Path
+) -> collections.Counter:
+    """
+    Replace the inventory index with a new inventory, recording the differences from the previous index.
+
+    Both the index and the inventory are sorted by blob ID, so the comparison is a single merge pass that streams
+    the previous index from disk. The new index and the extended delta are both written to temporary files; the
+    delta is moved into place first, then the index. A merge interrupted in between leaves the extended delta next to
+    the previous index, so rerunning it records the same changes again, which is harmless since the deltas are
+    consumed as a set of blob IDs. The reverse order could instead lose the changes of the day for good.
+
+    Parameters
+    ----------
+    inventory : _BlobInventory
+        The current remote inventory.
+    index_file_path : pathlib.Path
+        The path to the inventory index.
+    delta_file_path : pathlib.Path
+        The path to add the delta to.
+
+    Returns
+    -------
+    collections.Counter
+        The number of added, changed, and deleted blobs.
+    """
+    change_counts = collections.Counter(added=0, changed=0, deleted=0)
+
+    previous_records = _iter_index_records(file_path=index_file_path)
+    previous_record = next(previous_records, None)
+
+    temporary_index_file_path = index_file_path.with_suffix(".tmp")
+    temporary_delta_file_path = delta_file_path.with_suffix(".tmp")
+    if delta_file_path.exists():
+        shutil.copyfile(src=delta_file_path, dst=temporary_delta_file_path)
+    else:
+        temporary_delta_file_path.unlink(missing_ok=True)
+    with (
+        temporary_index_file_path.open(mode="wb") as index_stream,
+        temporary_delta_file_path.open(mode="a") as delta_stream,
+    ):
+        index_stream.write(_INDEX_MAGIC)
+
+        for index in range(len(inventory)):
+            blob_id = inventory.blob_id_bytes(index=index)
+            size = inventory.sizes[index]
+            mtime = inventory.mtimes[index]
+
+            while previous_record is not None and previous_record[0] < blob_id:
+                _write_delta_line(delta_stream=delta_stream, change="deleted", record=previous_record)
+                change_counts["deleted"] += 1
+                previous_record = next(previous_records, None)
+
+            if previous_record is not None and previous_record[0] == blob_id:
+                if previous_record[1] != size or previous_record[2] != mtime:
+                    _write_delta_line(delta_stream=delta_stream, change="changed", record=(blob_id, size, mtime))
+                    change_counts["changed"] += 1
+                previous_record = next(previous_records, None)
+            else:
+                _write_delta_line(delta_stream=delta_stream, change="added", record=(blob_id, size, mtime))
+                change_counts["added"] += 1
+
+            index_stream.write(_INDEX_RECORD.pack(blob_id, size, mtime))
+
+        while previous_record is not None:
+            _write_delta_line(delta_stream=delta_stream, change="deleted", record=previous_record)
+            change_counts["deleted"] += 1
+            previous_record = next(previous_records, None)
+
+        delta_stream.flush()
+        os.fsync(delta_stream.fileno())
+        index_stream.flush()
+        os.fsync(index_stream.fileno())
+
+    temporary_delta_file_path.replace(delta_file_path)
+    temporary_index_file_path.replace(index_file_path)
+
+    return change_counts
+
+
+def _write_delta_line(delta_stream: typing.TextIO, change: str, record: tuple[bytes, int, int]) -> None:
+    blob_id, size, mtime = record
+    delta_stream.write(f"{change} {blob_id.decode('ascii')} {size} {mtime}\n")
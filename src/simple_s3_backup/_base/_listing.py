@@ -0,0 +1,384 @@
+import abc
+import collections
+import csv
+import datetime
+import gzip
+import json
+import pathlib
+import shutil
+import time
+import urllib.parse
+from collections.abc import Iterator
+
+from ._globals import BACKUP_DIRECTORY, DANDI_INVENTORY
+from ._inventory import (
+    _BLOB_ID_WIDTH,
+    _ETAG_PATTERN,
+    _BlobInventory,
+    _is_in_prefix_range,
+    _read_s5cmd_ls_blobs,
+    _refresh_s5cmd_ls_blobs,
+    _summarize_s5cmd_ls_blobs,
+)
+from ._s5cmd import _run_s5cmd_batch
+from ._streaming import _stream_subprocess
+from ._utils import _deploy_subprocess, _lock_file
+
+_BATCH_SIZE = 65_536
+_CSV_COLUMNS = ("Key", "Size", "LastModifiedDate", "ETag", "IsLatest", "IsDeleteMarker")
+_COLUMNAR_COLUMNS = ("key", "size", "last_modified_date", "e_tag", "is_latest", "is_delete_marker")
+
+# The key, size, mtime (integer seconds since the epoch, UTC), and ETag columns of a batch of objects
+_ObjectBatch = tuple[list[str], list[int], list[int], list[str | None]]
+
+
+class _ListingSource(abc.ABC):
+    """
+    Where the state of the remote bucket is read from.
+
+    Parameters
+    ----------
+    manifests_directory : pathlib.Path
+        The directory holding the manifests, in which any listing is stored.
+    """
+
+    def __init__(self, manifests_directory: pathlib.Path) -> None:
+        self.manifests_directory = manifests_directory
+
+    @abc.abstractmethod
+    def refresh(self) -> None:
+        """Ensure the listing is recent, listing the bucket or fetching the latest report as needed."""
+
+    @abc.abstractmethod
+    def read_blob_inventory(self, prefix_range: tuple[str, str | None] | None = None) -> _BlobInventory:
+        """
+        Read the size, mtime, and ETag of every remote blob from the listing, sorted by blob ID.
+
+        Parameters
+        ----------
+        prefix_range : tuple of str and str or None, optional
+            Only keep the blob IDs from the first prefix up to, but excluding, the second (or to the end if None),
+            skipping the others as they are read.
+        """
+
+    @abc.abstractmethod
+    def get_usage(self, prefix: str = "", unit_width: int | None = None) -> dict[str, tuple[int, int]]:
+        """
+        The size in bytes and object count of each unit under a prefix that is known without listing the bucket.
+
+        Parameters
+        ----------
+        prefix : str, default: ""
+            Only count the objects under this prefix.
+        unit_width : int, optional
+            Objects are grouped by the prefix followed by this many characters of the rest of their key (for example
+            `zarr/abc` for 3). By default, they are grouped by the prefix followed by the rest of their key up to and
+            including the next slash (for example the top-level locations `blobs/` and `README.md`).
+
+        Returns
+        -------
+        dict of str to tuple of int and int
+            The size in bytes and object count of each unit. Units the source cannot tell about are left out.
+        """
+
+
+class _S5cmdListingSource(_ListingSource):
+    """
+    The blobs listed with `s5cmd ls --etag` once a day.
+
+    Only the usage of `blobs/`, and only while the listing is recent, is known without listing the bucket again.
+    """
+
+    @property
+    def file_path(self) -> pathlib.Path:
+        return self.manifests_directory / "s5cmd_ls_blobs.txt"
+
+    def refresh(self) -> None:
+        _refresh_s5cmd_ls_blobs(manifests_directory=self.manifests_directory)
+
+    def read_blob_inventory(self, prefix_range: tuple[str, str | None] | None = None) -> _BlobInventory:
+        return _read_s5cmd_ls_blobs(file_path=self.file_path, prefix_range=prefix_range)
+
+    def get_usage(self, prefix: str = "", unit_width: int | None = None) -> dict[str, tuple[int, int]]:
+        is_recent = self.file_path.exists() and time.time() - self.file_path.stat().st_mtime < 86_400
+        if prefix != "" or unit_width is not None or is_recent is False:
+            return dict()
+
+        return {"blobs/": _summarize_s5cmd_ls_blobs(file_path=self.file_path)}
+
+
+class _S3InventoryListingSource(_ListingSource):
+    """
+    The latest S3 Inventory report of the bucket, in CSV, ORC, or Parquet format.
+
+    A report is a `<date>/manifest.json` file, listing the `data/` files that hold the key, size, last modification
+    date, and ETag of every object of the bucket. Reports in a bucket are first downloaded to
+    `manifests/inventory/`, fetching only the data files not already there; reports in a local directory are read in
+    place. Data files are streamed one batch of rows at a time, so memory usage is bounded by what is built from them
+    rather than by the size of the report. When the report includes object versions, only current objects are kept.
+
+    Reading ORC or Parquet reports requires the optional `pyarrow` dependency.
+
+    Parameters
+    ----------
+    manifests_directory : pathlib.Path
+        The directory holding the manifests.
+    location : str
+        The directory holding the dated report directories, either local or an `s3://` URL.
+    """
+
+    def __init__(self, manifests_directory: pathlib.Path, location: str) -> None:
+        super().__init__(manifests_directory=manifests_directory)
+        self.location = location.rstrip("/")
+        self.manifest: dict | None = None
+        self.data_file_paths: list[pathlib.Path] = list()
+
+    def refresh(self) -> None:
+        if self.location.startswith("s3://"):
+            manifest_file_path = self._download_latest_report()
+        else:
+            manifest_file_paths = sorted(pathlib.Path(self.location).glob("*/manifest.json"))
+            if len(manifest_file_paths) == 0:
+                message = f"No S3 Inventory report found in {self.location}."
+                raise FileNotFoundError(message)
+            manifest_file_path = manifest_file_paths[-1]
+
+        with manifest_file_path.open(mode="r") as file_stream:
+            self.manifest = json.load(fp=file_stream)
+        data_directory = manifest_file_path.parent.parent / "data"
+        self.data_file_paths = [
+            data_directory / pathlib.PurePosixPath(file["key"]).name for file in self.manifest["files"]
+        ]
+
+        age_in_hours = (time.time() - int(self.manifest["creationTimestamp"]) / 1_000) / 3_600
+        print(
+            f"Using S3 Inventory report {manifest_file_path} ({self.manifest['fileFormat']}, "
+            f"{len(self.data_file_paths)} data files, {age_in_hours:.1f} hours old)."
+        )
+
+    def read_blob_inventory(self, prefix_range: tuple[str, str | None] | None = None) -> _BlobInventory:
+        inventory = _BlobInventory()
+        is_sorted = True
+        previous_blob_id = b""
+        for keys, sizes, mtimes, etags in self.iter_objects():
+            for key, size, mtime, etag in zip(keys, sizes, mtimes, etags):
+                if not key.startswith("blobs/"):
+                    continue
+
+                blob_id = key.rsplit("/", maxsplit=1)[-1].encode("ascii")
+                if len(blob_id) != _BLOB_ID_WIDTH:
+                    print(f"Skipping object {key} that is not a blob.")
+                    continue
+                if prefix_range is not None and not _is_in_prefix_range(blob_id=blob_id, prefix_range=prefix_range):
+                    continue
+
+                etag = etag.encode("ascii") if etag is not None else None
+                inventory.append(
+                    blob_id=blob_id,
+                    size=size,
+                    mtime=mtime,
+                    etag=etag if etag is not None and _ETAG_PATTERN.fullmatch(etag) is not None else None,
+                )
+                if is_sorted is True:
+                    is_sorted = previous_blob_id <= blob_id
+                    previous_blob_id = blob_id
+
+        # Data files each cover an arbitrary part of the bucket
+        if is_sorted is False:
+            inventory.sort()
+
+        return inventory
+
+    def get_usage(self, prefix: str = "", unit_width: int | None = None) -> dict[str, tuple[int, int]]:
+        unit_to_usage = collections.defaultdict(lambda: [0, 0])
+        for keys, sizes, _, _ in self.iter_objects():
+            for key, size in zip(keys, sizes):
+                if not key.startswith(prefix):
+                    continue
+
+                if unit_width is not None:
+                    unit = key[: len(prefix) + unit_width]
+                else:
+                    slash_index = key.find("/", len(prefix))
+                    unit = key[: slash_index + 1] if slash_index >= 0 else key
+                usage = unit_to_usage[unit]
+                usage[0] += size
+                usage[1] += 1
+
+        return {unit: (usage[0], usage[1]) for unit, usage in unit_to_usage.items()}
+
+    def iter_objects(self) -> Iterator[_ObjectBatch]:
+        """Yield the key, size, mtime, and ETag columns of the current objects of the report, one batch at a time."""
+        if self.manifest is None:
+            self.refresh()
+
+        file_format = self.manifest["fileFormat"]
+        for data_file_path in self.data_file_paths:
+            if file_format == "CSV":
+                column_names = [column_name.strip() for column_name in self.manifest["fileSchema"].split(",")]
+                yield from _read_csv_inventory(file_path=data_file_path, column_names=column_names)
+            else:
+                yield from _read_columnar_inventory(file_path=data_file_path, file_format=file_format)
+
+    def _download_latest_report(self) -> pathlib.Path:
+        """Download the latest report to the manifests directory, returning the path to its manifest file."""
+        bucket = self.location.removeprefix("s3://").split("/", maxsplit=1)[0]
+        manifest_urls = sorted(
+            json.loads(line)["key"]
+            for line in _stream_subprocess(command=f"s5cmd --json ls '{self.location}/*/manifest.json'")
+        )
+        if len(manifest_urls) == 0:
+            message = f"No S3 Inventory report found in {self.location}."
+            raise FileNotFoundError(message)
+        manifest_url = manifest_urls[-1]
+        report_name = manifest_url.rsplit("/", maxsplit=2)[-2]
+
+        # Concurrent shards share the cache, so only one downloads at a time and files only appear once complete;
+        # the others then find the report already downloaded
+        cache_directory = self.manifests_directory / "inventory"
+        cache_directory.mkdir(parents=True, exist_ok=True)
+        with _lock_file(lock_file_path=cache_directory / "download.lock"):
+            manifest_file_path = cache_directory / report_name / "manifest.json"
+            if not manifest_file_path.exists():
+                manifest_file_path.parent.mkdir(parents=True, exist_ok=True)
+                temporary_manifest_file_path = manifest_file_path.with_suffix(".tmp")
+                _deploy_subprocess(command=f"s5cmd cp '{manifest_url}' {temporary_manifest_file_path}")
+                temporary_manifest_file_path.replace(manifest_file_path)
+            with manifest_file_path.open(mode="r") as file_stream:
+                manifest = json.load(fp=file_stream)
+
+            data_directory = cache_directory / "data"
+            data_directory.mkdir(exist_ok=True)
+            name_to_file = {pathlib.PurePosixPath(file["key"]).name: file for file in manifest["files"]}
+            names_to_download = [
+                name
+                for name, file in name_to_file.items()
+                if not (data_directory / name).exists() or (data_directory / name).stat().st_size != file["size"]
+            ]
+            if len(names_to_download) > 0:
+                commands = [
+                    f"cp s3://{bucket}/{name_to_file[name]['key']} {data_directory / name}.tmp"
+                    for name in names_to_download
+                ]
+                summary = _run_s5cmd_batch(
+                    commands=commands,
+                    command_file_path=BACKUP_DIRECTORY / "batches" / "inventory.txt",
+                    number_of_workers=16,
+                    prefix="inventory",
+                )
+                if summary["errors"] > 0:
+                    message = (
+                        f"Unable to download {summary['errors']} data files of S3 Inventory report {manifest_url}."
+                    )
+                    raise RuntimeError(message)
+                for name in names_to_download:
+                    (data_directory / f"{name}.tmp").replace(data_directory / name)
+
+            # Only the latest report is kept
+            for path in data_directory.iterdir():
+                if path.name not in name_to_file:
+                    path.unlink()
+            for path in cache_directory.iterdir():
+                if path.is_dir() and path.name not in ("data", report_name):
+                    shutil.rmtree(path)
+
+        return manifest_file_path
+
+
+def _get_listing_source(manifests_directory: pathlib.Path) -> _ListingSource:
+    """
+    The source of the remote listing: the S3 Inventory reports at `S3BACKUP_DANDI_INVENTORY` if set, or s5cmd.
+
+    Parameters
+    ----------
+    manifests_directory : pathlib.Path
+        The directory holding the manifests, in which any listing is stored.
+    """
+    if DANDI_INVENTORY is not None:
+        return _S3InventoryListingSource(manifests_directory=manifests_directory, location=DANDI_INVENTORY)
+    return _S5cmdListingSource(manifests_directory=manifests_directory)
+
+
+def _read_csv_inventory(
+    file_path: pathlib.Path, column_names: list[str], batch_size: int = _BATCH_SIZE
+) -> Iterator[_ObjectBatch]:
+    """
+    Stream the current objects of a gzipped CSV data file of an S3 Inventory report.
+
+    The files have no header; their columns are given by the `fileSchema` of the manifest. Keys are URL-encoded.
+    """
+    column_to_index = {column: column_names.index(column) for column in _CSV_COLUMNS if column in column_names}
+    key_index = column_to_index["Key"]
+    size_index = column_to_index["Size"]
+    mtime_index = column_to_index["LastModifiedDate"]
+    etag_index = column_to_index.get("ETag", None)
+    is_latest_index = column_to_index.get("IsLatest", None)
+    is_delete_marker_index = column_to_index.get("IsDeleteMarker", None)
+
+    batch: _ObjectBatch = ([], [], [], [])
+    with gzip.open(file_path, mode="rt", newline="") as file_stream:
+        for row in csv.reader(file_stream):
+            if is_latest_index is not None and row[is_latest_index] != "true":
+                continue
+            if is_delete_marker_index is not None and row[is_delete_marker_index] == "true":
+                continue
+
+            batch[0].append(urllib.parse.unquote_plus(row[key_index]))
+            batch[1].append(int(row[size_index]))
+            batch[2].append(int(datetime.datetime.fromisoformat(row[mtime_index]).timestamp()))
+            batch[3].append((row[etag_index].strip('"') or None) if etag_index is not None else None)
+            if len(batch[0]) == batch_size:
+                yield batch
+                batch = ([], [], [], [])
+
+    if len(batch[0]) > 0:
+        yield batch
+
+
+def _read_columnar_inventory(
+    file_path: pathlib.Path, file_format: str, batch_size: int = _BATCH_SIZE
+) -> Iterator[_ObjectBatch]:
+    """Stream the current objects of an ORC or Parquet data file of an S3 Inventory report, by record batch."""
+    try:
+        import pyarrow
+        import pyarrow.compute
+        import pyarrow.orc
+        import pyarrow.parquet
+    except ImportError as exception:
+        message = (
+            "Reading ORC or Parquet S3 Inventory reports requires `pyarrow`; "
+            "install with `pip install simple-s3-backup[inventory]`."
+        )
+        raise ImportError(message) from exception
+
+    if file_format == "ORC":
+        orc_file = pyarrow.orc.ORCFile(file_path)
+        columns = [column for column in _COLUMNAR_COLUMNS if column in orc_file.schema.names]
+        record_batches = (orc_file.read_stripe(stripe, columns=columns) for stripe in range(orc_file.nstripes))
+    else:
+        parquet_file = pyarrow.parquet.ParquetFile(file_path)
+        columns = [column for column in _COLUMNAR_COLUMNS if column in parquet_file.schema_arrow.names]
+        record_batches = parquet_file.iter_batches(batch_size=batch_size, columns=columns)
+
+    for record_batch in record_batches:
+        is_current = None
+        if "is_latest" in columns:
+            is_current = pyarrow.compute.fill_null(record_batch.column("is_latest"), True)
+        if "is_delete_marker" in columns:
+            is_not_delete_marker = pyarrow.compute.invert(
+                pyarrow.compute.fill_null(record_batch.column("is_delete_marker"), False)
+            )
+            is_current = (
+                is_not_delete_marker if is_current is None else pyarrow.compute.and_(is_current, is_not_delete_marker)
+            )
+        if is_current is not None:
+            record_batch = record_batch.filter(is_current)
+
+        mtimes = record_batch.column("last_modified_date")
+        mtimes = mtimes.cast(pyarrow.timestamp("s", tz=mtimes.type.tz), safe=False).cast(pyarrow.int64())
+        etags = (
+            [etag.strip('"') if etag else None for etag in record_batch.column("e_tag").to_pylist()]
+            if "e_tag" in columns
+            else [None] * record_batch.num_rows
+        )
+        yield record_batch.column("key").to_pylist(), record_batch.column("size").to_pylist(), mtimes.to_pylist(), etags
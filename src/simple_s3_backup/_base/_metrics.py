@@ -0,0 +1,90 @@
+import contextlib
+import json
+import os
+import time
+from collections.abc import Iterator
+
+from ._globals import BACKUP_DIRECTORY
+from ._utils import _get_today
+
+_METRICS_DIRECTORY = BACKUP_DIRECTORY / "metrics"
+
+
+def _get_task_name() -> str:
+    """The SLURM array task running this process (`<job>_<task>`), or the job or process ID outside of arrays."""
+    array_job_id = os.environ.get("SLURM_ARRAY_JOB_ID", None)
+    if array_job_id is not None:
+        return f"{array_job_id}_{os.environ.get('SLURM_ARRAY_TASK_ID', '0')}"
+
+    job_id = os.environ.get("SLURM_JOB_ID", None)
+    return job_id if job_id is not None else f"local_{os.getpid()}"
+
+
+def _record_metric(kind: str, name: str, duration_in_seconds: float, **fields) -> dict:
+    """
+    Append a record to the run log of this task, `metrics/<today>/<task>.jsonl`.
+
+    Each record is written with a single append of one line, so records from concurrent threads do not interleave.
+
+    Parameters
+    ----------
+    kind : str
+        Either "command" (a transfer or other subprocess), "phase" (a step of a larger operation), or "log" (an
+        event, such as a line of stderr, whose duration is the time elapsed since what it belongs to started).
+    name : str
+        What was measured, for example `s5cmd cp` or `update_manifest.hashing`.
+    duration_in_seconds : float
+        The wall time it took.
+    **fields
+        Any other values to record, such as the `prefix`, `bytes` (transferred), `surveyed_bytes` (measured or
+        listed without being transferred), `objects`, `errors`, and `retries`.
+
+    Returns
+    -------
+    dict
+        The record.
+    """
+    record = {
+        "time": time.time(),
+        "task": _get_task_name(),
+        "kind": kind,
+        "name": name,
+        "duration": round(duration_in_seconds, 6),
+        **fields,
+    }
+
+    run_log_file_path = _METRICS_DIRECTORY / _get_today() / f"{_get_task_name()}.jsonl"
+    try:
+        run_log_file_path.parent.mkdir(parents=True, exist_ok=True)
+        with run_log_file_path.open(mode="a") as file_stream:
+            file_stream.write(json.dumps(record) + "\n")
+    except OSError as exception:  # Metrics must never interrupt a backup
+        print(f"Unable to record metric to {run_log_file_path}: {exception}")
+
+    return record
+
+
+@contextlib.contextmanager
+def _measure(kind: str, name: str, **fields) -> Iterator[dict]:
+    """
+    Time the body of a `with` block and record it with `_record_metric`.
+
+    The yielded dictionary starts with the given fields and may be updated within the block, for example with the
+    number of bytes moved, before the record is written. The record is written even if the block raises.
+    """
+    start_time = time.perf_counter()
+    try:
+        yield fields
+    finally:
+        _record_metric(kind=kind, name=name, duration_in_seconds=time.perf_counter() - start_time, **fields)
+
+
+def _iter_metric_records(day: str) -> Iterator[dict]:
+    """Yield every record of the run logs of a day, skipping lines torn by preemption."""
+    for run_log_file_path in sorted((_METRICS_DIRECTORY / day).glob("*.jsonl")):
+        with run_log_file_path.open(mode="r") as file_stream:
+            for line in file_stream:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
@@ -0,0 +1,114 @@
+import collections
+import json
+import pathlib
+
+from ._globals import BACKUP_DIRECTORY, DANDI_BUCKET
+from ._metrics import _measure
+from ._s5cmd import _run_s5cmd_batch
+from ._streaming import _stream_subprocess
+from ._zarr import _diff_manifests
+
+_NONBLOBS_MANIFESTS_DIRECTORY = BACKUP_DIRECTORY / "manifests" / "nonblobs"
+_SKIP_KEYS = ("blobs", "zarr", "dandiarchive")
+
+
+def _list_nonblob_prefix(prefix: str, recursive: bool) -> list[tuple[str, str, int, str]]:
+    """
+    List the objects (and, if not recursive, the sub-directories) under a prefix of the bucket.
+
+    Returns
+    -------
+    list of tuple of str, str, int, and str
+        The type (`file` or `directory`), key, size, and ETag of each entry.
+    """
+    source = f"s3://{DANDI_BUCKET}/{prefix}*" if recursive is True else f"s3://{DANDI_BUCKET}/{prefix}"
+    entries = []
+    with _measure(kind="command", name="s5cmd ls", prefix=prefix) as metric:
+        for line in _stream_subprocess(command=f"s5cmd --json ls '{source}'"):
+            record = json.loads(line)
+            key = record["key"].removeprefix(f"s3://{DANDI_BUCKET}/")
+            entries.append((record["type"], key, record.get("size", 0), record.get("etag", "").strip('"')))
+        metric.update(objects=len(entries))
+
+    return entries
+
+
+def _get_nonblob_locations() -> list[tuple[str, str, int, str]]:
+    """The top-level entries of the bucket other than blobs and Zarr stores."""
+    return [
+        entry
+        for entry in _list_nonblob_prefix(prefix="", recursive=False)
+        if not any(skip_key in entry[1] for skip_key in _SKIP_KEYS)
+    ]
+
+
+def _sync_nonblob_location(
+    location: str,
+    entries: list[tuple[str, str, int, str]],
+    destination: pathlib.Path,
+    number_of_workers: int = 64,
+) -> collections.Counter:
+    """
+    Incrementally copy a single top-level location, fetching only the objects that changed since its last sync.
+
+    Each location has a manifest at `manifests/nonblobs/<location>.tsv` holding the key, size, and ETag of every
+    object at its last successful sync, sorted by key. The fresh listing is merge-joined against it, and only new or
+    modified objects are copied through one `s5cmd run`, so an unchanged location costs only its listing. As for Zarr
+    stores, the manifest is only replaced once all changes have been copied, and objects removed remotely are counted
+    but not deleted locally.
+
+    Parameters
+    ----------
+    location : str
+        The top-level location, for example `dandisets/` or `README.md`.
+    entries : list of tuple of str, str, int, and str
+        The type, key, size, and ETag of every object in the location, sorted by key in byte order.
+    destination : pathlib.Path
+        The local directory mirroring the top level of the bucket.
+    number_of_workers : int, default: 64
+        The number of s5cmd workers used to copy the changed objects.
+
+    Returns
+    -------
+    collections.Counter
+        The number of objects listed, `changed`, `deleted`, and copied (`objects`), the copy `errors`, and the bytes
+        copied.
+    """
+    _NONBLOBS_MANIFESTS_DIRECTORY.mkdir(parents=True, exist_ok=True)
+    name = location.removesuffix("/")
+    manifest_file_path = _NONBLOBS_MANIFESTS_DIRECTORY / f"{name}.tsv"
+    listing_file_path = _NONBLOBS_MANIFESTS_DIRECTORY / f"{name}.tsv.new"
+    with listing_file_path.open(mode="w") as file_stream:
+        file_stream.writelines(f"{key}\t{size}\t{etag}\n" for _, key, size, etag in entries)
+
+    # Without a manifest (the first sync), let s5cmd skip local copies that are already up to date
+    copy_flags = "" if manifest_file_path.exists() else "--if-size-differ --if-source-newer "
+    summary = collections.Counter(listed=0, changed=0, deleted=0, objects=0, errors=0, bytes=0)
+    commands = []
+    for status, key in _diff_manifests(
+        previous_manifest_file_path=manifest_file_path, current_manifest_file_path=listing_file_path
+    ):
+        summary[status] += 1
+        if status == "changed":
+            commands.append(f"cp {copy_flags}s3://{DANDI_BUCKET}/{key} {destination}/{key}")
+
+    if len(commands) > 0:
+        summary.update(
+            _run_s5cmd_batch(
+                commands=commands,
+                command_file_path=BACKUP_DIRECTORY / "batches" / f"nonblobs_{name}.txt",
+                number_of_workers=number_of_workers,
+                prefix=location,
+            )
+        )
+
+    if summary["errors"] == 0:
+        listing_file_path.replace(manifest_file_path)
+    else:
+        listing_file_path.unlink()
+
+    print(
+        f"{location}: {summary['listed']} objects listed, {summary['changed']} new or modified, "
+        f"{summary['deleted']} removed remotely, {summary['errors']} errors"
+    )
+    return summary
@@ -0,0 +1,207 @@
+import collections
+import concurrent.futures
+import os
+import pathlib
+import re
+import sqlite3
+import time
+from collections.abc import Iterator
+
+import yaml
+
+from ._globals import BACKUP_DIRECTORY, DANDI_ROOT
+from ._utils import _human_readable_size
+
+_SECONDS_PER_DAY = 86_400
+_PARTITION_PATTERN = re.compile(rf"^{re.escape(str(DANDI_ROOT))}/(?P<partition>[^/]+)/")
+
+
+class _QuarantineStore:
+    """
+    Indexed store of local blob copies awaiting deletion.
+
+    Each entry is a quarantined (`.rmv`) file, the path of the blob it replaces, and the time after which it may be
+    deleted. Entries live in a SQLite database indexed by expiry, so that adding an entry and finding the expired ones
+    do not require rewriting or scanning every pending removal.
+
+    Parameters
+    ----------
+    file_path : pathlib.Path
+        The path to the SQLite database.
+    """
+
+    def __init__(self, file_path: pathlib.Path) -> None:
+        self.file_path = file_path
+        self._connection = sqlite3.connect(database=file_path, timeout=60)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS quarantine ("
+            "path TEXT PRIMARY KEY, original_path TEXT NOT NULL, quarantined_at INTEGER NOT NULL, "
+            "expires_at INTEGER NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS quarantine_expiry ON quarantine (expires_at)")
+        self._connection.commit()
+
+    def __enter__(self) -> "_QuarantineStore":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self._connection.execute("SELECT COUNT(*) FROM quarantine").fetchone()[0]
+
+    def add(
+        self,
+        path: pathlib.Path | str,
+        original_path: pathlib.Path | str,
+        grace_period_in_days: int,
+        quarantined_at: int | None = None,
+    ) -> None:
+        quarantined_at = int(time.time()) if quarantined_at is None else quarantined_at
+        self._connection.execute(
+            "INSERT OR REPLACE INTO quarantine VALUES (?, ?, ?, ?)",
+            (str(path), str(original_path), quarantined_at, quarantined_at + grace_period_in_days * _SECONDS_PER_DAY),
+        )
+        self._connection.commit()
+
+    def update(self, other: "_QuarantineStore") -> None:
+        """Add every entry of another store, keeping their original times."""
+        rows = other._connection.execute("SELECT * FROM quarantine").fetchall()
+        self._connection.executemany("INSERT OR REPLACE INTO quarantine VALUES (?, ?, ?, ?)", rows)
+        self._connection.commit()
+
+    def iter_expired(self, now: float, batch_size: int = 1_000) -> Iterator[list[tuple[str, str]]]:
+        """Yield the (path, original path) of expired entries, in batches of at most `batch_size`, oldest first."""
+        # Read up front, since entries are deleted while the batches are being processed
+        expired_entries = self._connection.execute(
+            "SELECT path, original_path FROM quarantine WHERE expires_at <= ? ORDER BY expires_at", (int(now),)
+        ).fetchall()
+        for start in range(0, len(expired_entries), batch_size):
+            yield expired_entries[start : start + batch_size]
+
+    def remove(self, paths: list[str]) -> None:
+        self._connection.executemany("DELETE FROM quarantine WHERE path = ?", ((path,) for path in paths))
+        self._connection.commit()
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+class _LegacyPathLoader(yaml.SafeLoader):
+    """Safe YAML loader that also reads the `pathlib` paths once written as keys of `blobs_to_remove.yaml`."""
+
+
+_LegacyPathLoader.add_multi_constructor(
+    "tag:yaml.org,2002:python/object/apply:pathlib.",
+    lambda loader, suffix, node: str(pathlib.PurePosixPath(*loader.construct_sequence(node))),
+)
+
+
+def _open_quarantine_store(manifests_directory: pathlib.Path) -> _QuarantineStore:
+    """
+    Open the quarantine store in a manifests directory, migrating any legacy `blobs_to_remove.yaml` file into it.
+
+    The legacy file only records a grace period in days, so migrated entries are considered quarantined as of the
+    last modification of the file.
+    """
+    quarantine_store = _QuarantineStore(file_path=manifests_directory / "quarantine.sqlite")
+
+    legacy_blobs_to_remove_file_path = manifests_directory / "blobs_to_remove.yaml"
+    if legacy_blobs_to_remove_file_path.exists():
+        with legacy_blobs_to_remove_file_path.open(mode="r") as file_stream:
+            path_to_grace_period_in_days = yaml.load(stream=file_stream, Loader=_LegacyPathLoader) or dict()
+
+        quarantined_at = int(legacy_blobs_to_remove_file_path.stat().st_mtime)
+        for path, grace_period_in_days in path_to_grace_period_in_days.items():
+            quarantine_store.add(
+                path=path,
+                original_path=str(path).removesuffix(".rmv"),
+                grace_period_in_days=int(grace_period_in_days),
+                quarantined_at=quarantined_at,
+            )
+        legacy_blobs_to_remove_file_path.rename(legacy_blobs_to_remove_file_path.with_suffix(".yaml.migrated"))
+
+    return quarantine_store
+
+
+def collect_dandi_garbage(max_workers: int = 16, batch_size: int = 1_000, dry_run: bool = False) -> dict:
+    """
+    Delete the quarantined blob copies whose grace period has expired.
+
+    Expired entries are processed in batches, each deleted across a pool of threads. A copy is only deleted once
+    the blob it stands in for has been downloaded again (its original path exists); otherwise it is kept for a later
+    run. Entries whose file is already gone are dropped.
+
+    Parameters
+    ----------
+    max_workers : int, default: 16
+        The number of files deleted concurrently.
+    batch_size : int, default: 1,000
+        The number of expired entries taken from the store at a time.
+    dry_run : bool, default: False
+        Whether to only report what would be deleted.
+
+    Returns
+    -------
+    dict
+        For each partition, the number of files deleted and the bytes reclaimed, along with the number of entries
+        that were awaiting replacement or already gone.
+    """
+    manifests_directory = BACKUP_DIRECTORY / "manifests"
+    partition_to_summary = collections.defaultdict(lambda: collections.Counter(files=0, bytes=0))
+    summary = collections.Counter(awaiting_replacement=0, missing=0)
+
+    with _open_quarantine_store(manifests_directory=manifests_directory) as quarantine_store:
+        print(f"{len(quarantine_store)} quarantined blobs.")
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for batch in quarantine_store.iter_expired(now=time.time(), batch_size=batch_size):
+                paths_to_forget = []
+                for path, status, reclaimed_size_in_bytes in executor.map(
+                    lambda entry: _remove_quarantined_file(path=entry[0], original_path=entry[1], dry_run=dry_run),
+                    batch,
+                ):
+                    if status == "awaiting_replacement":
+                        summary[status] += 1
+                        continue
+
+                    paths_to_forget.append(path)
+                    if status == "missing":
+                        summary[status] += 1
+                        continue
+
+                    match = _PARTITION_PATTERN.match(path)
+                    partition = match.group("partition") if match is not None else "other"
+                    partition_to_summary[partition]["files"] += 1
+                    partition_to_summary[partition]["bytes"] += reclaimed_size_in_bytes
+
+                if dry_run is False:
+                    quarantine_store.remove(paths=paths_to_forget)
+
+    verb = "Would reclaim" if dry_run is True else "Reclaimed"
+    for partition, partition_summary in sorted(partition_to_summary.items()):
+        print(
+            f"{verb} {_human_readable_size(size_in_bytes=partition_summary['bytes'])} "
+            f"from {partition_summary['files']} files on partition {partition}."
+        )
+    print(f"{summary['awaiting_replacement']} awaiting replacement, {summary['missing']} already gone.")
+
+    return {"partitions": {key: dict(value) for key, value in partition_to_summary.items()}, **summary}
+
+
+def _remove_quarantined_file(path: str, original_path: str, dry_run: bool) -> tuple[str, str, int]:
+    """Delete a quarantined file, returning its path, what happened, and the bytes reclaimed (by allocated size)."""
+    try:
+        stat_result = os.stat(path, follow_symlinks=False)
+    except FileNotFoundError:
+        return path, "missing", 0
+
+    if not os.path.exists(original_path):
+        return path, "awaiting_replacement", 0
+
+    if dry_run is False:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            return path, "missing", 0
+
+    return path, "deleted", stat_result.st_blocks * 512
@@ -0,0 +1,170 @@
+import dataclasses
+import datetime
+import json
+import pathlib
+from collections.abc import Container
+
+from ._globals import BLOBS_HEAD_TO_PARTITION, DANDI_ROOT
+from ._inventory import _BLOB_ID_WIDTH, _BlobInventory
+
+_CASES = ("1", "2", "3a", "3b", "4", "missing_remote_checksum", "local_only")
+
+
+@dataclasses.dataclass
+class _ReconciliationReport:
+    """
+    The classification of every remote blob into the cases of `update_manifest`.
+
+    Cases "2" and "4" still require a checksum comparison to be resolved (into 2a/2b, or a mismatch for 4).
+    Blobs in "missing_remote_checksum" would have needed that comparison but have neither a remote SHA-256 nor an
+    ETag to compare against, while "local_only" blobs exist locally but are no longer listed remotely.
+
+    For every case other than "1", "4", and "local_only", the remote size, remote mtime, local size, and local mtime
+    of each blob are kept in `blob_id_to_details` for reporting.
+    """
+
+    case_to_blob_ids: dict[str, list[str]] = dataclasses.field(
+        default_factory=lambda: {case: list() for case in _CASES}
+    )
+    blob_id_to_details: dict[str, tuple[int, int, int, int]] = dataclasses.field(default_factory=dict)
+
+    def get_counts(self) -> dict[str, int]:
+        return {case: len(blob_ids) for case, blob_ids in self.case_to_blob_ids.items()}
+
+    def write(self, file_path: pathlib.Path) -> None:
+        """Write the counts and blob IDs of each case as JSON, atomically."""
+        report = {
+            "generated": datetime.datetime.now(tz=datetime.timezone.utc).isoformat(timespec="seconds"),
+            "counts": self.get_counts(),
+            "blob_ids": self.case_to_blob_ids,
+        }
+
+        temporary_file_path = file_path.with_suffix(".tmp")
+        with temporary_file_path.open(mode="w") as file_stream:
+            json.dump(obj=report, fp=file_stream, indent=1)
+        temporary_file_path.replace(file_path)
+
+
+def _classify_blobs(
+    remote_inventory: _BlobInventory,
+    local_inventory: _BlobInventory,
+    remote_checksums: Container[str],
+    limit: int | None = None,
+) -> _ReconciliationReport:
+    """
+    Classify every remote blob by merge-joining the remote and local inventories.
+
+    Both inventories are sorted by blob ID, so a single pass over their columns pairs each remote blob with its local
+    copy, if any, and the case follows from integer comparisons of the aligned sizes and mtimes. No filesystem calls
+    are made: the local state comes entirely from the bulk scan. The join stays a Python loop, at about 1 to 2
+    seconds per million remote blobs, which is small next to listing or hashing them.
+
+    Parameters
+    ----------
+    remote_inventory : _BlobInventory
+        The remote blobs, sorted by blob ID.
+    local_inventory : _BlobInventory
+        The local blobs, sorted by blob ID.
+    remote_checksums : container of str
+        The blob IDs for which a remote SHA-256 checksum is known. Blobs without one can still be compared by the
+        ETag of their listing, if any.
+    limit : int, optional
+        Only classify this many remote blobs (in blob ID order).
+
+    Returns
+    -------
+    _ReconciliationReport
+        The blob IDs in each case.
+    """
+    report = _ReconciliationReport()
+    case_to_blob_ids = report.case_to_blob_ids
+
+    remote_blob_ids = bytes(remote_inventory.blob_ids)
+    remote_sizes = remote_inventory.sizes
+    remote_mtimes = remote_inventory.mtimes
+    remote_etag_parts = remote_inventory.etag_parts
+    local_blob_ids = bytes(local_inventory.blob_ids)
+    local_sizes = local_inventory.sizes
+    local_mtimes = local_inventory.mtimes
+
+    number_of_remote_blobs = len(remote_inventory) if limit is None else min(limit, len(remote_inventory))
+    number_of_local_blobs = len(local_inventory)
+    local_index = 0
+    for remote_index in range(number_of_remote_blobs):
+        remote_start = remote_index * _BLOB_ID_WIDTH
+        remote_blob_id = remote_blob_ids[remote_start : remote_start + _BLOB_ID_WIDTH]
+
+        local_blob_id = b""
+        while local_index < number_of_local_blobs:
+            local_start = local_index * _BLOB_ID_WIDTH
+            local_blob_id = local_blob_ids[local_start : local_start + _BLOB_ID_WIDTH]
+            if local_blob_id >= remote_blob_id:
+                break
+            case_to_blob_ids["local_only"].append(local_blob_id.decode("ascii"))
+            local_index += 1
+
+        blob_id = remote_blob_id.decode("ascii")
+
+        # Case 1: Local copy of blob on remote does not exist
+        if local_index >= number_of_local_blobs or local_blob_id != remote_blob_id:
+            case_to_blob_ids["1"].append(blob_id)
+            continue
+
+        remote_size = remote_sizes[remote_index]
+        remote_mtime = remote_mtimes[remote_index]
+        local_size = local_sizes[local_index]
+        local_mtime = local_mtimes[local_index]
+        local_index += 1
+
+        # Case 2: Local copy of blob exists, but mtime on remote is newer
+        # Case 3: Local mtime is after remote mtime, but size differs
+        # Case 4: Local mtime is after remote mtime and size matches
+        if local_mtime < remote_mtime:
+            case = "2"
+        elif local_size < remote_size:
+            case = "3a"
+        elif local_size > remote_size:
+            case = "3b"
+        else:
+            case = "4"
+
+        if case in ("2", "4") and blob_id not in remote_checksums and remote_etag_parts[remote_index] < 0:
+            case = "missing_remote_checksum"
+
+        case_to_blob_ids[case].append(blob_id)
+        if case != "4":
+            report.blob_id_to_details[blob_id] = (remote_size, remote_mtime, local_size, local_mtime)
+
+    # Local blobs after the last remote one are only orphans when the whole remote inventory was classified
+    if number_of_remote_blobs == len(remote_inventory):
+        for local_start in range(local_index * _BLOB_ID_WIDTH, len(local_blob_ids), _BLOB_ID_WIDTH):
+            case_to_blob_ids["local_only"].append(
+                local_blob_ids[local_start : local_start + _BLOB_ID_WIDTH].decode("ascii")
+            )
+
+    return report
+
+
+def _get_local_blob_file_path(blob_id: str) -> pathlib.Path:
+    partition = BLOBS_HEAD_TO_PARTITION[int(blob_id[0], 16)]
+    return DANDI_ROOT / partition / "s3dandiarchive" / "blobs" / blob_id[:3] / blob_id[3:6] / blob_id
+
+
+def _get_shard_prefix_range(shard_index: int, number_of_shards: int) -> tuple[str, str | None]:
+    """
+    The range of three-hex-digit blob prefixes covered by a shard, as an inclusive start and exclusive stop.
+
+    Shards are contiguous ranges of blob IDs, so that each maps to a slice of a sorted inventory; with 16 shards,
+    each covers exactly one first hex digit. The stop is None for the last shard.
+    """
+    if not 0 <= shard_index < number_of_shards <= 4096:
+        message = f"Invalid shard {shard_index}/{number_of_shards}; expected 0 <= N < M <= 4096."
+        raise ValueError(message)
+
+    start = f"{shard_index * 4096 // number_of_shards:03x}"
+    stop = f"{(shard_index + 1) * 4096 // number_of_shards:03x}" if shard_index + 1 < number_of_shards else None
+    return start, stop
+
+
+def _summarize_report(report: _ReconciliationReport) -> str:
+    return ", ".join(f"{case}: {count}" for case, count in report.get_counts().items())
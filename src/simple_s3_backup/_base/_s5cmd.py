@@ -0,0 +1,135 @@
+import collections
+import json
+import pathlib
+import re
+import time
+from collections.abc import Iterable
+
+from ._metrics import _measure
+from ._streaming import _stream_subprocess
+from ._utils import _deploy_subprocess, _human_readable_size
+
+# What S3 answers when requests should be slowed down, as reported in the errors of s5cmd; a bare "503" may also
+# appear in a key or a request ID, so only the error code or the HTTP status is matched
+_THROTTLING_ERROR_PATTERN = re.compile(r"\bSlowDown\b|\bstatus code: 503\b")
+
+# What s5cmd reports when a wildcard matches nothing, such as a sub-prefix without any object yet
+_NO_OBJECT_FOUND_ERROR = "no object found"
+
+
+def _run_s5cmd_batch(
+    commands: list[str],
+    command_file_path: pathlib.Path,
+    number_of_workers: int = 256,
+    prefix: str | None = None,
+) -> collections.Counter:
+    """
+    Run many s5cmd operations through a single `s5cmd run` invocation.
+
+    The operations share one process and one pool of workers, rather than paying the startup, listing, and tail
+    latency of a separate `s5cmd` subprocess each. The JSON output of the run is written next to the command file
+    and summarized once it finishes.
+
+    Parameters
+    ----------
+    commands : list of str
+        The s5cmd operations to run, without the leading `s5cmd` (for example, `cp s3://bucket/key local/path`).
+    command_file_path : pathlib.Path
+        Where to write the command file. The output is written to the same path with a `.jsonl` suffix.
+    number_of_workers : int, default: 256
+        The value for `s5cmd --numworkers`.
+    prefix : str, optional
+        The prefix the operations cover, under which the run is recorded in the run log. Defaults to the name of the
+        command file.
+
+    Returns
+    -------
+    collections.Counter
+        The number of successful operations (`objects`), failed operations (`errors`), and bytes transferred.
+    """
+    command_file_path.parent.mkdir(parents=True, exist_ok=True)
+    command_file_path.write_text("\n".join(commands) + "\n")
+    output_file_path = command_file_path.with_suffix(".jsonl")
+
+    command = f"s5cmd --json --numworkers {number_of_workers} run {command_file_path} > {output_file_path} 2>&1"
+    print(command)
+    with _measure(kind="command", name="s5cmd run", prefix=prefix or command_file_path.stem) as metric:
+        start_time = time.time()
+        _deploy_subprocess(command=command, ignore_errors=True)
+        duration_in_seconds = max(time.time() - start_time, 1e-6)
+
+        summary = _summarize_s5cmd_output(file_path=output_file_path)
+        metric.update(summary)
+    print(
+        f"Batch {command_file_path.stem}: {len(commands)} commands, {summary['objects']} objects, "
+        f"{_human_readable_size(size_in_bytes=summary['bytes'])} in {duration_in_seconds:.1f} s "
+        f"({_human_readable_size(size_in_bytes=int(summary['bytes'] / duration_in_seconds))}/s), "
+        f"{summary['errors']} errors"
+    )
+    return summary
+
+
+def _run_s5cmd_command(command: str, prefix: str | None = None) -> collections.Counter:
+    """
+    Run a single s5cmd operation, summarizing its `--json` output as it streams.
+
+    Parameters
+    ----------
+    command : str
+        The s5cmd operation to run, without the leading `s5cmd`.
+    prefix : str, optional
+        The prefix the operation covers, under which it is recorded in the run log.
+
+    Returns
+    -------
+    collections.Counter
+        The number of successful operations (`objects`), failed operations (`errors`), and bytes transferred.
+    """
+    operation = command.split(maxsplit=1)[0]
+    command = f"s5cmd --json {command} 2>&1"
+    print(command)
+    with _measure(kind="command", name=f"s5cmd {operation}", prefix=prefix) as metric:
+        summary = _summarize_s5cmd_records(lines=_stream_subprocess(command=command, ignore_errors=True))
+        metric.update(summary)
+
+    return summary
+
+
+def _summarize_s5cmd_output(file_path: pathlib.Path) -> collections.Counter:
+    """
+    Count the operations and bytes reported by the `--json` output of s5cmd.
+
+    Parameters
+    ----------
+    file_path : pathlib.Path
+        The file containing the output, one JSON object per line.
+
+    Returns
+    -------
+    collections.Counter
+        The number of successful operations (`objects`), failed operations (`errors`), failures due to throttling
+        by S3 (`throttled`), operations whose source matched no object (`empty`, not counted as errors), and bytes
+        transferred.
+    """
+    with file_path.open(mode="r") as file_stream:
+        return _summarize_s5cmd_records(lines=file_stream)
+
+
+def _summarize_s5cmd_records(lines: Iterable[str]) -> collections.Counter:
+    summary = collections.Counter(objects=0, errors=0, throttled=0, empty=0, bytes=0)
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+
+        if record.get("success", False) is True:
+            summary["objects"] += 1
+            summary["bytes"] += record.get("object", dict()).get("size", 0)
+        elif "error" in record and _NO_OBJECT_FOUND_ERROR in str(record["error"]):
+            summary["empty"] += 1
+        elif "error" in record:
+            summary["errors"] += 1
+            summary["throttled"] += _THROTTLING_ERROR_PATTERN.search(str(record["error"])) is not None
+
+    return summary
@@ -0,0 +1,365 @@
+import collections
+import concurrent.futures
+import dataclasses
+import json
+import os
+import pathlib
+from collections.abc import Iterator
+
+from ._inventory import _BLOB_ID_WIDTH, _BlobInventory
+
+
+@dataclasses.dataclass
+class _TreeUsage:
+    """
+    Disk usage of a directory tree.
+
+    `size_in_bytes` is the apparent size of the files (the sum of `st_size`, comparable to the remote object sizes),
+    while `allocated_in_bytes` is the space actually taken on disk by files and directories (the sum of `st_blocks`,
+    as reported by `du`). The two generally differ, through block rounding, directories, sparse files, or transparent
+    compression; `s3backup dandi benchmark --mode scan` logs both next to the output of `du` for a synthetic tree.
+    """
+
+    size_in_bytes: int = 0
+    allocated_in_bytes: int = 0
+    object_count: int = 0
+
+    def __add__(self, other: "_TreeUsage") -> "_TreeUsage":
+        return _TreeUsage(
+            size_in_bytes=self.size_in_bytes + other.size_in_bytes,
+            allocated_in_bytes=self.allocated_in_bytes + other.allocated_in_bytes,
+            object_count=self.object_count + other.object_count,
+        )
+
+
+def _scan_tree(path: str | os.PathLike) -> _TreeUsage:
+    """
+    Walk a directory tree in a single pass, collecting its apparent size, allocated size, and file count.
+
+    Uses `os.scandir` so that file types come from the directory listing itself and each file costs exactly one
+    `stat` call (cached on its `DirEntry`), instead of the several calls made by `rglob` followed by `is_file` and
+    `stat`. Symbolic links are not followed.
+
+    Parameters
+    ----------
+    path : str or os.PathLike
+        The root of the tree. May also be a single file; a missing path has no usage.
+
+    Returns
+    -------
+    _TreeUsage
+        The usage of the tree.
+    """
+    usage = _TreeUsage()
+    try:
+        stat_result = os.stat(path, follow_symlinks=False)
+    except FileNotFoundError:
+        return usage
+    if not os.path.isdir(path):
+        return _TreeUsage(
+            size_in_bytes=stat_result.st_size, allocated_in_bytes=stat_result.st_blocks * 512, object_count=1
+        )
+    usage.allocated_in_bytes += stat_result.st_blocks * 512
+
+    directories = [os.fspath(path)]
+    while directories:
+        try:
+            entries = os.scandir(directories.pop())
+        except FileNotFoundError:  # Removed while scanning
+            continue
+
+        with entries:
+            for entry in entries:
+                is_directory = entry.is_dir(follow_symlinks=False)
+                if not is_directory and not entry.is_file(follow_symlinks=False):
+                    continue
+
+                try:
+                    entry_stat = entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                usage.allocated_in_bytes += entry_stat.st_blocks * 512
+
+                if is_directory:
+                    directories.append(entry.path)
+                else:
+                    usage.size_in_bytes += entry_stat.st_size
+                    usage.object_count += 1
+
+    return usage
+
+
+def _scan_tree_by_prefix(
+    path: pathlib.Path,
+    max_workers: int = 16,
+    cache_file_path: pathlib.Path | None = None,
+    signature_depth: int | None = None,
+) -> dict[str, _TreeUsage]:
+    """
+    Scan each top-level entry (prefix) of a directory tree in parallel.
+
+    If a cache file is given, the usage of each prefix is stored in it along with a signature: the latest
+    modification time of the directories within the prefix. Since creating, removing, or renaming a file updates the
+    modification time of its parent directory, a prefix whose signature is unchanged is taken from the cache
+    instead of being scanned again, which only costs a `stat` per directory rather than per file.
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        The root of the tree.
+    max_workers : int, default: 16
+        The number of prefixes scanned concurrently. Scanning is dominated by filesystem latency, during which
+        threads release the GIL.
+    cache_file_path : pathlib.Path, optional
+        The JSON file in which to cache the usage of each prefix.
+    signature_depth : int, optional
+        How many levels of directories below each prefix contribute to its signature. Defaults to all of them; for
+        the blobs tree (`abc/def/<blob ID>`) a depth of 1 covers every directory that holds files.
+
+    Returns
+    -------
+    dict of str to _TreeUsage
+        The usage of each top-level entry, keyed by its name.
+    """
+    if not path.is_dir():
+        return dict()
+
+    with os.scandir(path) as entries:
+        prefix_to_path = {entry.name: entry.path for entry in entries}
+
+    if cache_file_path is None:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            prefix_to_future = {
+                prefix: executor.submit(_scan_tree, prefix_path) for prefix, prefix_path in prefix_to_path.items()
+            }
+            return {prefix: future.result() for prefix, future in prefix_to_future.items()}
+
+    prefix_to_cached_entry = dict()
+    if cache_file_path.exists():
+        with cache_file_path.open(mode="r") as file_stream:
+            prefix_to_cached_entry = json.load(fp=file_stream)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        prefix_to_future = {
+            prefix: executor.submit(
+                _scan_prefix_with_cache,
+                prefix_path,
+                prefix_to_cached_entry.get(prefix, None),
+                signature_depth,
+            )
+            for prefix, prefix_path in prefix_to_path.items()
+        }
+        prefix_to_entry = {prefix: future.result() for prefix, future in prefix_to_future.items()}
+
+    number_of_rescanned_prefixes = sum(
+        prefix_to_entry[prefix] is not prefix_to_cached_entry.get(prefix, None) for prefix in prefix_to_entry
+    )
+    print(f"Scanned {number_of_rescanned_prefixes} of {len(prefix_to_entry)} prefixes under {path}.")
+
+    cache_file_path.parent.mkdir(parents=True, exist_ok=True)
+    temporary_cache_file_path = cache_file_path.with_suffix(".tmp")
+    with temporary_cache_file_path.open(mode="w") as file_stream:
+        json.dump(obj=prefix_to_entry, fp=file_stream)
+    temporary_cache_file_path.replace(cache_file_path)
+
+    return {
+        prefix: _TreeUsage(
+            size_in_bytes=entry["size_in_bytes"],
+            allocated_in_bytes=entry["allocated_in_bytes"],
+            object_count=entry["object_count"],
+        )
+        for prefix, entry in prefix_to_entry.items()
+    }
+
+
+def _scan_prefix_with_cache(path: str, cached_entry: dict | None, signature_depth: int | None) -> dict:
+    signature = _get_directory_signature(path=path, depth=signature_depth)
+    if cached_entry is not None and cached_entry["signature"] == signature:
+        return cached_entry
+
+    usage = _scan_tree(path=path)
+    return {"signature": signature, **dataclasses.asdict(usage)}
+
+
+def _get_directory_signature(path: str, depth: int | None) -> int:
+    """
+    Get the latest modification time (in nanoseconds) of a directory and its subdirectories down to a given depth.
+
+    For a file, this is the modification time of the file itself.
+    """
+    try:
+        signature = os.stat(path, follow_symlinks=False).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+    if not os.path.isdir(path):
+        return signature
+
+    directories = [(path, 0)]
+    while directories:
+        directory, level = directories.pop()
+        if depth is not None and level >= depth:
+            continue
+
+        try:
+            entries = os.scandir(directory)
+        except FileNotFoundError:
+            continue
+
+        with entries:
+            for entry in entries:
+                if not entry.is_dir(follow_symlinks=False):
+                    continue
+
+                try:
+                    signature = max(signature, entry.stat(follow_symlinks=False).st_mtime_ns)
+                except FileNotFoundError:
+                    continue
+                directories.append((entry.path, level + 1))
+
+    return signature
+
+
+def _scan_local_blobs(
+    blobs_directories: list[pathlib.Path],
+    max_workers: int = 16,
+    prefix_range: tuple[str, str | None] | None = None,
+) -> _BlobInventory:
+    """
+    Collect the size and modification time of every local blob into a columnar inventory sorted by blob ID.
+
+    Each `abc/def` directory is listed with `os.scandir` and each blob costs a single `stat`, with the directories
+    scanned concurrently. Entries that are not blobs (such as `.rmv` copies awaiting removal) are skipped.
+
+    The `abc` directories are walked in sorted order (merged across partitions), and the `def` directories of each
+    are submitted through a sliding window of at most `2 * max_workers` in flight, whose results are appended in
+    submission order as they complete. Visiting the directories in `abc/def` order, with each one sorted, yields the
+    blob IDs already in sorted order, without ever holding the list of every directory or more than a window of
+    pending results.
+
+    Parameters
+    ----------
+    blobs_directories : list of pathlib.Path
+        The local `blobs` directories, one per partition.
+    max_workers : int, default: 16
+        The number of directories scanned concurrently.
+    prefix_range : tuple of str and str or None, optional
+        Only scan the `abc` directories from the first prefix up to, but excluding, the second (or to the end if
+        None).
+
+    Returns
+    -------
+    _BlobInventory
+        The local blob inventory, with modification times truncated to whole seconds.
+    """
+    prefix_to_paths = collections.defaultdict(list)
+    for blobs_directory in blobs_directories:
+        if not blobs_directory.is_dir():
+            continue
+
+        with os.scandir(blobs_directory) as prefix_entries:
+            for prefix_entry in prefix_entries:
+                if not prefix_entry.is_dir(follow_symlinks=False):
+                    continue
+                if prefix_range is not None:
+                    start, stop = prefix_range
+                    if prefix_entry.name < start or (stop is not None and prefix_entry.name >= stop):
+                        continue
+                prefix_to_paths[prefix_entry.name].append(prefix_entry.path)
+
+    inventory = _BlobInventory()
+    pending_futures = collections.deque()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for leaf_path in _iter_leaf_directories(prefix_to_paths=prefix_to_paths):
+            if len(pending_futures) >= 2 * max_workers:
+                _append_blob_records(inventory=inventory, records=pending_futures.popleft().result())
+            pending_futures.append(executor.submit(_scan_blob_directory, leaf_path))
+
+        while pending_futures:
+            _append_blob_records(inventory=inventory, records=pending_futures.popleft().result())
+
+    return inventory
+
+
+def _iter_leaf_directories(prefix_to_paths: dict[str, list[str]]) -> Iterator[str]:
+    """Yield the `abc/def` directories of the blobs trees in sorted order, listing one `abc` directory at a time."""
+    for prefix in sorted(prefix_to_paths):
+        leaf_directories = []
+        for prefix_path in prefix_to_paths[prefix]:
+            try:
+                leaf_entries = os.scandir(prefix_path)
+            except FileNotFoundError:  # Removed while scanning
+                continue
+
+            with leaf_entries:
+                leaf_directories.extend(
+                    (leaf_entry.name, leaf_entry.path)
+                    for leaf_entry in leaf_entries
+                    if leaf_entry.is_dir(follow_symlinks=False)
+                )
+
+        leaf_directories.sort()
+        yield from (leaf_path for _, leaf_path in leaf_directories)
+
+
+def _append_blob_records(inventory: _BlobInventory, records: list[tuple[bytes, int, int]]) -> None:
+    for blob_id, size, mtime in records:
+        inventory.append(blob_id=blob_id, size=size, mtime=mtime)
+
+
+def _scan_blob_directory(path: str) -> list[tuple[bytes, int, int]]:
+    records = []
+    try:
+        entries = os.scandir(path)
+    except FileNotFoundError:
+        return records
+
+    with entries:
+        for entry in entries:
+            if len(entry.name) != _BLOB_ID_WIDTH or not entry.is_file(follow_symlinks=False):
+                continue
+
+            try:
+                entry_stat = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            records.append((entry.name.encode("ascii"), entry_stat.st_size, int(entry_stat.st_mtime)))
+
+    records.sort()
+    return records
+
+
+def _stat_local_blobs(file_paths: list[pathlib.Path], max_workers: int = 16) -> _BlobInventory:
+    """
+    Collect the size and modification time of specific local blobs into a columnar inventory.
+
+    Unlike `_scan_local_blobs`, only the given blobs are looked at, with a single `stat` each, so the cost scales with
+    the number of blobs rather than with the size of the local tree. Blobs without a local copy are left out.
+
+    Parameters
+    ----------
+    file_paths : list of pathlib.Path
+        The local paths of the blobs, sorted by blob ID.
+    max_workers : int, default: 16
+        The number of blobs stat-ed concurrently.
+
+    Returns
+    -------
+    _BlobInventory
+        The local blob inventory, with modification times truncated to whole seconds.
+    """
+    inventory = _BlobInventory()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for file_path, stat_result in zip(file_paths, executor.map(_stat_or_none, file_paths)):
+            if stat_result is not None:
+                inventory.append(
+                    blob_id=file_path.name.encode("ascii"), size=stat_result.st_size, mtime=int(stat_result.st_mtime)
+                )
+
+    return inventory
+
+
+def _stat_or_none(file_path: pathlib.Path) -> os.stat_result | None:
+    try:
+        return os.stat(file_path, follow_symlinks=False)
+    except FileNotFoundError:
+        return None
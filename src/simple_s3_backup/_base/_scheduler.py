@@ -0,0 +1,306 @@
+import collections
+import concurrent.futures
+import contextlib
+import heapq
+import json
+import pathlib
+import threading
+import time
+import typing
+from collections.abc import Iterator
+
+from ._controller import _AIMDController, _run_s5cmd_batch_adaptively
+from ._display import _get_remote_du
+from ._globals import BACKUP_DIRECTORY, BLOBS_HEAD_TO_PARTITION, DANDI_BUCKET, DANDI_ROOT, ZARR_HEAD_TO_PARTITION
+from ._listing import _get_listing_source
+from ._metrics import _get_task_name
+from ._s5cmd import _run_s5cmd_batch
+from ._utils import _lock_file
+
+_PLANS_DIRECTORY = BACKUP_DIRECTORY / "plans"
+_LEASE_IN_SECONDS = 900
+
+
+def plan_dandi_backup(
+    kind: typing.Literal["blobs", "zarr"],
+    number_of_units: int = 64,
+    per_object_cost_in_bytes: int = 1_000_000,
+) -> pathlib.Path:
+    """
+    Split the backup of all blobs or Zarr stores into work units of balanced size and reset the claims on them.
+
+    The volume of each three-hex-digit prefix is taken from the remote blob inventory. For Zarr stores, it is taken
+    from the S3 Inventory report if one is configured, or measured with `s5cmd du` (skipping empty prefixes).
+    Prefixes are then bin-packed, largest first onto the least loaded unit, where the cost of a prefix is its size
+    plus a fixed cost per object to account for per-request latency. SLURM array tasks then claim units one at a time
+    with `s3backup dandi work` until none are left, so fast tasks keep taking work instead of idling while slow ones
+    finish.
+
+    Parameters
+    ----------
+    kind : "blobs" or "zarr"
+        What to plan the backup of.
+    number_of_units : int, default: 64
+        The number of work units to split the prefixes into.
+    per_object_cost_in_bytes : int, default: 1,000,000
+        The cost of each object, in equivalent bytes.
+
+    Returns
+    -------
+    pathlib.Path
+        The path to the plan file.
+    """
+    manifests_directory = BACKUP_DIRECTORY / "manifests"
+    manifests_directory.mkdir(exist_ok=True)
+    listing_source = _get_listing_source(manifests_directory=manifests_directory)
+    if kind == "blobs":
+        listing_source.refresh()
+        remote_inventory = listing_source.read_blob_inventory()
+
+        prefix_to_usage = collections.defaultdict(lambda: [0, 0])
+        for blob_id, size, _ in remote_inventory:
+            usage = prefix_to_usage[blob_id[:3]]
+            usage[0] += size
+            usage[1] += 1
+    else:
+        prefix_to_usage = {
+            unit.removeprefix("zarr/"): list(usage)
+            for unit, usage in listing_source.get_usage(prefix="zarr/", unit_width=3).items()
+        }
+        if len(prefix_to_usage) == 0:
+            prefixes = [f"{head:03x}" for head in range(4096)]
+            with concurrent.futures.ThreadPoolExecutor(max_workers=16) as executor:
+                prefix_to_usage = {
+                    unit.removeprefix("zarr/"): list(usage)
+                    for unit, usage in executor.map(_get_remote_du, (f"zarr/{prefix}" for prefix in prefixes))
+                    if usage[1] > 0
+                }
+
+    units = _pack_work_units(
+        prefix_to_usage=prefix_to_usage,
+        number_of_units=number_of_units,
+        per_object_cost_in_bytes=per_object_cost_in_bytes,
+    )
+
+    _PLANS_DIRECTORY.mkdir(parents=True, exist_ok=True)
+    plan_file_path = _PLANS_DIRECTORY / f"{kind}.json"
+    with _lock_plan(kind=kind):
+        temporary_plan_file_path = plan_file_path.with_suffix(".tmp")
+        with temporary_plan_file_path.open(mode="w") as file_stream:
+            json.dump(obj={"kind": kind, "units": units}, fp=file_stream, indent=1)
+        temporary_plan_file_path.replace(plan_file_path)
+        _write_claims(kind=kind, claims=dict())
+
+    print(f"Planned {len(units)} {kind} work units at {plan_file_path}")
+    return plan_file_path
+
+
+def work_dandi_backup(
+    kind: typing.Literal["blobs", "zarr"], number_of_workers: int = 256, adaptive: bool = False
+) -> None:
+    """
+    Claim and copy work units from the current plan until none are left.
+
+    Each claim carries a lease, renewed in the background while the unit is being copied, and the unit is marked done
+    once its copy completes. A unit whose lease has expired without it being done (because the task holding it was
+    preempted or killed) is issued again to the next task to claim work, and a task restarted by SLURM immediately
+    takes back the unit it was working on.
+
+    Parameters
+    ----------
+    kind : "blobs" or "zarr"
+        Which plan to take work units from.
+    number_of_workers : int, default: 256
+        The number of s5cmd workers used to copy each unit, or the most that may be used if `adaptive` is True.
+    adaptive : bool, default: False
+        Whether to copy each unit a few prefixes at a time, adjusting the number of workers and their bandwidth in
+        between from the throughput, throttling, and local write latency (see `_AIMDController`), within the global
+        caps set by `S3BACKUP_MAX_BANDWIDTH` and `S3BACKUP_MAX_WORKERS`.
+    """
+    controller = _AIMDController(workers=min(32, number_of_workers), max_workers=number_of_workers)
+    while (claimed := _claim_work_unit(kind=kind)) is not None:
+        unit_index, unit = claimed
+        print(f"Claimed {kind} work unit {unit_index} ({len(unit['prefixes'])} prefixes, {unit['bytes']} bytes)")
+
+        commands = [_get_prefix_copy_command(kind=kind, prefix=prefix) for prefix in unit["prefixes"]]
+        command_file_path = BACKUP_DIRECTORY / "batches" / f"{kind}_unit_{unit_index}.txt"
+        with _renew_work_unit_lease(kind=kind, unit_index=unit_index):
+            if adaptive is True:
+                # A unit may span partitions, so each is copied in turn with its own write latency probe
+                partition_to_commands = collections.defaultdict(list)
+                for prefix, command in zip(unit["prefixes"], commands):
+                    partition_to_commands[_get_prefix_partition(kind=kind, prefix=prefix)].append(command)
+
+                summary = collections.Counter(objects=0, errors=0, throttled=0, bytes=0)
+                for partition, partition_commands in partition_to_commands.items():
+                    summary.update(
+                        _run_s5cmd_batch_adaptively(
+                            commands=partition_commands,
+                            command_file_path=command_file_path.with_name(f"{kind}_unit_{unit_index}_{partition}.txt"),
+                            destination=DANDI_ROOT / partition / "s3dandiarchive" / kind,
+                            controller=controller,
+                            commands_per_run=4,
+                        )
+                    )
+            else:
+                summary = _run_s5cmd_batch(
+                    commands=commands, command_file_path=command_file_path, number_of_workers=number_of_workers
+                )
+
+        _complete_work_unit(kind=kind, unit_index=unit_index, errors=summary["errors"])
+
+
+def _pack_work_units(
+    prefix_to_usage: dict[str, list[int]], number_of_units: int, per_object_cost_in_bytes: int
+) -> list[dict]:
+    """
+    Bin-pack prefixes into work units using the longest-processing-time-first heuristic.
+
+    Parameters
+    ----------
+    prefix_to_usage : dict of str to list of int
+        The size in bytes and object count of each prefix.
+    number_of_units : int
+        The number of work units.
+    per_object_cost_in_bytes : int
+        The cost of each object, in equivalent bytes.
+
+    Returns
+    -------
+    list of dict
+        The work units, from most to least costly, each with its `prefixes`, `bytes`, `objects`, and `cost`.
+    """
+
+    def get_cost(prefix: str) -> int:
+        size_in_bytes, object_count = prefix_to_usage[prefix]
+        return size_in_bytes + object_count * per_object_cost_in_bytes
+
+    units = [{"prefixes": [], "bytes": 0, "objects": 0, "cost": 0} for _ in range(number_of_units)]
+    load_heap = [(0, unit_index) for unit_index in range(number_of_units)]
+    for prefix in sorted(prefix_to_usage, key=get_cost, reverse=True):
+        load, unit_index = heapq.heappop(load_heap)
+        unit = units[unit_index]
+        unit["prefixes"].append(prefix)
+        unit["bytes"] += prefix_to_usage[prefix][0]
+        unit["objects"] += prefix_to_usage[prefix][1]
+        unit["cost"] += get_cost(prefix)
+        heapq.heappush(load_heap, (unit["cost"], unit_index))
+
+    units = [unit for unit in units if len(unit["prefixes"]) > 0]
+    units.sort(key=lambda unit: unit["cost"], reverse=True)
+    return units
+
+
+def _claim_work_unit(kind: str, lease_in_seconds: float = _LEASE_IN_SECONDS) -> tuple[int, dict] | None:
+    """
+    Atomically take the next work unit of the plan that is neither done nor held, or return None if there is none.
+
+    A unit is held while its claim has been renewed within the last `lease_in_seconds`. A unit claimed but not done
+    by the current task is always taken back, since the task can only be claiming again after being restarted.
+    """
+    plan_file_path = _PLANS_DIRECTORY / f"{kind}.json"
+    if not plan_file_path.exists():
+        message = f"No {kind} plan exists; create one with `s3backup dandi plan {kind}`."
+        raise FileNotFoundError(message)
+
+    task = _get_task_name()
+    with _lock_plan(kind=kind):
+        with plan_file_path.open(mode="r") as file_stream:
+            units = json.load(fp=file_stream)["units"]
+        claims = _read_claims(kind=kind)
+
+        now = time.time()
+        for unit_index, unit in enumerate(units):
+            claim = claims.get(str(unit_index), None)
+            if claim is not None and (
+                claim["done"] is not None or (claim["task"] != task and now - claim["renewed"] < lease_in_seconds)
+            ):
+                continue
+
+            if claim is not None:
+                print(f"Re-issuing {kind} work unit {unit_index}, last renewed by task {claim['task']}.")
+            claims[str(unit_index)] = {"task": task, "claimed": now, "renewed": now, "done": None, "errors": None}
+            _write_claims(kind=kind, claims=claims)
+            return unit_index, unit
+
+    return None
+
+
+@contextlib.contextmanager
+def _renew_work_unit_lease(kind: str, unit_index: int, lease_in_seconds: float = _LEASE_IN_SECONDS) -> Iterator[None]:
+    """Renew the lease on a claimed work unit from a background thread, three times per lease, until exited."""
+    stopped = threading.Event()
+
+    def renew() -> None:
+        while stopped.wait(timeout=lease_in_seconds / 3) is False:
+            with _lock_plan(kind=kind):
+                claims = _read_claims(kind=kind)
+                claim = claims.get(str(unit_index), None)
+                if claim is None or claim["task"] != _get_task_name():  # Re-planned or re-issued meanwhile
+                    return
+                claim["renewed"] = time.time()
+                _write_claims(kind=kind, claims=claims)
+
+    thread = threading.Thread(target=renew, name=f"{kind}_unit_{unit_index}_lease", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def _complete_work_unit(kind: str, unit_index: int, errors: int) -> None:
+    """Mark a claimed work unit as done, along with the number of errors reported while copying it."""
+    with _lock_plan(kind=kind):
+        claims = _read_claims(kind=kind)
+        claim = claims.get(str(unit_index), None)
+        if claim is None or claim["task"] != _get_task_name():
+            print(f"Work unit {unit_index} of {kind} is no longer claimed by this task; not marking it done.")
+            return
+        claim.update(done=time.time(), errors=errors)
+        _write_claims(kind=kind, claims=claims)
+
+    print(f"Completed {kind} work unit {unit_index} with {errors} errors.")
+
+
+def _read_claims(kind: str) -> dict[str, dict]:
+    """Read the claims on the work units of a plan, keyed by unit index; must be called while holding its lock."""
+    claims_file_path = _PLANS_DIRECTORY / f"{kind}.claims.json"
+    if not claims_file_path.exists():
+        return dict()
+
+    with claims_file_path.open(mode="r") as file_stream:
+        return json.load(fp=file_stream)
+
+
+def _write_claims(kind: str, claims: dict[str, dict]) -> None:
+    """Atomically replace the claims on the work units of a plan; must be called while holding its lock."""
+    claims_file_path = _PLANS_DIRECTORY / f"{kind}.claims.json"
+    temporary_claims_file_path = claims_file_path.with_suffix(".tmp")
+    with temporary_claims_file_path.open(mode="w") as file_stream:
+        json.dump(obj=claims, fp=file_stream, indent=1)
+    temporary_claims_file_path.replace(claims_file_path)
+
+
+@contextlib.contextmanager
+def _lock_plan(kind: str) -> Iterator[None]:
+    """Hold an exclusive `flock` on the lock file of a plan, shared by all array tasks through the filesystem."""
+    with _lock_file(lock_file_path=_PLANS_DIRECTORY / f"{kind}.lock"):
+        yield
+
+
+def _get_prefix_partition(kind: str, prefix: str) -> str:
+    head = int(prefix[0], 16)
+    return BLOBS_HEAD_TO_PARTITION[head] if kind == "blobs" else ZARR_HEAD_TO_PARTITION[head]
+
+
+def _get_prefix_copy_command(kind: str, prefix: str) -> str:
+    partition = _get_prefix_partition(kind=kind, prefix=prefix)
+    if kind == "blobs":
+        source = f"s3://{DANDI_BUCKET}/blobs/{prefix}/*"
+        destination = f"{DANDI_ROOT}/{partition}/s3dandiarchive/blobs/{prefix}/"
+    else:
+        source = f"s3://{DANDI_BUCKET}/zarr/{prefix}*"
+        destination = f"{DANDI_ROOT}/{partition}/s3dandiarchive/zarr"  # No nested structure yet
+    return f"cp --if-size-differ --if-source-newer {source} {destination}"
@@ -0,0 +1,175 @@
+import json
+import pathlib
+import random
+import tempfile
+
+from tabulate2 import tabulate
+
+from ._controller import _MEBIBYTE, _AIMDController, _SharedTokenBucket
+from ._utils import _human_readable_size
+
+_BASE_WRITE_LATENCY_IN_SECONDS = 0.02
+
+
+def simulate_transfer_controller(
+    number_of_tasks: int = 16,
+    number_of_intervals: int = 120,
+    interval_in_seconds: float = 60.0,
+    worker_throughput_in_bytes_per_second: float = 8 * _MEBIBYTE,
+    object_size_in_bytes: int = _MEBIBYTE,
+    max_request_rate: float = 3_500.0,
+    filesystem_bandwidth_in_bytes_per_second: float = 2_048 * _MEBIBYTE,
+    max_bandwidth_in_bytes_per_second: float | None = None,
+    max_workers: int | None = None,
+    seed: int = 0,
+    output_file_path: pathlib.Path | None = None,
+) -> list[dict]:
+    """
+    Run the adaptive transfer controllers of many array tasks against a model of S3 and the shared filesystem.
+
+    Each task runs its own `_AIMDController`, and all share a `_SharedTokenBucket` in a temporary directory, driven
+    by a simulated clock. At each interval, every worker moves up to its own (noisy) throughput, capped by the
+    bandwidth its controller allows. S3 throttles the share of requests above `max_request_rate`, and the filesystem
+    delivers at most its bandwidth, with a write latency that grows as it saturates (as a single-server queue).
+    The observations of each task are then fed back to its controller, and any wait imposed by the bandwidth caps is
+    taken out of its next intervals.
+
+    Parameters
+    ----------
+    number_of_tasks : int, default: 16
+        The number of array tasks transferring concurrently.
+    number_of_intervals : int, default: 120
+        The number of control intervals to simulate.
+    interval_in_seconds : float, default: 60.0
+        The length of each interval.
+    worker_throughput_in_bytes_per_second : float, default: 8 MiB/s
+        The mean throughput of a single unconstrained worker.
+    object_size_in_bytes : int, default: 1 MiB
+        The size of each object, which sets the request rate for a given throughput.
+    max_request_rate : float, default: 3,500
+        The number of requests per second S3 serves before throttling.
+    filesystem_bandwidth_in_bytes_per_second : float, default: 2 GiB/s
+        The write bandwidth of the shared filesystem.
+    max_bandwidth_in_bytes_per_second : float, optional
+        The global bandwidth cap of the token bucket.
+    max_workers : int, optional
+        The global cap on the number of workers of the token bucket.
+    seed : int, default: 0
+        The seed of the noise on the throughput of the workers.
+    output_file_path : pathlib.Path, optional
+        A JSON file to write the state at each interval to.
+
+    Returns
+    -------
+    list of dict
+        The time, total workers, throughput, fraction of requests throttled, filesystem utilization, and write
+        latency at each interval.
+    """
+    generator = random.Random(seed)
+    controllers = [_AIMDController() for _ in range(number_of_tasks)]
+    task_to_wait_in_seconds = [0.0] * number_of_tasks
+
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        token_bucket = _SharedTokenBucket(
+            file_path=pathlib.Path(directory) / "transfers.json",
+            rate_in_bytes_per_second=max_bandwidth_in_bytes_per_second,
+            max_workers=max_workers,
+        )
+        for interval_index in range(number_of_intervals):
+            now = interval_index * interval_in_seconds
+
+            # What each task would move on its own, given its workers, their bandwidth, and its remaining wait
+            offered_rates = []
+            active_fractions = []
+            leased_workers = 0
+            for task_index, controller in enumerate(controllers):
+                controller.workers = token_bucket.lease_workers(
+                    task=str(task_index), workers=controller.workers, now=now
+                )
+                leased_workers += controller.workers
+                active_fraction = max(1 - task_to_wait_in_seconds[task_index] / interval_in_seconds, 0.0)
+                task_to_wait_in_seconds[task_index] = max(task_to_wait_in_seconds[task_index] - interval_in_seconds, 0)
+
+                worker_rate = worker_throughput_in_bytes_per_second * generator.lognormvariate(0.0, 0.1)
+                worker_rate = min(worker_rate, controller.bandwidth_per_worker_in_bytes_per_second)
+                offered_rates.append(controller.workers * worker_rate * active_fraction)
+                active_fractions.append(active_fraction)
+
+            # The shared constraints: throttling by S3, then the bandwidth and latency of the filesystem
+            request_rate = sum(offered_rates) / object_size_in_bytes
+            throttled_fraction = max(1 - max_request_rate / request_rate, 0.0) if request_rate > 0 else 0.0
+            write_rate = sum(offered_rates) * (1 - throttled_fraction)
+            utilization = write_rate / filesystem_bandwidth_in_bytes_per_second
+            delivered_fraction = (1 - throttled_fraction) * min(1 / utilization, 1.0) if utilization > 0 else 1.0
+            write_latency_in_seconds = _BASE_WRITE_LATENCY_IN_SECONDS / max(1 - utilization, 0.02)
+
+            throughput_in_bytes_per_second = 0.0
+            for task_index, controller in enumerate(controllers):
+                if active_fractions[task_index] == 0:
+                    continue
+
+                duration_in_seconds = interval_in_seconds * active_fractions[task_index]
+                delivered_in_bytes = offered_rates[task_index] * delivered_fraction * interval_in_seconds
+                requests = round(offered_rates[task_index] * interval_in_seconds / object_size_in_bytes)
+                throttled = round(requests * throttled_fraction)
+                throughput_in_bytes_per_second += delivered_in_bytes / interval_in_seconds
+
+                bandwidth_in_bytes_per_second = controller.workers * controller.bandwidth_per_worker_in_bytes_per_second
+                task_to_wait_in_seconds[task_index] += max(
+                    delivered_in_bytes / bandwidth_in_bytes_per_second - duration_in_seconds,
+                    token_bucket.acquire(amount_in_bytes=int(delivered_in_bytes), now=now + interval_in_seconds),
+                )
+                controller.update(
+                    bytes_transferred=int(delivered_in_bytes),
+                    duration_in_seconds=duration_in_seconds,
+                    requests=requests,
+                    throttled=throttled,
+                    errors=throttled,
+                    write_latency_in_seconds=write_latency_in_seconds,
+                )
+
+            rows.append(
+                {
+                    "time": now,
+                    "workers": leased_workers,
+                    "throughput": int(throughput_in_bytes_per_second),
+                    "throttled": round(throttled_fraction, 4),
+                    "utilization": round(utilization, 4),
+                    "write_latency": round(write_latency_in_seconds, 4),
+                }
+            )
+
+    step = max(len(rows) // 20, 1)
+    print(
+        tabulate(
+            [
+                [
+                    f"{row['time'] / 60:.0f} min",
+                    row["workers"],
+                    f"{_human_readable_size(size_in_bytes=row['throughput'], binary=True)}/s",
+                    f"{row['throttled']:.1%}",
+                    f"{row['utilization']:.0%}",
+                    f"{row['write_latency'] * 1_000:.0f} ms",
+                ]
+                for row in rows[::step]
+            ],
+            headers=["Time", "Workers", "Throughput", "Throttled", "Filesystem", "Write latency"],
+            tablefmt="github",
+        )
+    )
+
+    settled_rows = rows[len(rows) // 2 :]
+    mean_throughput = sum(row["throughput"] for row in settled_rows) / len(settled_rows)
+    print(
+        f"Over the second half: {_human_readable_size(size_in_bytes=int(mean_throughput), binary=True)}/s on average, "
+        f"{sum(row['throttled'] > 0 for row in settled_rows)} intervals throttled, "
+        f"{sum(row['write_latency'] > controllers[0].max_write_latency_in_seconds for row in settled_rows)} "
+        "intervals with slow writes."
+    )
+
+    if output_file_path is not None:
+        with output_file_path.open(mode="w") as file_stream:
+            json.dump(obj=rows, fp=file_stream, indent=1)
+
+    return rows
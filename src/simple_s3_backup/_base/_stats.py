@@ -0,0 +1,70 @@
+import collections
+import datetime
+import math
+
+from tabulate2 import tabulate
+
+from ._metrics import _METRICS_DIRECTORY, _iter_metric_records
+from ._utils import _get_today, _human_readable_size
+
+
+def summarize_dandi_metrics(days: int = 1, group_by: str = "prefix") -> list[dict]:
+    """
+    Aggregate the run logs of the last few days into latency percentiles and throughput.
+
+    Parameters
+    ----------
+    days : int, default: 1
+        How many days of run logs to include, counting today.
+    group_by : "prefix" or "task", default: "prefix"
+        Whether to aggregate per prefix or per SLURM array task. Either way, records are also split by name.
+
+    Returns
+    -------
+    list of dict
+        One row per group, with the number of records, the p50 and p95 durations in seconds, the total bytes
+        transferred and objects, the throughput, the bytes surveyed (measured by `s5cmd du`, listed, or scanned
+        locally, which are not transferred), and the errors and retries.
+    """
+    today = datetime.date.fromisoformat(_get_today())
+    group_to_records = collections.defaultdict(list)
+    for day_offset in range(days):
+        for record in _iter_metric_records(day=(today - datetime.timedelta(days=day_offset)).isoformat()):
+            if record.get("kind", None) == "log":
+                continue
+            group_to_records[(record["name"], record.get(group_by, None) or "-")].append(record)
+
+    rows = []
+    for (name, group), records in sorted(group_to_records.items()):
+        durations = sorted(record["duration"] for record in records)
+        total_duration_in_seconds = sum(durations)
+        total_bytes = sum(record.get("bytes", 0) for record in records)
+        throughput_in_bytes_per_second = int(total_bytes / max(total_duration_in_seconds, 1e-6))
+        rows.append(
+            {
+                "name": name,
+                group_by: group,
+                "count": len(records),
+                "p50 (s)": round(_get_percentile(sorted_values=durations, fraction=0.5), 3),
+                "p95 (s)": round(_get_percentile(sorted_values=durations, fraction=0.95), 3),
+                "bytes": total_bytes,
+                "objects": sum(record.get("objects", 0) for record in records),
+                "throughput": f"{_human_readable_size(size_in_bytes=throughput_in_bytes_per_second)}/s",
+                "surveyed": sum(record.get("surveyed_bytes", 0) for record in records),
+                "errors": sum(record.get("errors", 0) for record in records),
+                "retries": sum(record.get("retries", 0) for record in records),
+            }
+        )
+
+    if len(rows) == 0:
+        print(f"No metrics recorded in the last {days} day(s) under {_METRICS_DIRECTORY}.")
+        return rows
+
+    print(tabulate([list(row.values()) for row in rows], headers=list(rows[0].keys()), tablefmt="github"))
+    return rows
+
+
+def _get_percentile(sorted_values: list[float], fraction: float) -> float:
+    """The nearest-rank percentile of already sorted values."""
+    index = max(math.ceil(fraction * len(sorted_values)) - 1, 0)
+    return sorted_values[index]
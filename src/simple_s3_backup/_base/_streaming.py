@@ -0,0 +1,113 @@
+import collections
+import json
+import subprocess
+import threading
+import time
+import typing
+from collections.abc import Iterator
+
+from ._metrics import _record_metric
+
+
+def _stream_subprocess(
+    *,
+    command: str | list[str],
+    environment_variables: dict[str, str] | None = None,
+    error_message: str | None = None,
+    ignore_errors: bool = False,
+    max_line_length: int = 1_048_576,
+    max_stderr_lines: int = 1_000,
+    progress_interval: int = 1_000_000,
+) -> Iterator[str]:
+    """
+    Run a command and yield the lines of its stdout as they are produced.
+
+    Unlike `_deploy_subprocess`, the output is never held in memory as a whole: at most one line of stdout and the
+    last `max_stderr_lines` lines of stderr are buffered at any time. Each line of stderr, and the number of lines
+    of stdout read so far every `progress_interval` lines, are logged as they arrive (see `_log_subprocess_event`).
+
+    Parameters
+    ----------
+    command : str or list of str
+        The command to run through the shell.
+    environment_variables : dict of str to str, optional
+        The environment to run the command in.
+    error_message : str, optional
+        The message to raise with if the command fails.
+    ignore_errors : bool, default: False
+        Whether to silently stop on a non-zero exit code instead of raising.
+    max_line_length : int, default: 1,048,576
+        The maximum number of characters in a single line of stdout, not counting its newline. The command is killed
+        if a longer line appears.
+    max_stderr_lines : int, default: 1,000
+        The number of trailing stderr lines kept for the error message.
+    progress_interval : int, default: 1,000,000
+        Report progress after every this many lines of stdout.
+
+    Yields
+    ------
+    str
+        Each line of stdout, without the trailing newline.
+    """
+    error_message = error_message or "An error occurred while executing the command."
+
+    start_time = time.perf_counter()
+    process = subprocess.Popen(
+        args=command,
+        env=environment_variables,
+        shell=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        text=True,
+        encoding="utf-8",
+    )
+    stderr_tail: collections.deque[str] = collections.deque(maxlen=max_stderr_lines)
+    stderr_thread = threading.Thread(
+        target=_echo_stderr, args=(process.stderr, stderr_tail, command, start_time), daemon=True
+    )
+    stderr_thread.start()
+
+    try:
+        number_of_lines = 0
+        while line := process.stdout.readline(max_line_length + 1):
+            if len(line.removesuffix("\n")) > max_line_length:
+                message = f"\n\nA line of stdout exceeded {max_line_length} characters.\n{error_message}\n\n"
+                raise RuntimeError(message)
+
+            yield line.removesuffix("\n")
+
+            number_of_lines += 1
+            if number_of_lines % progress_interval == 0:
+                _log_subprocess_event(name="progress", command=command, start_time=start_time, lines=number_of_lines)
+
+        process.wait()
+        stderr_thread.join()
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+
+    if process.returncode != 0 and ignore_errors is False:
+        stderr = "".join(stderr_tail)
+        message = f"\n\nError code {process.returncode}\n{error_message}\n\nstderr: {stderr}\n\n"
+        raise RuntimeError(message)
+
+
+def _echo_stderr(stream: typing.TextIO, tail: collections.deque, command: str | list[str], start_time: float) -> None:
+    for line in stream:
+        _log_subprocess_event(name="stderr", command=command, start_time=start_time, line=line.removesuffix("\n"))
+        tail.append(line)
+    stream.close()
+
+
+def _log_subprocess_event(name: str, command: str | list[str], start_time: float, **fields) -> None:
+    """Record an event of a streamed subprocess in the run log with `_record_metric`, and print the same record."""
+    record = _record_metric(
+        kind="log",
+        name=f"subprocess.{name}",
+        duration_in_seconds=time.perf_counter() - start_time,
+        command=command if isinstance(command, str) else " ".join(command),
+        **fields,
+    )
+    print(json.dumps(record))
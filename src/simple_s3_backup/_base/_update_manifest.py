@@ -1,17 +1,29 @@
 import collections
 import datetime
-import functools
-import hashlib
 import json
 import pathlib
+import shutil
 import time
 
 import yaml
 
-from ._utils import _deploy_subprocess
-
-
-def update_manifest(limit: int | None = None) -> None:
+from ._checksum_store import _ChecksumStore, _decode_etag, _encode_etag, _open_local_checksum_store
+from ._checksums import _calculate_checksums, _infer_part_sizes
+from ._globals import BACKUP_DIRECTORY, BLOBS_HEAD_TO_PARTITION, DANDI_ROOT
+from ._inventory_index import _read_inventory_deltas, _save_inventory_delta_cursor, _update_inventory_index
+from ._listing import _get_listing_source
+from ._metrics import _measure
+from ._quarantine import _open_quarantine_store, _QuarantineStore
+from ._reconcile import (
+    _classify_blobs,
+    _get_local_blob_file_path,
+    _get_shard_prefix_range,
+    _summarize_report,
+)
+from ._scan import _scan_local_blobs, _stat_local_blobs
+
+
+def update_manifest(limit: int | None = None, shard: tuple[int, int] | None = None, incremental: bool = False) -> None:
     """
     Update the manifest file.
 
@@ -23,229 +35,402 @@ def update_manifest(limit: int | None = None) -> None:
         Case 3a: If local size is less than remote, this can only mean the attempt to download the asset failed
         Case 3b: If local size is greater than remote, then something is wrong so add it to the problem list
     Case 4: Local mtime is after remote mtime, size matches, so ensure the checksums match
+
+    Blobs are compared by SHA-256 where `remote_checksums.json` has a checksum for them, and otherwise by the ETag
+    from the listing, recalculated locally for the part sizes the blob may have been uploaded with (see
+    `_infer_part_sizes`) in the same read as its SHA-256.
+
+    Parameters
+    ----------
+    limit : int, optional
+        Only evaluate this many blobs.
+    shard : tuple of int and int, optional
+        Only evaluate shard N of M (a contiguous range of blob IDs; see `_get_shard_prefix_range`), so that the
+        evaluation can run as a SLURM array job. Each shard writes its own `blobs_to_update.txt`,
+        `problematic_blob_ids.yaml`, report, quarantine store, and checksum store under
+        `shards/<N>_of_<M>`, which are combined by `merge_manifest_shards` once all shards have finished.
+    incremental : bool, default: False
+        Whether to only evaluate the blobs added or changed remotely since the last incremental run, along with
+        those still listed in `blobs_to_update.txt` and those left over when a previous run ran out of time. The
+        listing is merged into the inventory index as by `s3backup dandi diff`, and the blobs are taken from the
+        deltas not yet consumed, so the work scales with churn rather than with the size of the archive. Only the
+        candidate blobs are stat-ed locally, so local copies that went missing or were truncated for blobs that did
+        not change remotely are only caught by a full run. Not compatible with `shard`, and the deltas are not
+        marked as consumed when `limit` is specified.
     """
-    manifests_directory = pathlib.Path("/orcd/data/dandi/001/backup/manifests")
+    if incremental is True and shard is not None:
+        message = "Incremental manifest evaluation cannot be sharded."
+        raise ValueError(message)
+
+    manifests_directory = BACKUP_DIRECTORY / "manifests"
     manifests_directory.mkdir(exist_ok=True)
+    deltas_directory = manifests_directory / "inventory_deltas"
+    deferred_blob_ids_file_path = manifests_directory / "deferred_blob_ids.txt"
 
-    s5cmd_ls_blobs_file_path = manifests_directory / "s5cmd_ls_blobs.txt"
-    s5cmd_ls_needs_update = (
-        not s5cmd_ls_blobs_file_path.exists() or (time.time() - s5cmd_ls_blobs_file_path.stat().st_mtime) > 86_400
-    )
-    if s5cmd_ls_needs_update is True:
-        command = f"s5cmd ls s3://dandiarchive/blobs/* > {s5cmd_ls_blobs_file_path}"
-        print(f"Updating local `s5cmd ls` copy!\n{command}")
-        _deploy_subprocess(command=command)
+    output_directory = manifests_directory
+    prefix_range = None
+    if shard is not None:
+        prefix_range = _get_shard_prefix_range(shard_index=shard[0], number_of_shards=shard[1])
+        output_directory = manifests_directory / "shards" / f"{shard[0]}_of_{shard[1]}"
+        output_directory.mkdir(parents=True, exist_ok=True)
+        (output_directory / "complete").unlink(missing_ok=True)
+
+    listing_source = _get_listing_source(manifests_directory=manifests_directory)
+    with _measure(kind="phase", name="update_manifest.listing"):
+        listing_source.refresh()
 
     remote_checksums_file_path = manifests_directory / "remote_checksums.json"
     remote_checksum_needs_update = (
         not remote_checksums_file_path.exists() or (time.time() - remote_checksums_file_path.stat().st_mtime) > 86_400
     )
     if remote_checksum_needs_update is True:
-        # TODO for Kitware
+        # TODO for Kitware; meanwhile, blobs without a remote checksum are verified by their ETag
         pass
-        # command = f"s5cmd ls s3://dandiarchive/blobs/* > {s5cmd_ls_blobs_file_path}"
+        # command = f"s5cmd ls s3://{DANDI_BUCKET}/blobs/* > {s5cmd_ls_blobs_file_path}"
         # print(f"Updating local `s5cmd ls` copy!\n{command}")
         # _deploy_subprocess(command=command)
 
-    local_checksums_file_path = manifests_directory / "local_checksums.json"
-    if local_checksums_file_path.exists() is False:
-        local_checksums_file_path.write_text("{}")
-
-    problematic_blob_ids_file_path = manifests_directory / "problematic_blob_ids.yaml"
+    problematic_blob_ids_file_path = output_directory / "problematic_blob_ids.yaml"
     if problematic_blob_ids_file_path.exists() is False:
         problematic_blob_ids_file_path.touch()
 
-    blobs_to_remove_file_path = manifests_directory / "blobs_to_remove.yaml"
-    if blobs_to_remove_file_path.exists() is False:
-        blobs_to_remove_file_path.touch()
-
-    remote_blob_id_to_info: dict[str, dict[str, int | datetime.datetime]] = dict()
-    with s5cmd_ls_blobs_file_path.open(mode="r") as file_stream:
-        collections.deque(
-            (
-                _process_s5cmd_ls_line(line=line.strip(), info=remote_blob_id_to_info)
-                for line in file_stream.readlines()
-            ),
-            maxlen=0,
+    with _measure(kind="phase", name="update_manifest.parsing") as metric:
+        remote_inventory = listing_source.read_blob_inventory(prefix_range=prefix_range)
+
+        remote_blob_id_to_checksum: dict[str, str] = dict()
+        if remote_checksums_file_path.exists():
+            with remote_checksums_file_path.open(mode="r") as file_stream:
+                remote_blob_id_to_checksum = json.load(fp=file_stream)
+        metric.update(objects=len(remote_inventory))
+
+    if incremental is True:
+        with _measure(kind="phase", name="update_manifest.diff") as metric:
+            change_counts, _ = _update_inventory_index(
+                manifests_directory=manifests_directory, inventory=remote_inventory
+            )
+            blob_ids_to_evaluate, delta_cursor = _read_inventory_deltas(deltas_directory=deltas_directory)
+            for file_path in (output_directory / "blobs_to_update.txt", deferred_blob_ids_file_path):
+                if file_path.exists():
+                    blob_ids_to_evaluate.update(file_path.read_text().split())
+
+            remote_inventory = remote_inventory.select(
+                indices=sorted(
+                    index
+                    for blob_id in blob_ids_to_evaluate
+                    if (index := remote_inventory.find(blob_id=blob_id)) is not None
+                )
+            )
+            metric.update(objects=len(remote_inventory))
+        print(
+            f"Evaluating {len(remote_inventory)} blobs added, changed, or pending since the last incremental run "
+            f"({change_counts['added']} added, {change_counts['changed']} changed in this listing)."
         )
 
-    with remote_checksums_file_path.open(mode="r") as file_stream:
-        remote_blob_id_to_checksum: dict[str, str] = json.load(fp=file_stream)
-
-    with local_checksums_file_path.open(mode="r") as file_stream:
-        local_blob_id_to_checksum: dict[str, str] = json.load(fp=file_stream)
+    local_checksum_store = _open_local_checksum_store(
+        manifests_directory=manifests_directory,
+        shard_directory=output_directory if shard is not None else None,
+    )
+    local_etag_store = _open_local_checksum_store(
+        manifests_directory=manifests_directory,
+        shard_directory=output_directory if shard is not None else None,
+        name="local_etags",
+        value_size=20,
+    )
 
     with problematic_blob_ids_file_path.open(mode="r") as file_stream:
         problematic_blob_ids: dict[str, str] = yaml.safe_load(stream=file_stream) or dict()
 
-    with blobs_to_remove_file_path.open(mode="r") as file_stream:
-        blobs_to_remove: dict[str, str] = yaml.safe_load(stream=file_stream) or dict()
+    # Local copies found to be stale are renamed to `.rmv` and quarantined until `s3backup dandi gc` deletes them
+    if shard is None:
+        quarantine_store = _open_quarantine_store(manifests_directory=manifests_directory)
+    else:
+        quarantine_store = _QuarantineStore(file_path=output_directory / "quarantine.sqlite")
 
+    blob_ids_to_update = []
+    deferred_blob_ids = []
     try:
-        blob_ids_to_update = []
-        blobs_directory = pathlib.Path("/orcd/data/dandi/001/s3dandiarchive/blobs")
-        limit = limit or len(remote_blob_id_to_info)
         start_time = time.time()
         max_time = 60 * 60 * 3  # Max 3 hours
-        for counter, (blob_id, info) in enumerate(remote_blob_id_to_info.items()):
-            if counter >= limit or time.time() - start_time > max_time:
-                break
 
-            local_blob_file_path = blobs_directory / blob_id[:3] / blob_id[3:6] / blob_id
-
-            # Case 1: Local copy of blob on remote does not exist - always download
-            if local_blob_file_path.exists() is False:
-                blob_ids_to_update.append(blob_id)
+        # Every blob is classified at once from a bulk scan of the local blobs, joined against the remote inventory
+        with _measure(kind="phase", name="update_manifest.stat") as metric:
+            if incremental is True:
+                local_inventory = _stat_local_blobs(
+                    file_paths=[
+                        _get_local_blob_file_path(blob_id=remote_inventory.blob_id(index=index))
+                        for index in range(len(remote_inventory))
+                    ]
+                )
+            else:
+                local_inventory = _scan_local_blobs(
+                    blobs_directories=[
+                        DANDI_ROOT / partition / "s3dandiarchive" / "blobs"
+                        for partition in sorted(set(BLOBS_HEAD_TO_PARTITION.values()))
+                    ],
+                    prefix_range=prefix_range,
+                )
+            metric.update(objects=len(local_inventory))
+        with _measure(kind="phase", name="update_manifest.classify"):
+            report = _classify_blobs(
+                remote_inventory=remote_inventory,
+                local_inventory=local_inventory,
+                remote_checksums=remote_blob_id_to_checksum,
+                limit=limit,
+            )
+            report.write(file_path=output_directory / "reconciliation_report.json")
+        print(f"Classified blobs in {time.time() - start_time:.1f} s ({_summarize_report(report=report)}).")
+
+        # Case 1: Local copy of blob on remote does not exist - always download
+        blob_ids_to_update.extend(report.case_to_blob_ids["1"])
+
+        for blob_id in report.case_to_blob_ids["missing_remote_checksum"]:
+            message = f"PROBLEM: Remote checksum is missing for blob ID {blob_id}."
+            print(message)
+            problematic_blob_ids[blob_id] = message
+
+        # Case 3a: If local size is less than remote, this can only mean the attempt to download the asset failed
+        for blob_id in report.case_to_blob_ids["3a"]:
+            remote_size, _, local_size, _ = report.blob_id_to_details[blob_id]
+            print(f"REMOVE: Local blob ID {blob_id} size ({local_size}) is less than remote size ({remote_size}).")
+
+            local_blob_file_path = _get_local_blob_file_path(blob_id=blob_id)
+            new_path = local_blob_file_path.parent / f"{local_blob_file_path.name}.rmv"
+            local_blob_file_path.rename(new_path)
+            quarantine_store.add(path=new_path, original_path=local_blob_file_path, grace_period_in_days=180)
+            _forget_local_digests(blob_id=blob_id, stores=(local_checksum_store, local_etag_store))
+
+            blob_ids_to_update.append(blob_id)
+
+        # Case 3b: If local size is greater than remote, then something is wrong so add it to the problem list
+        for blob_id in report.case_to_blob_ids["3b"]:
+            remote_size, remote_mtime, local_size, local_mtime = report.blob_id_to_details[blob_id]
+            message = (
+                f"PROBLEM: Local size ({local_size}) is greater than remote size ({remote_size}), "
+                f"but mtime ({_format_timestamp(local_mtime)}) is older ({_format_timestamp(remote_mtime)})."
+            )
+            print(message)
+            problematic_blob_ids[blob_id] = message
+
+        # Blobs whose local and remote checksums must be compared, along with the case that led to the comparison
+        # Case 2: Local copy of blob exists, but mtime on remote is newer
+        # Keep in mind that local mtime is when the file was first downloaded
+        # Case 4: Local mtime is after remote mtime, size matches, so ensure the checksums match
+        # If they do not, mark the local copy for removal and download from remote
+        # Unclear why this would happen - possible corruption that occurred locally (or conceptually, remotely)
+        # TODO: perhaps add warning to the dashboard if this occurs so we can investigate
+        blob_id_to_comparison: dict[str, tuple[pathlib.Path, str, str]] = dict()
+        for blob_id in report.case_to_blob_ids["2"]:
+            _, remote_mtime, _, local_mtime = report.blob_id_to_details[blob_id]
+            mismatch_message = (
+                f"PROBLEM: Remote mtime ({_format_timestamp(remote_mtime)}) is newer than "
+                f"local mtime ({_format_timestamp(local_mtime)}), but checksums match."
+            )
+            blob_id_to_comparison[blob_id] = (_get_local_blob_file_path(blob_id=blob_id), "2", mismatch_message)
+        for blob_id in report.case_to_blob_ids["4"]:
+            blob_id_to_comparison[blob_id] = (_get_local_blob_file_path(blob_id=blob_id), "4", "")
+
+        # Blobs without a remote checksum are compared by ETag instead, for each part size they may have been
+        # uploaded with
+        blob_id_to_remote_etag: dict[str, str] = dict()
+        blob_id_to_part_sizes: dict[str, tuple[int, ...]] = dict()
+        for blob_id in list(blob_id_to_comparison):
+            if blob_id in remote_blob_id_to_checksum:
                 continue
 
-            # Case 2: Local copy of blob exists, but mtime on remote is newer
-            # Keep in mind that local mtime is when the file was first downloaded
-            # Compare the local and remote checksums
-            local_mtime = datetime.datetime.fromtimestamp(timestamp=local_blob_file_path.stat().st_mtime)
-            if local_mtime < info["mtime"]:
-                local_checksum = local_blob_id_to_checksum.get(blob_id, None)
-                remote_checksum = remote_blob_id_to_checksum.get(blob_id, None)
-
-                # Check remote first to know to skip
-                if remote_checksum is None:
-                    message = f"PROBLEM: Remote checksum is missing for blob ID {blob_id}."
-                    print(message)
-                    problematic_blob_ids[blob_id] = message
-                    continue
-
-                if local_checksum is None:
-                    print(f"Calculating checksum for blob ID {blob_id} due to mtime mismatch.")
-                    local_checksum = _calculate_checksum(file_path=local_blob_file_path)
-                    local_blob_id_to_checksum[blob_id] = local_checksum
-                    with local_checksums_file_path.open(mode="a") as file_stream:
-                        file_stream.write(f"{blob_id}: {local_checksum}\n")
-
-                # Case 2a: Local content does not match remote - mark local copy for removal and download from remote
-                if local_checksum != remote_checksum:
-                    print(f"REMOVE: Checksum mismatch for blob ID {blob_id}.")
-                    new_path = local_blob_file_path.parent / f"{local_blob_file_path.name}.rmv"
-                    local_blob_file_path = local_blob_file_path.rename(new_path)
-                    blobs_to_remove[local_blob_file_path] = 0
-
-                    blob_ids_to_update.append(blob_id)
-                # Case 2b: It is a question why the mtimes differ so add this to the problematic blob list
-                else:
-                    message = (
-                        f"PROBLEM: Remote mtime ({info['mtime']}) is newer than "
-                        "local mtime ({local_mtime}), but checksums match."
-                    )
-                    print(message)
-                    problematic_blob_ids[blob_id] = message
+            remote_index = remote_inventory.find(blob_id=blob_id)
+            remote_etag = remote_inventory.etag(index=remote_index)
+            part_sizes = _infer_part_sizes(size_in_bytes=remote_inventory.sizes[remote_index], etag=remote_etag)
+            if len(part_sizes) == 0:
+                message = f"PROBLEM: Unable to infer the part size of remote ETag {remote_etag} for blob ID {blob_id}."
+                print(message)
+                problematic_blob_ids[blob_id] = message
+                del blob_id_to_comparison[blob_id]
                 continue
 
-            # Case 3: Local mtime is after remote mtime, but size differs
-            # Case 3a: If local size is less than remote, this can only mean the attempt to download the asset failed
-            # Case 3b: If local size is greater than remote, then something is wrong so add it to the problem list
-            local_size = local_blob_file_path.stat().st_size
-            if local_size < info["size"]:
-                print(f"REMOVE: Local blob ID {blob_id} size ({local_size}) is less than remote size ({info['size']}).")
-
-                new_path = local_blob_file_path.parent / f"{local_blob_file_path.name}.rmv"
-                local_blob_file_path = local_blob_file_path.rename(new_path)
-                blobs_to_remove[local_blob_file_path] = 180
+            blob_id_to_remote_etag[blob_id] = remote_etag
+            blob_id_to_part_sizes[blob_id] = part_sizes
+
+        # Local checksums are calculated in parallel and appended to the local checksum and ETag stores as soon as
+        # each one finishes, so that an interrupted run resumes from where it stopped
+        blob_id_to_unchecksummed_file_path = {
+            blob_id: local_blob_file_path
+            for blob_id, (local_blob_file_path, _, _) in blob_id_to_comparison.items()
+            if blob_id not in (local_etag_store if blob_id in blob_id_to_remote_etag else local_checksum_store)
+        }
+        print(f"Calculating {len(blob_id_to_unchecksummed_file_path)} local checksums.")
+        with _measure(kind="phase", name="update_manifest.hashing", objects=0) as metric:
+            for blob_id, local_checksum, part_size_to_etag in _calculate_checksums(
+                key_to_file_path=blob_id_to_unchecksummed_file_path,
+                deadline=start_time + max_time,
+                key_to_part_sizes={
+                    blob_id: part_sizes
+                    for blob_id, part_sizes in blob_id_to_part_sizes.items()
+                    if blob_id in blob_id_to_unchecksummed_file_path
+                },
+            ):
+                local_checksum_store.put(blob_id=blob_id, value=bytes.fromhex(local_checksum))
+                if len(part_size_to_etag) > 0:
+                    # Keep the candidate that matches, if any; otherwise the most likely one, which is only flagged
+                    local_etags = list(part_size_to_etag.values())
+                    remote_etag = blob_id_to_remote_etag[blob_id]
+                    local_etag = remote_etag if remote_etag in local_etags else local_etags[0]
+                    local_etag_store.put(blob_id=blob_id, value=_encode_etag(etag=local_etag))
+                metric["objects"] += 1
+
+        for blob_id, (local_blob_file_path, case, mismatch_message) in blob_id_to_comparison.items():
+            if blob_id in blob_id_to_remote_etag:
+                local_digest = local_etag_store.get(blob_id=blob_id)
+                local_value = _decode_etag(value=local_digest) if local_digest is not None else None
+                remote_value = blob_id_to_remote_etag[blob_id]
+            else:
+                local_digest = local_checksum_store.get(blob_id=blob_id)
+                local_value = local_digest.hex() if local_digest is not None else None
+                remote_value = remote_blob_id_to_checksum[blob_id]
+            if local_value is None:  # Ran out of time before it could be calculated
+                deferred_blob_ids.append(blob_id)
+                continue
 
-                blob_ids_to_update.append(blob_id)
-            elif local_size > info["size"]:
+            # A multipart ETag that none of the inferred part sizes reproduces may only mean the part size was guessed
+            # wrong, so the local copy is kept and flagged instead of being removed
+            if local_value != remote_value and "-" in remote_value:
                 message = (
-                    f"PROBLEM: Local size ({local_size}) is greater than remote size ({info['size']}), "
-                    f"but mtime ({local_mtime}) is older ({info['mtime']})."
+                    f"PROBLEM: Unable to verify ETag {remote_value} for blob ID {blob_id}: "
+                    f"no inferred part size reproduces it."
                 )
                 print(message)
                 problematic_blob_ids[blob_id] = message
-
-            # Case 4: Local mtime is after remote mtime, size matches, so ensure the checksums match
-            # If they do not, mark the local copy for removal and download from remote
-            # Unclear why this would happen - possible corruption that occurred locally (or conceptually, remotely)
-            # TODO: perhaps add warning to the dashboard if this occurs so we can investigate
-            local_checksum = local_blob_id_to_checksum.get(blob_id, None)
-            remote_checksum = remote_blob_id_to_checksum.get(blob_id, None)
-
-            # Check remote first to know to skip
-            if remote_checksum is None:
-                message = f"PROBLEM: Remote checksum is missing for blob ID {blob_id}."
-                print(message)
-                problematic_blob_ids[blob_id] = message
                 continue
 
-            if local_checksum is None:
-                print(f"Calculating checksum for blob ID {blob_id}.")
-                local_checksum = _calculate_checksum(file_path=local_blob_file_path)
-                local_blob_id_to_checksum[blob_id] = local_checksum
-                with local_checksums_file_path.open(mode="a") as file_stream:
-                    file_stream.write(f"{blob_id}: {local_checksum}\n")
-
-            if local_checksum != remote_checksum:
+            # Case 2a and 4: Local content does not match remote - mark local copy for removal and download from remote
+            if local_value != remote_value:
                 print(f"REMOVE: Checksum mismatch for blob ID {blob_id}.")
                 new_path = local_blob_file_path.parent / f"{local_blob_file_path.name}.rmv"
-                local_blob_file_path = local_blob_file_path.rename(new_path)
-                blobs_to_remove[local_blob_file_path] = 0
+                local_blob_file_path.rename(new_path)
+                quarantine_store.add(path=new_path, original_path=local_blob_file_path, grace_period_in_days=0)
+                _forget_local_digests(blob_id=blob_id, stores=(local_checksum_store, local_etag_store))
 
                 blob_ids_to_update.append(blob_id)
+            # Case 2b: It is a question why the mtimes differ so add this to the problematic blob list
+            elif case == "2":
+                print(mismatch_message)
+                problematic_blob_ids[blob_id] = mismatch_message
     finally:
-        blobs_to_update_file_path = manifests_directory / "blobs_to_update.txt"
-        blobs_to_update_file_path.write_text("\n".join(blob_ids_to_update))
+        local_checksum_store.close()
+        local_etag_store.close()
+        quarantine_store.close()
 
-        with problematic_blob_ids_file_path.open(mode="w") as file_stream:
-            yaml.dump(data=problematic_blob_ids, stream=file_stream, sort_keys=False)
+        with _measure(kind="phase", name="update_manifest.writing"):
+            blobs_to_update_file_path = output_directory / "blobs_to_update.txt"
+            blobs_to_update_file_path.write_text("\n".join(blob_ids_to_update))
 
-        with blobs_to_remove_file_path.open(mode="w") as file_stream:
-            yaml.dump(data=blobs_to_remove, stream=file_stream, sort_keys=False)
+            with problematic_blob_ids_file_path.open(mode="w") as file_stream:
+                yaml.dump(data=problematic_blob_ids, stream=file_stream, sort_keys=False)
 
         print("Processed errored out but caches were saved!")
 
+    if shard is not None:
+        (output_directory / "complete").touch()
+
+    # The deltas are only consumed once every blob they hold has been evaluated or deferred to the next run
+    if incremental is True and limit is None:
+        deferred_blob_ids_file_path.write_text("\n".join(deferred_blob_ids))
+        _save_inventory_delta_cursor(deltas_directory=deltas_directory, cursor=delta_cursor)
+
 
-def _process_s5cmd_ls_line(line: str, info: dict) -> None:
+def merge_manifest_shards(number_of_shards: int) -> None:
     """
-    Process a line from the `s5cmd ls` output.
+    Combine the fragments written by `update_manifest` for each of `number_of_shards` shards.
+
+    The `blobs_to_update.txt` lists are concatenated into the main one, the problematic blobs are added to the main
+    YAML file, the reports are combined, and the quarantined blobs and local checksums and ETags found by each shard are
+    folded into the shared stores. The shard directories are removed afterwards.
 
     Parameters
     ----------
-    line : str
-        A line from the `s5cmd ls` output.
-
-    Returns
-    -------
-    tuple[str, int, int]
-        A tuple containing the blob ID, size in bytes, and modification time.
+    number_of_shards : int
+        The number of shards (M) the evaluation was split into. Every shard must have completed.
     """
-    parts = line.split(" ")
+    manifests_directory = BACKUP_DIRECTORY / "manifests"
+    shard_directories = [
+        manifests_directory / "shards" / f"{shard_index}_of_{number_of_shards}"
+        for shard_index in range(number_of_shards)
+    ]
+    incomplete_shards = [
+        str(shard_index)
+        for shard_index, shard_directory in enumerate(shard_directories)
+        if not (shard_directory / "complete").exists()
+    ]
+    if len(incomplete_shards) > 0:
+        message = f"Shards {', '.join(incomplete_shards)} of {number_of_shards} have not completed."
+        raise RuntimeError(message)
+
+    blob_ids_to_update = []
+    problematic_blob_ids = dict()
+    problematic_blob_ids_file_path = manifests_directory / "problematic_blob_ids.yaml"
+    if problematic_blob_ids_file_path.exists():
+        with problematic_blob_ids_file_path.open(mode="r") as file_stream:
+            problematic_blob_ids = yaml.safe_load(stream=file_stream) or dict()
+
+    report = {
+        "generated": datetime.datetime.now(tz=datetime.timezone.utc).isoformat(timespec="seconds"),
+        "counts": collections.Counter(),
+        "blob_ids": collections.defaultdict(list),
+    }
+    local_checksum_store = _open_local_checksum_store(manifests_directory=manifests_directory)
+    local_etag_store = _open_local_checksum_store(
+        manifests_directory=manifests_directory, name="local_etags", value_size=20
+    )
+    quarantine_store = _open_quarantine_store(manifests_directory=manifests_directory)
+    try:
+        for shard_directory in shard_directories:
+            blob_ids_to_update.extend((shard_directory / "blobs_to_update.txt").read_text().split())
 
-    blob_path = parts[-1]
-    blobs_id = blob_path.split("/")[-1]
+            with (shard_directory / "problematic_blob_ids.yaml").open(mode="r") as file_stream:
+                problematic_blob_ids.update(yaml.safe_load(stream=file_stream) or dict())
 
-    size = int(parts[-3])
-    mtime = datetime.datetime.strptime(" ".join(parts[:2]), "%Y/%m/%d %H:%M:%S")
+            with _QuarantineStore(file_path=shard_directory / "quarantine.sqlite") as shard_quarantine_store:
+                quarantine_store.update(other=shard_quarantine_store)
 
-    info[blobs_id] = {"size": size, "mtime": mtime}
+            with (shard_directory / "reconciliation_report.json").open(mode="r") as file_stream:
+                shard_report = json.load(fp=file_stream)
+            report["counts"].update(shard_report["counts"])
+            for case, blob_ids in shard_report["blob_ids"].items():
+                report["blob_ids"][case].extend(blob_ids)
 
+            for store in (local_checksum_store, local_etag_store):
+                shard_store = _ChecksumStore(
+                    directory=shard_directory, name=store.log_file_path.stem, value_size=store.value_size
+                )
+                for blob_id, value in shard_store.items():
+                    if value is None:
+                        store.delete(blob_id=blob_id)
+                    else:
+                        store.put(blob_id=blob_id, value=value)
+                shard_store.close()
+        local_checksum_store.compact()
+        local_etag_store.compact()
+    finally:
+        local_checksum_store.close()
+        local_etag_store.close()
+        quarantine_store.close()
 
-@functools.lru_cache(maxsize=None)
-def _calculate_checksum(file_path: pathlib.Path) -> str:
-    """
-    Calculate the SHA-256 checksum of a file.
+    (manifests_directory / "blobs_to_update.txt").write_text("\n".join(blob_ids_to_update))
+    with problematic_blob_ids_file_path.open(mode="w") as file_stream:
+        yaml.dump(data=problematic_blob_ids, stream=file_stream, sort_keys=False)
+    with (manifests_directory / "reconciliation_report.json").open(mode="w") as file_stream:
+        json.dump(obj=report, fp=file_stream, indent=1)
 
-    Processes the file in chunks to avoid memory issues with large files.
+    for shard_directory in shard_directories:
+        shutil.rmtree(shard_directory)
 
-    Parameters
-    ----------
-    file_path : pathlib.Path
-        The path to the file.
+    print(f"Merged {number_of_shards} shards: {len(blob_ids_to_update)} blobs to update.")
 
-    Returns
-    -------
-    str
-        The SHA-256 checksum of the file.
-    """
-    chunk_size_in_bytes = 104_857_600  # 100 MiB
-
-    hasher = hashlib.sha256()
-    with file_path.open(mode="rb") as file_stream:
-        for chunk in iter(lambda: file_stream.read(chunk_size_in_bytes), b""):
-            hasher.update(chunk)
-    hex = hasher.hexdigest()
-    return hex
+
+def _forget_local_digests(blob_id: str, stores: tuple[_ChecksumStore, ...]) -> None:
+    """Drop the digests of a local copy that was quarantined, so that the copy downloaded next is hashed again."""
+    for store in stores:
+        store.delete(blob_id=blob_id)
+
+
+def _format_timestamp(timestamp: float) -> str:
+    return datetime.datetime.fromtimestamp(timestamp, tz=datetime.timezone.utc).isoformat(timespec="seconds")
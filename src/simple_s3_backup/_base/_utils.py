@@ -1,6 +1,11 @@
+import contextlib
 import datetime
+import fcntl
 import functools
+import math
+import pathlib
 import subprocess
+from collections.abc import Iterator
 
 
 def _deploy_subprocess(
@@ -38,3 +43,65 @@ def _deploy_subprocess(
 def _get_today() -> str:
     today = datetime.date.today().isoformat()
     return today
+
+
+@contextlib.contextmanager
+def _lock_file(lock_file_path: pathlib.Path) -> Iterator[None]:
+    """Hold an exclusive `flock` on a lock file, shared by all array tasks through the filesystem."""
+    lock_file_path.parent.mkdir(parents=True, exist_ok=True)
+    with lock_file_path.open(mode="a") as file_stream:
+        fcntl.flock(file_stream, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(file_stream, fcntl.LOCK_UN)
+
+
+def _human_readable_size(size_in_bytes: int, binary: bool = False) -> str:
+    """
+    Convert a file size given in bytes to a human-readable format using division
+    and remainder instead of iteration.
+
+    Parameters
+    ----------
+    size_in_bytes : int
+        The size in bytes.
+    binary : bool, default=False
+        If True, use binary prefixes (KiB, MiB, etc.). If False, use SI prefixes (KB, MB, etc.).
+
+    Returns
+    -------
+    str
+        A human-readable string representation of the size.
+
+    Examples
+    --------
+    >>> human_readable_size(123)
+    '123 B'
+    >>> human_readable_size(1234, binary=True)
+    '1.21 KiB'
+    >>> human_readable_size(123456789)
+    '123.46 MB'
+    """
+    # Check if size is negative
+    if size_in_bytes < 0:
+        raise ValueError("Size must be non-negative")
+
+    if size_in_bytes == 0:
+        return "0 B"
+
+    # Define the suffixes for each size unit
+    suffixes = ["", "K", "M", "G", "T", "P", "E", "Z", "Y"]
+
+    # Calculate base and the exponent
+    base = 1024 if binary else 1000
+    exponent = int(math.log(size_in_bytes, base))
+
+    if exponent == 0:
+        return f"{size_in_bytes} B"
+
+    # Calculate the human-readable size
+    human_readable_value = size_in_bytes / (base**exponent)
+
+    # Return formatted size with suffix
+    return f"{human_readable_value:.2f} {suffixes[exponent]}{'i' if binary else ''}B"
@@ -0,0 +1,191 @@
+import calendar
+import collections
+import pathlib
+from collections.abc import Iterator
+
+from ._globals import BACKUP_DIRECTORY, DANDI_BUCKET
+from ._metrics import _measure
+from ._s5cmd import _run_s5cmd_batch
+from ._streaming import _stream_subprocess
+from ._utils import _deploy_subprocess
+from ._zarr_pack import _ZarrPack
+
+_ZARR_MANIFESTS_DIRECTORY = BACKUP_DIRECTORY / "manifests" / "zarr"
+
+
+def _list_zarr_ids(prefix: str) -> list[str]:
+    """List the IDs of the Zarr stores whose IDs start with the given prefix."""
+    lines = _stream_subprocess(command=f"s5cmd ls 's3://{DANDI_BUCKET}/zarr/{prefix}*'", ignore_errors=True)
+    return [line.split()[-1].rstrip("/") for line in lines if len(line.split()) == 2 and line.split()[0] == "DIR"]
+
+
+def _get_nested_zarr_directory(zarr_backup_directory: pathlib.Path, zarr_id: str) -> pathlib.Path:
+    """The hex-nested location of a Zarr store, following the `abc/def/<ID>` layout of the blobs."""
+    return zarr_backup_directory / zarr_id[:3] / zarr_id[3:6] / zarr_id
+
+
+def _sync_zarr(
+    zarr_id: str,
+    destination: pathlib.Path,
+    number_of_workers: int = 256,
+    packed: bool = False,
+) -> collections.Counter:
+    """
+    Incrementally copy a single Zarr store, fetching only the chunks that changed since its last sync.
+
+    Each store has a manifest at `manifests/zarr/<ID>.tsv` holding the key, size, and modification time of every
+    chunk at its last successful sync, sorted by key. The fresh remote listing is merge-joined against it in a single
+    streaming pass, and only new or modified chunks are copied, to their exact destinations, through one `s5cmd run`.
+    An unchanged store therefore costs one listing and one manifest comparison, rather than `s5cmd cp` stat-ing every
+    local chunk. The manifest is only replaced once all changes have been copied, so failures are retried next time.
+
+    Chunks removed from the remote store are counted but not deleted locally.
+
+    Parameters
+    ----------
+    zarr_id : str
+        The ID of the Zarr store.
+    destination : pathlib.Path
+        The local directory of the Zarr store.
+    number_of_workers : int, default: 256
+        The number of s5cmd workers used to copy the changed chunks.
+    packed : bool, default: False
+        Whether to store the chunks in append-only pack files under `destination` (see `_ZarrPack`) instead of one
+        file per chunk. Changed chunks are downloaded to a staging directory and appended to the pack. Packed stores
+        keep a separate manifest, `<ID>.packed.tsv`.
+
+    Returns
+    -------
+    collections.Counter
+        The number of chunks listed, `changed`, `deleted`, and copied (`objects`), the copy `errors`, and the bytes
+        copied.
+    """
+    _ZARR_MANIFESTS_DIRECTORY.mkdir(parents=True, exist_ok=True)
+    manifest_name = f"{zarr_id}.packed" if packed is True else zarr_id
+    manifest_file_path = _ZARR_MANIFESTS_DIRECTORY / f"{manifest_name}.tsv"
+    listing_file_path = _ZARR_MANIFESTS_DIRECTORY / f"{manifest_name}.tsv.new"
+
+    summary = collections.Counter(listed=0, changed=0, deleted=0, objects=0, errors=0, bytes=0)
+    try:
+        _write_zarr_listing(zarr_id=zarr_id, file_path=listing_file_path)
+    except RuntimeError as exception:
+        print(f"ERROR: Unable to list Zarr {zarr_id}: {exception}")
+        listing_file_path.unlink(missing_ok=True)
+        summary["errors"] += 1
+        return summary
+
+    # Without a manifest (the first sync, or a store moved over from the flat layout), let s5cmd skip local copies
+    # that are already up to date
+    copy_flags = "" if manifest_file_path.exists() else "--if-size-differ --if-source-newer "
+    copy_destination = destination / "staging" if packed is True else destination
+    commands = []
+    for status, key in _diff_manifests(
+        previous_manifest_file_path=manifest_file_path, current_manifest_file_path=listing_file_path
+    ):
+        summary[status] += 1
+        if status == "changed":
+            commands.append(f"cp {copy_flags}s3://{DANDI_BUCKET}/zarr/{zarr_id}/{key} {copy_destination}/{key}")
+
+    if len(commands) > 0:
+        command_file_path = BACKUP_DIRECTORY / "batches" / f"zarr_{zarr_id}.txt"
+        summary.update(
+            _run_s5cmd_batch(
+                commands=commands, command_file_path=command_file_path, number_of_workers=number_of_workers
+            )
+        )
+
+    # Chunks that did copy are packed even if others failed, so that they are not left behind as loose files
+    if packed is True and copy_destination.exists():
+        _ZarrPack(directory=destination).append_files(source_directory=copy_destination)
+
+    if summary["errors"] == 0:
+        listing_file_path.replace(manifest_file_path)
+    else:
+        listing_file_path.unlink()
+
+    print(
+        f"Zarr {zarr_id}: {summary['listed']} chunks listed, {summary['changed']} new or modified, "
+        f"{summary['deleted']} removed remotely, {summary['errors']} errors"
+    )
+    return summary
+
+
+def _write_zarr_listing(zarr_id: str, file_path: pathlib.Path) -> None:
+    """
+    Stream the `s5cmd ls` listing of a Zarr store into a manifest of `key<TAB>size<TAB>mtime` lines sorted by key.
+
+    S3 lists keys in byte order, so the lines are normally written already sorted; they are otherwise sorted on disk
+    with `sort` so that memory usage does not grow with the number of chunks.
+    """
+    day_to_epoch: dict[str, int] = dict()
+    is_sorted = True
+    previous_key = ""
+
+    lines = _stream_subprocess(command=f"s5cmd ls 's3://{DANDI_BUCKET}/zarr/{zarr_id}/*'")
+    with (
+        _measure(kind="command", name="s5cmd ls", prefix=f"zarr/{zarr_id}/", objects=0, surveyed_bytes=0) as metric,
+        file_path.open(mode="w") as file_stream,
+    ):
+        for line in lines:
+            parts = line.split(maxsplit=3)
+            if len(parts) < 4 or parts[2] == "DIR":
+                continue
+
+            day, clock, size, key = parts
+            day_epoch = day_to_epoch.get(day, None)
+            if day_epoch is None:
+                day_epoch = calendar.timegm((int(day[0:4]), int(day[5:7]), int(day[8:10]), 0, 0, 0))
+                day_to_epoch[day] = day_epoch
+            mtime = day_epoch + int(clock[0:2]) * 3600 + int(clock[3:5]) * 60 + int(clock[6:8])
+
+            file_stream.write(f"{key}\t{size}\t{mtime}\n")
+            metric["objects"] += 1
+            metric["surveyed_bytes"] += int(size)
+            if is_sorted is True:
+                is_sorted = previous_key.encode("utf-8") <= key.encode("utf-8")
+                previous_key = key
+
+    if is_sorted is False:
+        _deploy_subprocess(command=f"LC_ALL=C sort -t '\t' -k1,1 -o {file_path} {file_path}")
+
+
+def _diff_manifests(
+    previous_manifest_file_path: pathlib.Path, current_manifest_file_path: pathlib.Path
+) -> Iterator[tuple[str, str]]:
+    """
+    Merge-join two sorted manifests, yielding `("listed", key)` for every current key, plus `("changed", key)` for
+    those that are new or whose other fields (size and modification time or ETag) differ, and `("deleted", key)` for
+    those that are gone.
+    """
+    previous_records = _iter_manifest_records(file_path=previous_manifest_file_path)
+    current_records = _iter_manifest_records(file_path=current_manifest_file_path)
+
+    previous_record = next(previous_records, None)
+    for current_record in current_records:
+        while previous_record is not None and previous_record[0] < current_record[0]:
+            yield "deleted", previous_record[0].decode("utf-8")
+            previous_record = next(previous_records, None)
+
+        current_key = current_record[0].decode("utf-8")
+        yield "listed", current_key
+        if previous_record is not None and previous_record[0] == current_record[0]:
+            if previous_record[1:] != current_record[1:]:
+                yield "changed", current_key
+            previous_record = next(previous_records, None)
+        else:
+            yield "changed", current_key
+
+    while previous_record is not None:
+        yield "deleted", previous_record[0].decode("utf-8")
+        previous_record = next(previous_records, None)
+
+
+def _iter_manifest_records(file_path: pathlib.Path) -> Iterator[tuple[bytes, bytes, bytes]]:
+    if not file_path.exists():
+        return
+
+    # Keys are compared as bytes to match the byte order of S3 listings and `LC_ALL=C sort`
+    with file_path.open(mode="rb") as file_stream:
+        for line in file_stream:
+            key, size, mtime = line.rstrip(b"\n").split(b"\t")
+            yield key, size, mtime
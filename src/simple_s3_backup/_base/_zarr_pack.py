@@ -0,0 +1,174 @@
+import collections
+import os
+import pathlib
+import shutil
+from collections.abc import Iterator
+
+_MAX_PACK_SIZE_IN_BYTES = 4_294_967_296  # 4 GiB
+
+
+class _ZarrPack:
+    """
+    Append-only packed storage for the chunks of a single Zarr store.
+
+    Rather than one file per chunk, chunks are appended to numbered `<n>.pack` files (a new one is started once the
+    current one exceeds `max_pack_size_in_bytes`), and `index.tsv` maps each chunk key to its pack, offset, and
+    length with one `key<TAB>pack<TAB>offset<TAB>length` line per append. A chunk that changes is appended again and
+    its latest index line wins. Pack data is flushed before its index line is written, so a crash can only leave
+    unreferenced bytes at the end of a pack or a torn final index line, both of which are ignored.
+
+    Parameters
+    ----------
+    directory : pathlib.Path
+        The directory holding the pack and index files.
+    max_pack_size_in_bytes : int, default: 4 GiB
+        The size past which a new pack file is started.
+    """
+
+    def __init__(self, directory: pathlib.Path, max_pack_size_in_bytes: int = _MAX_PACK_SIZE_IN_BYTES) -> None:
+        self.directory = directory
+        self.max_pack_size_in_bytes = max_pack_size_in_bytes
+        self.index_file_path = directory / "index.tsv"
+
+        self._key_to_location: dict[str, tuple[int, int, int]] = dict()
+        if self.index_file_path.exists():
+            with self.index_file_path.open(mode="r") as file_stream:
+                for line in file_stream:
+                    parts = line.rstrip("\n").split("\t")
+                    if len(parts) != 4 or not line.endswith("\n"):
+                        continue
+                    key, pack_number, offset, length = parts
+                    self._key_to_location[key] = (int(pack_number), int(offset), int(length))
+
+        pack_numbers = [int(file_path.stem) for file_path in directory.glob("*.pack")]
+        self._pack_number = max(pack_numbers, default=0)
+
+    def __len__(self) -> int:
+        return len(self._key_to_location)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._key_to_location
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._key_to_location)
+
+    def get_size(self, key: str) -> int:
+        return self._key_to_location[key][2]
+
+    def read(self, key: str) -> bytes:
+        pack_number, offset, length = self._key_to_location[key]
+        with (self.directory / f"{pack_number}.pack").open(mode="rb") as file_stream:
+            file_stream.seek(offset)
+            return file_stream.read(length)
+
+    def append_files(self, source_directory: pathlib.Path, remove: bool = True) -> collections.Counter:
+        """
+        Append every file under a directory as a chunk keyed by its relative path, then sync the pack.
+
+        Parameters
+        ----------
+        source_directory : pathlib.Path
+            The directory of downloaded chunk files, laid out as in the Zarr store.
+        remove : bool, default: True
+            Whether to delete each file once its index line has been synced (when its pack is closed), and the
+            directory once all have been.
+
+        Returns
+        -------
+        collections.Counter
+            The number of chunks and bytes appended.
+        """
+        summary = collections.Counter(chunks=0, bytes=0)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        index_lines = []
+        appended_file_paths = []
+        pack_stream = None
+        try:
+            for root, _, file_names in os.walk(source_directory):
+                for file_name in file_names:
+                    file_path = pathlib.Path(root) / file_name
+                    key = file_path.relative_to(source_directory).as_posix()
+
+                    if pack_stream is None or pack_stream.tell() >= self.max_pack_size_in_bytes:
+                        if pack_stream is not None:
+                            self._close_pack(pack_stream=pack_stream, index_lines=index_lines)
+                            self._remove_files(file_paths=appended_file_paths if remove is True else [])
+                            index_lines = []
+                            appended_file_paths = []
+                            self._pack_number += 1
+                        pack_stream = (self.directory / f"{self._pack_number}.pack").open(mode="ab")
+
+                    offset = pack_stream.tell()
+                    with file_path.open(mode="rb") as file_stream:
+                        shutil.copyfileobj(file_stream, pack_stream)
+                    length = pack_stream.tell() - offset
+
+                    index_lines.append(f"{key}\t{self._pack_number}\t{offset}\t{length}\n")
+                    self._key_to_location[key] = (self._pack_number, offset, length)
+                    summary["chunks"] += 1
+                    summary["bytes"] += length
+                    appended_file_paths.append(file_path)
+        finally:
+            if pack_stream is not None:
+                self._close_pack(pack_stream=pack_stream, index_lines=index_lines)
+                self._remove_files(file_paths=appended_file_paths if remove is True else [])
+
+        if remove is True:
+            shutil.rmtree(source_directory)
+
+        return summary
+
+    def restore(self, destination: pathlib.Path) -> int:
+        """
+        Write every chunk out as its own file under a directory, recreating the one-file-per-object layout.
+
+        Returns
+        -------
+        int
+            The number of chunks restored.
+        """
+        for key in self:
+            file_path = destination / key
+            file_path.parent.mkdir(parents=True, exist_ok=True)
+            file_path.write_bytes(self.read(key=key))
+
+        return len(self)
+
+    def verify(self, manifest_file_path: pathlib.Path) -> collections.Counter:
+        """
+        Check the pack against a Zarr manifest (`key<TAB>size<TAB>mtime` lines).
+
+        Returns
+        -------
+        collections.Counter
+            The number of chunks that are `intact`, `missing` from the pack, or whose length is `mismatched`.
+        """
+        summary = collections.Counter(intact=0, missing=0, mismatched=0)
+        with manifest_file_path.open(mode="r") as file_stream:
+            for line in file_stream:
+                key, size, _ = line.rstrip("\n").split("\t")
+                if key not in self:
+                    summary["missing"] += 1
+                elif self.get_size(key=key) != int(size):
+                    summary["mismatched"] += 1
+                else:
+                    summary["intact"] += 1
+
+        return summary
+
+    def _close_pack(self, pack_stream, index_lines: list[str]) -> None:
+        pack_stream.flush()
+        os.fsync(pack_stream.fileno())
+        pack_stream.close()
+
+        with self.index_file_path.open(mode="a") as index_stream:
+            index_stream.writelines(index_lines)
+            index_stream.flush()
+            os.fsync(index_stream.fileno())
+
+    @staticmethod
+    def _remove_files(file_paths: list[pathlib.Path]) -> None:
+        """Delete the source files of chunks, which must only be done once their index lines have been synced."""
+        for file_path in file_paths:
+            file_path.unlink()
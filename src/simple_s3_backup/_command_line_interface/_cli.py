@@ -1,6 +1,24 @@
+import pathlib
+import typing
+
 import click
 
-from .._base import backup_dandi_blobs, backup_dandi_nonblobs, backup_dandi_zarr, update_display, update_manifest
+from .._base import (
+    backup_dandi_blobs,
+    backup_dandi_nonblobs,
+    backup_dandi_zarr,
+    benchmark_dandi_backup,
+    benchmark_dandi_component,
+    collect_dandi_garbage,
+    diff_dandi_blobs,
+    merge_manifest_shards,
+    plan_dandi_backup,
+    simulate_transfer_controller,
+    summarize_dandi_metrics,
+    update_display,
+    update_manifest,
+    work_dandi_backup,
+)
 
 
 # s3backup
@@ -26,40 +44,392 @@ def _s3backup_dandi() -> None:
     required=False,
     default=None,
 )
-def _s3backup_dandi_manifest(limit: int | None = None) -> None:
+@click.option(
+    "--shard",
+    type=str,
+    required=False,
+    default=None,
+    help="Only evaluate shard N of M, given as `N/M` (for example, `$SLURM_ARRAY_TASK_ID/16`).",
+)
+@click.option(
+    "--incremental",
+    is_flag=True,
+    default=False,
+    help="Only evaluate the blobs added or changed since the last incremental run, and those still pending.",
+)
+def _s3backup_dandi_manifest(limit: int | None = None, shard: str | None = None, incremental: bool = False) -> None:
     """
     Form the latest manifest of what assets require backup.
     """
-    update_manifest(limit=limit)
+    if shard is not None:
+        shard_index, number_of_shards = (int(part) for part in shard.split("/"))
+        update_manifest(limit=limit, shard=(shard_index, number_of_shards), incremental=incremental)
+        return
+
+    update_manifest(limit=limit, incremental=incremental)
+
+
+# s3backup dandi merge-manifest <int>
+@_s3backup_dandi.command(name="merge-manifest")
+@click.argument("number_of_shards", type=int)
+def _s3backup_dandi_merge_manifest(number_of_shards: int) -> None:
+    """
+    Combine the manifest fragments written by each of `NUMBER_OF_SHARDS` runs of `manifest --shard`.
+    """
+    merge_manifest_shards(number_of_shards=number_of_shards)
+
+
+# s3backup dandi diff
+@_s3backup_dandi.command(name="diff")
+def _s3backup_dandi_diff() -> None:
+    """
+    Merge the latest remote blob listing into the inventory index and record what was added, changed, or deleted.
+    """
+    diff_dandi_blobs()
+
+
+# s3backup dandi gc
+@_s3backup_dandi.command(name="gc")
+@click.option(
+    "--numworkers",
+    "max_workers",
+    type=int,
+    required=False,
+    default=16,
+    help="The number of files deleted concurrently.",
+)
+@click.option(
+    "--dry-run",
+    is_flag=True,
+    default=False,
+    help="Only report what would be deleted.",
+)
+def _s3backup_dandi_gc(max_workers: int = 16, dry_run: bool = False) -> None:
+    """
+    Delete the quarantined local blob copies whose grace period has expired, reporting the space reclaimed.
+    """
+    collect_dandi_garbage(max_workers=max_workers, dry_run=dry_run)
+
+
+# s3backup dandi stats
+@_s3backup_dandi.command(name="stats")
+@click.option(
+    "--days",
+    type=int,
+    required=False,
+    default=1,
+    help="How many days of run logs to include, counting today.",
+)
+@click.option(
+    "--by",
+    "group_by",
+    type=click.Choice(["prefix", "task"]),
+    required=False,
+    default="prefix",
+    help="Whether to aggregate per prefix or per SLURM array task.",
+)
+def _s3backup_dandi_stats(days: int = 1, group_by: typing.Literal["prefix", "task"] = "prefix") -> None:
+    """
+    Summarize the recorded transfers and phases into latency percentiles and throughput.
+    """
+    summarize_dandi_metrics(days=days, group_by=group_by)
 
 
 # s3backup dandi nonblobs
 @_s3backup_dandi.command(name="nonblobs")
-def _s3backup_dandi_nonblobs() -> None:
+@click.option(
+    "--numworkers",
+    "number_of_workers",
+    type=int,
+    required=False,
+    default=64,
+    help="The number of s5cmd workers copying the changes of each location.",
+)
+def _s3backup_dandi_nonblobs(number_of_workers: int = 64) -> None:
     """
-    Backup all DANDI bucket non-blob directories.
+    Backup all DANDI bucket non-blob directories, copying only what changed since the last run.
     """
-    backup_dandi_nonblobs()
+    backup_dandi_nonblobs(number_of_workers=number_of_workers)
 
 
 # s3backup dandi blobs <int>
 @_s3backup_dandi.command(name="blobs")
 @click.argument("task_id", type=int)
-def _s3backup_dandi_blobs(task_id: int) -> None:
+@click.option(
+    "--batch",
+    is_flag=True,
+    default=False,
+    help="Copy the sub-prefixes through one `s5cmd run` per group of 16 instead of one `s5cmd cp` each.",
+)
+@click.option(
+    "--from-manifest",
+    is_flag=True,
+    default=False,
+    help="Only copy the blobs of this task listed in `blobs_to_update.txt` by `s3backup dandi manifest`.",
+)
+@click.option(
+    "--numworkers",
+    "number_of_workers",
+    type=int,
+    required=False,
+    default=256,
+    help=(
+        "The number of s5cmd workers to use with `--batch` or `--from-manifest`, "
+        "or the maximum number of concurrent requests with `--backend aio`."
+    ),
+)
+@click.option(
+    "--backend",
+    type=click.Choice(["s5cmd", "aio"]),
+    required=False,
+    default="s5cmd",
+    help="Shell out to s5cmd, or use the native asyncio S3 client (requires `aiobotocore`).",
+)
+@click.option(
+    "--adaptive",
+    is_flag=True,
+    default=False,
+    help="With `--from-manifest`, adjust the number of workers (up to `--numworkers`) and their bandwidth as it runs.",
+)
+def _s3backup_dandi_blobs(
+    task_id: int,
+    batch: bool = False,
+    from_manifest: bool = False,
+    number_of_workers: int = 256,
+    backend: typing.Literal["s5cmd", "aio"] = "s5cmd",
+    adaptive: bool = False,
+) -> None:
     """
     Backup DANDI blob directories correspond to the `task_id`.
     """
-    backup_dandi_blobs(task_id=task_id)
+    backup_dandi_blobs(
+        task_id=task_id,
+        batch=batch,
+        from_manifest=from_manifest,
+        number_of_workers=number_of_workers,
+        backend=backend,
+        adaptive=adaptive,
+    )
 
 
 # s3backup dandi zarr <int>
 @_s3backup_dandi.command(name="zarr")
 @click.argument("task_id", type=int)
-def _s3backup_dandi_zarr(task_id: int) -> None:
+@click.option(
+    "--nested",
+    is_flag=True,
+    default=False,
+    help="Sync each zarr incrementally against its own manifest, into the hex-nested `zarr/abc/def/<ID>` layout.",
+)
+@click.option(
+    "--packed",
+    is_flag=True,
+    default=False,
+    help="Store the chunks of each zarr in append-only pack files instead of one file per chunk (implies `--nested`).",
+)
+@click.option(
+    "--numworkers",
+    "number_of_workers",
+    type=int,
+    required=False,
+    default=256,
+    help="The number of s5cmd workers used to copy the changed chunks of each zarr with `--nested`.",
+)
+def _s3backup_dandi_zarr(
+    task_id: int, nested: bool = False, packed: bool = False, number_of_workers: int = 256
+) -> None:
     """
     Backup DANDI zarr directories correspond to the `task_id`.
     """
-    backup_dandi_zarr(task_id=task_id)
+    backup_dandi_zarr(task_id=task_id, nested=nested, packed=packed, number_of_workers=number_of_workers)
+
+
+# s3backup dandi plan <kind>
+@_s3backup_dandi.command(name="plan")
+@click.argument("kind", type=click.Choice(["blobs", "zarr"]))
+@click.option(
+    "--units",
+    "number_of_units",
+    type=int,
+    required=False,
+    default=64,
+    help="The number of balanced work units to split the prefixes into.",
+)
+def _s3backup_dandi_plan(kind: typing.Literal["blobs", "zarr"], number_of_units: int = 64) -> None:
+    """
+    Plan balanced work units for the backup of all blobs or Zarr stores and reset the queue of units.
+    """
+    plan_dandi_backup(kind=kind, number_of_units=number_of_units)
+
+
+# s3backup dandi work <kind>
+@_s3backup_dandi.command(name="work")
+@click.argument("kind", type=click.Choice(["blobs", "zarr"]))
+@click.option(
+    "--numworkers",
+    "number_of_workers",
+    type=int,
+    required=False,
+    default=256,
+    help="The number of s5cmd workers used to copy each work unit, or the most used with `--adaptive`.",
+)
+@click.option(
+    "--adaptive",
+    is_flag=True,
+    default=False,
+    help=(
+        "Adjust the number of workers and their bandwidth from the throughput, throttling, and local write latency, "
+        "within the caps set by `S3BACKUP_MAX_BANDWIDTH` and `S3BACKUP_MAX_WORKERS`."
+    ),
+)
+def _s3backup_dandi_work(
+    kind: typing.Literal["blobs", "zarr"], number_of_workers: int = 256, adaptive: bool = False
+) -> None:
+    """
+    Claim and copy work units from the current plan until none are left.
+    """
+    work_dandi_backup(kind=kind, number_of_workers=number_of_workers, adaptive=adaptive)
+
+
+# s3backup dandi benchmark
+@_s3backup_dandi.command(name="benchmark")
+@click.option(
+    "--mode",
+    type=click.Choice(["backup", "listing", "hashing", "scan", "pack"]),
+    required=False,
+    default="backup",
+    help=(
+        "Run the whole backup against a local S3 stand-in, or only measure one component against local input: "
+        "`listing` parses an `s5cmd ls` listing of `--blobs` lines, `hashing` checksums `--blobs` files, `scan` "
+        "measures a tree of `--blobs` files, and `pack` compares storing `--chunks` Zarr chunks as files or packs."
+    ),
+)
+@click.option(
+    "--directory",
+    type=click.Path(file_okay=False, path_type=pathlib.Path),
+    required=False,
+    default=None,
+    help="Where to generate the synthetic bucket and local backup. Defaults to a new temporary directory.",
+)
+@click.option("--blobs", "number_of_blobs", type=int, default=1_000, help="The number of blobs to generate.")
+@click.option("--zarrs", "number_of_zarrs", type=int, default=4, help="The number of Zarr stores to generate.")
+@click.option(
+    "--chunks", "number_of_chunks_per_zarr", type=int, default=1_000, help="The number of chunks per Zarr store."
+)
+@click.option(
+    "--nonblobs", "number_of_nonblob_files", type=int, default=100, help="The number of Dandiset files to generate."
+)
+@click.option(
+    "--size", "object_size_in_bytes", type=int, default=65_536, help="The average size of each object in bytes."
+)
+@click.option(
+    "--syscalls",
+    "count_syscalls",
+    is_flag=True,
+    default=False,
+    help="Count the system calls of each operation with `strace` (slows them down).",
+)
+@click.option(
+    "--output",
+    "output_file_path",
+    type=click.Path(dir_okay=False, path_type=pathlib.Path),
+    required=False,
+    default=None,
+    help="A JSON file to write the results to, for comparison between versions.",
+)
+def _s3backup_dandi_benchmark(
+    mode: typing.Literal["backup", "listing", "hashing", "scan", "pack"] = "backup",
+    directory: pathlib.Path | None = None,
+    number_of_blobs: int = 1_000,
+    number_of_zarrs: int = 4,
+    number_of_chunks_per_zarr: int = 1_000,
+    number_of_nonblob_files: int = 100,
+    object_size_in_bytes: int = 65_536,
+    count_syscalls: bool = False,
+    output_file_path: pathlib.Path | None = None,
+) -> None:
+    """
+    Measure the backup against a synthetic DANDI-shaped bucket served by a local S3 stand-in.
+    """
+    if mode != "backup":
+        benchmark_dandi_component(
+            component=mode,
+            directory=directory,
+            number_of_objects=number_of_chunks_per_zarr if mode == "pack" else number_of_blobs,
+            object_size_in_bytes=object_size_in_bytes,
+            count_syscalls=count_syscalls,
+            output_file_path=output_file_path,
+        )
+        return
+
+    benchmark_dandi_backup(
+        directory=directory,
+        number_of_blobs=number_of_blobs,
+        number_of_zarrs=number_of_zarrs,
+        number_of_chunks_per_zarr=number_of_chunks_per_zarr,
+        number_of_nonblob_files=number_of_nonblob_files,
+        object_size_in_bytes=object_size_in_bytes,
+        count_syscalls=count_syscalls,
+        output_file_path=output_file_path,
+    )
+
+
+# s3backup dandi simulate
+@_s3backup_dandi.command(name="simulate")
+@click.option("--tasks", "number_of_tasks", type=int, default=16, help="The number of concurrent array tasks.")
+@click.option("--intervals", "number_of_intervals", type=int, default=120, help="The number of control intervals.")
+@click.option(
+    "--request-rate",
+    "max_request_rate",
+    type=float,
+    default=3_500.0,
+    help="The requests per second S3 serves before throttling.",
+)
+@click.option(
+    "--filesystem-bandwidth",
+    "filesystem_bandwidth_in_bytes_per_second",
+    type=float,
+    default=2_147_483_648.0,
+    help="The write bandwidth of the shared filesystem, in bytes per second.",
+)
+@click.option(
+    "--max-bandwidth",
+    "max_bandwidth_in_bytes_per_second",
+    type=float,
+    required=False,
+    default=None,
+    help="The global bandwidth cap, in bytes per second.",
+)
+@click.option("--max-workers", type=int, required=False, default=None, help="The global cap on the number of workers.")
+@click.option(
+    "--output",
+    "output_file_path",
+    type=click.Path(dir_okay=False, path_type=pathlib.Path),
+    required=False,
+    default=None,
+    help="A JSON file to write the state at each interval to.",
+)
+def _s3backup_dandi_simulate(
+    number_of_tasks: int = 16,
+    number_of_intervals: int = 120,
+    max_request_rate: float = 3_500.0,
+    filesystem_bandwidth_in_bytes_per_second: float = 2_147_483_648.0,
+    max_bandwidth_in_bytes_per_second: float | None = None,
+    max_workers: int | None = None,
+    output_file_path: pathlib.Path | None = None,
+) -> None:
+    """
+    Simulate the adaptive transfer controllers of many array tasks against a model of S3 and the filesystem.
+    """
+    simulate_transfer_controller(
+        number_of_tasks=number_of_tasks,
+        number_of_intervals=number_of_intervals,
+        max_request_rate=max_request_rate,
+        filesystem_bandwidth_in_bytes_per_second=filesystem_bandwidth_in_bytes_per_second,
+        max_bandwidth_in_bytes_per_second=max_bandwidth_in_bytes_per_second,
+        max_workers=max_workers,
+        output_file_path=output_file_path,
+    )
 
 
 # s3backup dandi dashboard
@@ -0,0 +1,6 @@
+import os
+import tempfile
+
+# The globals are read when the package is first imported, so that the backup directory (and its run logs) must be
+# redirected before any test module imports it
+os.environ.setdefault("S3BACKUP_DANDI_ROOT", tempfile.mkdtemp(prefix="s3backup_tests_"))
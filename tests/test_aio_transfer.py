@@ -0,0 +1,83 @@
+import os
+import pathlib
+import random
+import socket
+
+import pytest
+
+from simple_s3_backup._base._aio_transfer import _sync_prefixes_with_aio
+
+boto3 = pytest.importorskip("boto3")
+pytest.importorskip("aiobotocore")
+moto_server = pytest.importorskip("moto.server")
+
+_BUCKET = "dandiarchive"
+
+
+@pytest.fixture(scope="module")
+def s3_endpoint_url() -> str:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    server = moto_server.ThreadedMotoServer(ip_address="127.0.0.1", port=port, verbose=False)
+    server.start()
+    yield f"http://127.0.0.1:{port}"
+    server.stop()
+
+
+@pytest.fixture
+def bucket(s3_endpoint_url: str, monkeypatch: pytest.MonkeyPatch) -> dict[str, bytes]:
+    monkeypatch.setenv("S3_ENDPOINT_URL", s3_endpoint_url)
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+
+    client = boto3.client("s3", endpoint_url=s3_endpoint_url)
+    client.create_bucket(Bucket=_BUCKET)
+    random_generator = random.Random(0)
+    key_to_data = {
+        "blobs/abc/def/small": random_generator.randbytes(100),
+        "blobs/abc/def/ranged": random_generator.randbytes(10_000),
+        "blobs/abc/012/exact": random_generator.randbytes(4_096),
+        "blobs/abc/012/empty": b"",
+        "blobs/fed/cba/other": random_generator.randbytes(5_000),
+    }
+    for key, data in key_to_data.items():
+        client.put_object(Bucket=_BUCKET, Key=key, Body=data)
+
+    yield key_to_data
+
+    for key in key_to_data:
+        client.delete_object(Bucket=_BUCKET, Key=key)
+    client.delete_bucket(Bucket=_BUCKET)
+
+
+def test_sync_prefixes_with_aio(bucket: dict[str, bytes], tmp_path: pathlib.Path) -> None:
+    prefix_to_destination = {"blobs/abc/": tmp_path / "abc", "blobs/fed/": tmp_path / "fed"}
+
+    # Objects larger than the part size are downloaded through several range GETs
+    summary = _sync_prefixes_with_aio(
+        prefix_to_destination=prefix_to_destination, bucket=_BUCKET, max_concurrency=4, part_size_in_bytes=4_096
+    )
+
+    assert summary["listed"] == len(bucket)
+    assert summary["copied"] == len(bucket)
+    assert summary["errors"] == 0
+    assert summary["bytes"] == sum(len(data) for data in bucket.values())
+    for key, data in bucket.items():
+        prefix = key[: len("blobs/abc/")]
+        assert (prefix_to_destination[prefix] / key.removeprefix(prefix)).read_bytes() == data
+    assert list(tmp_path.rglob("*.partial")) == []
+
+    # Unchanged objects are skipped; a truncated local copy is downloaded again
+    truncated_file_path = tmp_path / "abc" / "def" / "ranged"
+    truncated_file_path.write_bytes(bucket["blobs/abc/def/ranged"][:100])
+    os.utime(truncated_file_path, times=(0, 0))
+
+    summary = _sync_prefixes_with_aio(
+        prefix_to_destination=prefix_to_destination, bucket=_BUCKET, max_concurrency=4, part_size_in_bytes=4_096
+    )
+
+    assert summary["copied"] == 1
+    assert summary["skipped"] == len(bucket) - 1
+    assert truncated_file_path.read_bytes() == bucket["blobs/abc/def/ranged"]
@@ -0,0 +1,35 @@
+import pytest
+
+from simple_s3_backup._base import _checkpoint
+from simple_s3_backup._base._checkpoint import _TaskCheckpoint
+
+
+@pytest.fixture(autouse=True)
+def checkpoints_directory(tmp_path, monkeypatch):
+    monkeypatch.setattr(_checkpoint, "_CHECKPOINTS_DIRECTORY", tmp_path)
+    monkeypatch.delenv("S3BACKUP_CYCLE", raising=False)
+    return tmp_path
+
+
+def test_checkpoint_resumes_within_its_cycle():
+    checkpoint = _TaskCheckpoint(name="blobs_a", cycle="2026-10-17")
+    checkpoint.mark_completed(unit="a0", bytes_moved=10)
+
+    resumed = _TaskCheckpoint(name="blobs_a", cycle="2026-10-17")
+    assert "a01" in resumed and "a1" not in resumed
+    assert resumed.bytes_moved == 10
+    assert resumed.started == checkpoint.started
+
+
+def test_checkpoint_is_discarded_in_another_cycle():
+    _TaskCheckpoint(name="blobs_a", cycle="2026-10-17").mark_completed(unit="a0")
+
+    assert "a01" not in _TaskCheckpoint(name="blobs_a", cycle="2026-10-18")
+
+
+def test_checkpoint_cycle_is_taken_from_the_environment(monkeypatch):
+    monkeypatch.setenv("S3BACKUP_CYCLE", "job_42")
+    _TaskCheckpoint(name="zarr_0a").mark_completed(unit="0a1")
+
+    assert "0a1" in _TaskCheckpoint(name="zarr_0a")
+    assert "0a1" not in _TaskCheckpoint(name="zarr_0a", cycle="job_43")
@@ -0,0 +1,76 @@
+import hashlib
+
+from simple_s3_backup._base._checksum_store import _ChecksumStore, _decode_etag, _encode_etag
+
+_BLOB_IDS = [f"{index:08x}-0000-4000-8000-000000000000" for index in range(64)]
+
+
+def _digest(index: int) -> bytes:
+    return hashlib.sha256(str(index).encode()).digest()
+
+
+def test_append_snapshot_compact_and_reopen(tmp_path):
+    with _ChecksumStore(directory=tmp_path, name="local_checksums", compaction_threshold=16) as store:
+        for index, blob_id in enumerate(_BLOB_IDS[:32]):
+            store.put(blob_id=blob_id, value=_digest(index=index))
+    # More entries than the threshold were folded into the snapshot on close
+    assert (tmp_path / "local_checksums.snapshot").exists()
+    assert (tmp_path / "local_checksums.log").stat().st_size == 0
+
+    with _ChecksumStore(directory=tmp_path, name="local_checksums", compaction_threshold=16) as store:
+        for index, blob_id in enumerate(_BLOB_IDS[32:], start=32):
+            store.put(blob_id=blob_id, value=_digest(index=index))
+        store.put(blob_id=_BLOB_IDS[0], value=_digest(index=-1))
+
+    # A torn record at the end of the log is dropped on open
+    with (tmp_path / "local_checksums.log").open(mode="ab") as file_stream:
+        file_stream.write(b"torn")
+
+    with _ChecksumStore(directory=tmp_path, name="local_checksums") as store:
+        assert store.get(blob_id=_BLOB_IDS[0]) == _digest(index=-1)
+        assert all(
+            store.get(blob_id=blob_id) == _digest(index=index) for index, blob_id in enumerate(_BLOB_IDS) if index > 0
+        )
+        store.compact()
+        assert store.get(blob_id=_BLOB_IDS[0]) == _digest(index=-1)
+        assert len({blob_id for blob_id, _ in store.items()}) == len(_BLOB_IDS)
+
+    with _ChecksumStore(directory=tmp_path, name="local_checksums", read_only=True) as store:
+        assert store.get(blob_id=_BLOB_IDS[63]) == _digest(index=63)
+        assert "ffffffff-0000-4000-8000-000000000000" not in store
+
+
+def test_deleted_entries_stay_deleted_through_compaction(tmp_path):
+    with _ChecksumStore(directory=tmp_path, name="local_checksums") as store:
+        store.put(blob_id=_BLOB_IDS[0], value=_digest(index=0))
+        store.put(blob_id=_BLOB_IDS[1], value=_digest(index=1))
+        store.compact()
+        store.delete(blob_id=_BLOB_IDS[0])
+        assert _BLOB_IDS[0] not in store
+
+    with _ChecksumStore(directory=tmp_path, name="local_checksums") as store:
+        assert _BLOB_IDS[0] not in store
+        assert dict(store.items())[_BLOB_IDS[0]] is None
+        store.compact()
+        assert _BLOB_IDS[0] not in store and store.get(blob_id=_BLOB_IDS[1]) == _digest(index=1)
+        assert [blob_id for blob_id, _ in store.items()] == [_BLOB_IDS[1]]
+
+        # A replaced copy is recorded again
+        store.put(blob_id=_BLOB_IDS[0], value=_digest(index=2))
+    with _ChecksumStore(directory=tmp_path, name="local_checksums") as store:
+        assert store.get(blob_id=_BLOB_IDS[0]) == _digest(index=2)
+
+
+def test_deletion_in_a_shard_hides_the_shared_entry(tmp_path):
+    shared_directory = tmp_path / "shared"
+    shard_directory = tmp_path / "shard"
+    shared_directory.mkdir()
+    shard_directory.mkdir()
+    with _ChecksumStore(directory=shared_directory, name="local_etags", value_size=20) as store:
+        store.put(blob_id=_BLOB_IDS[0], value=_encode_etag(etag="0123456789abcdef0123456789abcdef-3"))
+
+    shared_store = _ChecksumStore(directory=shared_directory, name="local_etags", value_size=20, read_only=True)
+    with _ChecksumStore(directory=shard_directory, name="local_etags", value_size=20, fallback=shared_store) as store:
+        assert _decode_etag(value=store.get(blob_id=_BLOB_IDS[0])) == "0123456789abcdef0123456789abcdef-3"
+        store.delete(blob_id=_BLOB_IDS[0])
+        assert _BLOB_IDS[0] not in store
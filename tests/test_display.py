@@ -0,0 +1,67 @@
+import json
+
+from simple_s3_backup._base import _display
+
+
+class _UnknownUsageListingSource:
+    def get_usage(self):
+        return dict()
+
+
+def test_remote_usage_cache_is_only_read_when_enabled(tmp_path, monkeypatch):
+    measured_units = []
+
+    def get_remote_du(unit):
+        measured_units.append(unit)
+        return unit, (10, 1)
+
+    monkeypatch.setattr(_display, "_get_listing_source", lambda manifests_directory: _UnknownUsageListingSource())
+    monkeypatch.setattr(_display, "_get_remote_du", get_remote_du)
+    cache_file_path = tmp_path / "remote_usage.json"
+    cache_file_path.write_text(json.dumps({"dandiarchive.json": [5, 5]}))
+
+    locations = ["dandiarchive.json", "dandisets/"]
+    assert _display._get_remote_usage(locations=locations, cache_file_path=cache_file_path) == {
+        "dandiarchive.json": (5, 5),
+        "dandisets/": (10, 1),
+    }
+    assert measured_units == ["dandisets/"]
+
+    measured_units.clear()
+    assert _display._get_remote_usage(locations=locations, cache_file_path=cache_file_path, use_cache=False) == {
+        "dandiarchive.json": (10, 1),
+        "dandisets/": (10, 1),
+    }
+    assert sorted(measured_units) == locations
+    assert json.loads(cache_file_path.read_text()) == {"dandiarchive.json": [10, 1], "dandisets/": [10, 1]}
+
+
+def test_trends_extrapolate_the_eta_from_the_last_week(tmp_path, monkeypatch):
+    history_file_path = tmp_path / "history.json"
+    history = _display._UsageHistory(file_path=history_file_path)
+    for day, local_size in (("2024-01-04", 100), ("2024-01-06", 300)):
+        history.record(
+            day=day,
+            location_to_values={
+                "blobs/": {"local_size": local_size, "remote_size": 1_000, "transferred_bytes": 100},
+                "dandisets/": {"local_size": 10, "remote_size": 10, "transferred_bytes": 0},
+            },
+        )
+    history.save()
+
+    monkeypatch.setattr(_display, "_HISTORY_FILE_PATH", history_file_path)
+    monkeypatch.setattr(_display, "_get_today", lambda: "2024-01-08")
+    monkeypatch.setattr(_display, "_get_transferred_bytes", lambda day, locations: {"blobs/": 400})
+    data = {
+        "outer_directory_to_local_size": {"blobs/": 500, "dandisets/": 10},
+        "outer_directory_to_remote_size": {"blobs/": 1_000, "dandisets/": 10},
+        "outer_directory_to_local_object_count": {"blobs/": 5, "dandisets/": 1},
+        "outer_directory_to_remote_object_count": {"blobs/": 10, "dandisets/": 1},
+    }
+
+    columns = _display._build_trends_json(data=data, locations=["blobs/", "dandisets/"])["data"]
+
+    # The backlog shrank from 900 to 500 bytes over 4 days, so the remaining 500 bytes take 5 more days
+    assert columns["ETA"] == ["~5 days", "Caught up"]
+    assert columns["Rate (7 days)"][0] == f"{_display._human_readable_size(size_in_bytes=200)}/day"
+    assert _display._UsageHistory(file_path=history_file_path).days == ["2024-01-04", "2024-01-06", "2024-01-08"]
@@ -0,0 +1,62 @@
+import json
+
+from simple_s3_backup._base import _history, _metrics
+from simple_s3_backup._base._history import _UsageHistory
+
+
+def test_history_records_out_of_order_days_and_trims(tmp_path):
+    history_file_path = tmp_path / "history.json"
+    history = _UsageHistory(file_path=history_file_path, max_days=3)
+    history.record(day="2024-01-03", location_to_values={"blobs/": {"local_size": 3}})
+    history.record(day="2024-01-01", location_to_values={"blobs/": {"local_size": 1}, "dandisets/": {"local_size": 7}})
+    history.record(day="2024-01-03", location_to_values={"blobs/": {"remote_size": 5}})
+    history.save()
+
+    reopened_history = _UsageHistory(file_path=history_file_path, max_days=3)
+    assert reopened_history.get_series(location="blobs/", field="local_size") == [("2024-01-01", 1), ("2024-01-03", 3)]
+    assert reopened_history.get_series(location="blobs/", field="remote_size", days=1) == [("2024-01-03", 5)]
+    assert reopened_history.get_series(location="dandisets/", field="local_size") == [
+        ("2024-01-01", 7),
+        ("2024-01-03", None),
+    ]
+
+    reopened_history.record(day="2024-01-04", location_to_values={"blobs/": {"local_size": 4}})
+    reopened_history.record(day="2024-01-05", location_to_values={"blobs/": {"local_size": 5}})
+    assert reopened_history.days == ["2024-01-03", "2024-01-04", "2024-01-05"]
+    assert reopened_history.get_series(location="blobs/", field="local_size") == [
+        ("2024-01-03", 3),
+        ("2024-01-04", 4),
+        ("2024-01-05", 5),
+    ]
+
+
+def test_catch_up_rate_is_the_daily_shrinkage_of_the_backlog(tmp_path):
+    history = _UsageHistory(file_path=tmp_path / "history.json")
+    assert _history._get_catch_up_rate(history=history, location="blobs/") is None
+
+    for day, local_size in (("2024-01-01", 100), ("2024-01-02", None), ("2024-01-05", 180)):
+        history.record(day=day, location_to_values={"blobs/": {"local_size": local_size, "remote_size": 300}})
+    assert _history._get_catch_up_rate(history=history, location="blobs/") == 20
+
+
+def test_transferred_bytes_are_attributed_to_locations(tmp_path, monkeypatch):
+    monkeypatch.setattr(_metrics, "_METRICS_DIRECTORY", tmp_path)
+    monkeypatch.setattr(_history, "_METRICS_DIRECTORY", tmp_path)
+    assert _history._get_transferred_bytes(day="2024-01-01", locations=["blobs/"]) == dict()
+
+    records = [
+        {"kind": "command", "name": "s5cmd cp", "prefix": "blobs/abc", "bytes": 10},
+        {"kind": "command", "name": "s5cmd run", "prefix": "blobs_3", "bytes": 20},
+        {"kind": "command", "name": "aio cp", "prefix": "dandisets/", "bytes": 40},
+        {"kind": "command", "name": "s5cmd du", "prefix": "blobs/abc", "surveyed_bytes": 80},
+        {"kind": "log", "name": "s5cmd cp", "prefix": "blobs/abc", "bytes": 160},
+    ]
+    (tmp_path / "2024-01-01").mkdir()
+    with (tmp_path / "2024-01-01" / "1_0.jsonl").open(mode="w") as file_stream:
+        file_stream.writelines(f"{json.dumps(record)}\n" for record in records)
+
+    assert _history._get_transferred_bytes(day="2024-01-01", locations=["blobs/", "dandisets/", "zarr/"]) == {
+        "blobs/": 30,
+        "dandisets/": 40,
+        "zarr/": 0,
+    }
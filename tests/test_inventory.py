@@ -0,0 +1,52 @@
+import threading
+
+from simple_s3_backup._base import _inventory
+from simple_s3_backup._base._inventory import _read_s5cmd_ls_blobs, _refresh_s5cmd_ls_blobs
+
+_BLOB_IDS = [
+    "0a1b2c3d-0000-4000-8000-000000000000",
+    "3fffffff-0000-4000-8000-000000000000",
+    "40000000-0000-4000-8000-000000000000",
+    "7fffffff-0000-4000-8000-000000000000",
+    "80000000-0000-4000-8000-000000000000",
+]
+
+
+def test_read_s5cmd_ls_blobs_filters_prefix_range(tmp_path):
+    file_path = tmp_path / "s5cmd_ls_blobs.txt"
+    lines = [
+        f'2024/01/31 12:34:56 "0123456789abcdef0123456789abcdef" {index + 1} {blob_id[:3]}/{blob_id[3:6]}/{blob_id}'
+        for index, blob_id in enumerate(_BLOB_IDS)
+    ]
+    file_path.write_text("\n".join([*lines, "2024/01/31 12:34:56 7 abc/def/not_a_blob"]) + "\n")
+
+    inventory = _read_s5cmd_ls_blobs(file_path=file_path, chunk_size_in_bytes=64, prefix_range=("400", "800"))
+    assert [(blob_id, size) for blob_id, size, _ in inventory] == [(_BLOB_IDS[2], 3), (_BLOB_IDS[3], 4)]
+
+    inventory = _read_s5cmd_ls_blobs(file_path=file_path, prefix_range=("400", None))
+    assert [blob_id for blob_id, _, _ in inventory] == _BLOB_IDS[2:]
+    assert len(_read_s5cmd_ls_blobs(file_path=file_path)) == len(_BLOB_IDS)
+
+
+def test_refresh_s5cmd_ls_blobs_lists_once_and_replaces_atomically(tmp_path, monkeypatch):
+    commands = []
+
+    def deploy_subprocess(command: str) -> None:
+        commands.append(command)
+        temporary_file_path = command.rsplit("> ", maxsplit=1)[-1]
+        assert temporary_file_path.endswith(".tmp")
+        with open(temporary_file_path, mode="w") as file_stream:
+            file_stream.write("listing\n")
+
+    monkeypatch.setattr(_inventory, "_deploy_subprocess", deploy_subprocess)
+    threads = [
+        threading.Thread(target=_refresh_s5cmd_ls_blobs, kwargs={"manifests_directory": tmp_path}) for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(commands) == 1
+    assert (tmp_path / "s5cmd_ls_blobs.txt").read_text() == "listing\n"
+    assert not (tmp_path / "s5cmd_ls_blobs.tmp").exists()
@@ -0,0 +1,74 @@
+import pathlib
+
+import pytest
+
+from simple_s3_backup._base._inventory import _BlobInventory
+from simple_s3_backup._base._inventory_index import (
+    _iter_index_records,
+    _merge_inventory_into_index,
+    _read_inventory_deltas,
+    _save_inventory_delta_cursor,
+)
+
+_BLOB_IDS = [f"{index:08x}-0000-4000-8000-000000000000" for index in range(4)]
+
+
+def _make_inventory(records: list[tuple[str, int, int]]) -> _BlobInventory:
+    inventory = _BlobInventory()
+    for blob_id, size, mtime in records:
+        inventory.append(blob_id=blob_id.encode("ascii"), size=size, mtime=mtime)
+    return inventory
+
+
+def test_merge_records_deltas_consumed_through_the_cursor(tmp_path):
+    index_file_path = tmp_path / "inventory_index.bin"
+    deltas_directory = tmp_path / "inventory_deltas"
+    deltas_directory.mkdir()
+
+    first = _make_inventory(records=[(_BLOB_IDS[0], 1, 10), (_BLOB_IDS[1], 2, 20)])
+    counts = _merge_inventory_into_index(
+        inventory=first, index_file_path=index_file_path, delta_file_path=deltas_directory / "2026-10-17.txt"
+    )
+    assert counts == {"added": 2, "changed": 0, "deleted": 0}
+    blob_ids, cursor = _read_inventory_deltas(deltas_directory=deltas_directory)
+    assert blob_ids == set(_BLOB_IDS[:2])
+    _save_inventory_delta_cursor(deltas_directory=deltas_directory, cursor=cursor)
+
+    second = _make_inventory(records=[(_BLOB_IDS[1], 3, 20), (_BLOB_IDS[2], 4, 40)])
+    counts = _merge_inventory_into_index(
+        inventory=second, index_file_path=index_file_path, delta_file_path=deltas_directory / "2026-10-18.txt"
+    )
+    assert counts == {"added": 1, "changed": 1, "deleted": 1}
+    assert _read_inventory_deltas(deltas_directory=deltas_directory)[0] == set(_BLOB_IDS[1:3])
+    assert [record[0].decode("ascii") for record in _iter_index_records(file_path=index_file_path)] == _BLOB_IDS[1:3]
+
+
+def test_interrupted_merge_never_loses_the_delta(tmp_path, monkeypatch):
+    index_file_path = tmp_path / "inventory_index.bin"
+    deltas_directory = tmp_path / "inventory_deltas"
+    deltas_directory.mkdir()
+    delta_file_path = deltas_directory / "2026-10-18.txt"
+    inventory = _make_inventory(records=[(_BLOB_IDS[0], 1, 10)])
+
+    # Interrupted once the delta is in place but before the index is
+    original_replace = pathlib.Path.replace
+
+    def replace(self: pathlib.Path, target: pathlib.Path) -> pathlib.Path:
+        if pathlib.Path(target) == index_file_path:
+            raise KeyboardInterrupt
+        return original_replace(self, target)
+
+    monkeypatch.setattr(pathlib.Path, "replace", replace)
+    with pytest.raises(KeyboardInterrupt):
+        _merge_inventory_into_index(
+            inventory=inventory, index_file_path=index_file_path, delta_file_path=delta_file_path
+        )
+    monkeypatch.undo()
+
+    assert not index_file_path.exists()
+    assert _read_inventory_deltas(deltas_directory=deltas_directory)[0] == {_BLOB_IDS[0]}
+
+    # The rerun records the same change again, which is consumed once
+    _merge_inventory_into_index(inventory=inventory, index_file_path=index_file_path, delta_file_path=delta_file_path)
+    assert len(delta_file_path.read_text().splitlines()) == 2
+    assert _read_inventory_deltas(deltas_directory=deltas_directory)[0] == {_BLOB_IDS[0]}
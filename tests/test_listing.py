@@ -0,0 +1,50 @@
+import gzip
+import json
+
+import pytest
+
+from simple_s3_backup._base._listing import _ListingSource, _S3InventoryListingSource
+
+_BLOB_IDS = ["0a1b2c3d-0000-4000-8000-000000000000", "80000000-0000-4000-8000-000000000000"]
+
+
+def test_listing_source_is_abstract(tmp_path):
+    with pytest.raises(TypeError):
+        _ListingSource(manifests_directory=tmp_path)
+
+
+def test_s3_inventory_skips_objects_that_are_not_blobs(tmp_path):
+    report_directory = tmp_path / "reports" / "2026-10-18T01-00Z"
+    data_directory = tmp_path / "reports" / "data"
+    report_directory.mkdir(parents=True)
+    data_directory.mkdir()
+    rows = [
+        *(
+            f'"dandiarchive","blobs/{blob_id[:3]}/{blob_id[3:6]}/{blob_id}","{index + 1}"'
+            for index, blob_id in enumerate(_BLOB_IDS)
+        ),
+        '"dandiarchive","blobs/abc/def/stray.txt","7"',
+        '"dandiarchive","blobs/abc/def/","0"',
+        '"dandiarchive","zarr/0a1b2c3d/.zarray","9"',
+    ]
+    lines = [f'{row},"2026-10-17T12:34:56.000Z","0123456789abcdef0123456789abcdef"\n' for row in rows]
+    with gzip.open(data_directory / "report.csv.gz", mode="wt") as file_stream:
+        file_stream.writelines(lines)
+    manifest = {
+        "fileFormat": "CSV",
+        "fileSchema": "Bucket, Key, Size, LastModifiedDate, ETag",
+        "creationTimestamp": "1792285200000",
+        "files": [{"key": "inventory/data/report.csv.gz", "size": 0}],
+    }
+    (report_directory / "manifest.json").write_text(json.dumps(manifest))
+
+    listing_source = _S3InventoryListingSource(manifests_directory=tmp_path, location=str(tmp_path / "reports"))
+    listing_source.refresh()
+
+    assert [(blob_id, size) for blob_id, size, _ in listing_source.read_blob_inventory()] == [
+        (_BLOB_IDS[0], 1),
+        (_BLOB_IDS[1], 2),
+    ]
+    assert [blob_id for blob_id, _, _ in listing_source.read_blob_inventory(prefix_range=("800", None))] == [
+        _BLOB_IDS[1]
+    ]
@@ -0,0 +1,69 @@
+import collections
+import json
+
+import pytest
+
+from simple_s3_backup._base import _nonblobs
+
+
+@pytest.fixture
+def copied_commands(tmp_path, monkeypatch):
+    commands_run = []
+
+    def run_s5cmd_batch(commands, command_file_path, number_of_workers, prefix):
+        commands_run.extend(commands)
+        return collections.Counter(objects=len(commands), errors=0, bytes=0)
+
+    monkeypatch.setattr(_nonblobs, "BACKUP_DIRECTORY", tmp_path / "backup")
+    monkeypatch.setattr(_nonblobs, "_NONBLOBS_MANIFESTS_DIRECTORY", tmp_path / "backup" / "manifests" / "nonblobs")
+    monkeypatch.setattr(_nonblobs, "_run_s5cmd_batch", run_s5cmd_batch)
+    return commands_run
+
+
+def test_top_level_locations_skip_blobs_and_zarr(monkeypatch):
+    lines = [
+        {"key": "s3://dandiarchive/blobs/", "type": "directory"},
+        {"key": "s3://dandiarchive/dandiarchive/", "type": "directory"},
+        {"key": "s3://dandiarchive/dandisets/", "type": "directory"},
+        {"key": "s3://dandiarchive/README.md", "type": "file", "size": 10, "etag": '"abc"'},
+        {"key": "s3://dandiarchive/zarr/", "type": "directory"},
+    ]
+    monkeypatch.setattr(_nonblobs, "DANDI_BUCKET", "dandiarchive")
+    monkeypatch.setattr(_nonblobs, "_stream_subprocess", lambda command: (json.dumps(line) for line in lines))
+
+    assert _nonblobs._get_nonblob_locations() == [
+        ("directory", "dandisets/", 0, ""),
+        ("file", "README.md", 10, "abc"),
+    ]
+
+
+def test_location_sync_only_copies_changed_objects(tmp_path, copied_commands):
+    destination = tmp_path / "s3dandiarchive"
+    entries = [("file", "dandisets/000001/dandiset.yaml", 10, "a"), ("file", "dandisets/000002/dandiset.yaml", 10, "b")]
+
+    summary = _nonblobs._sync_nonblob_location(location="dandisets/", entries=entries, destination=destination)
+    assert summary["listed"] == 2 and summary["changed"] == 2 and summary["objects"] == 2
+    assert all(command.startswith("cp --if-size-differ --if-source-newer ") for command in copied_commands)
+
+    # An object whose ETag changed is copied again, even if its size did not, while removed objects are only counted
+    copied_commands.clear()
+    entries = [("file", "dandisets/000001/dandiset.yaml", 10, "c"), ("file", "dandisets/000003/dandiset.yaml", 5, "d")]
+    summary = _nonblobs._sync_nonblob_location(location="dandisets/", entries=entries, destination=destination)
+    assert summary["changed"] == 2 and summary["deleted"] == 1
+    assert copied_commands == [
+        f"cp s3://{_nonblobs.DANDI_BUCKET}/{key} {destination}/{key}" for _, key, _, _ in entries
+    ]
+
+    manifest_file_path = tmp_path / "backup" / "manifests" / "nonblobs" / "dandisets.tsv"
+    assert manifest_file_path.read_text() == "".join(f"{key}\t{size}\t{etag}\n" for _, key, size, etag in entries)
+
+    copied_commands.clear()
+    assert _nonblobs._sync_nonblob_location(location="dandisets/", entries=entries, destination=destination) == {
+        "listed": 2,
+        "changed": 0,
+        "deleted": 0,
+        "objects": 0,
+        "errors": 0,
+        "bytes": 0,
+    }
+    assert copied_commands == []
@@ -0,0 +1,77 @@
+import os
+import pathlib
+import re
+import time
+
+import pytest
+import yaml
+
+from simple_s3_backup._base import _quarantine
+
+
+@pytest.fixture
+def dandi_root(tmp_path, monkeypatch):
+    (tmp_path / "backup" / "manifests").mkdir(parents=True)
+    monkeypatch.setattr(_quarantine, "BACKUP_DIRECTORY", tmp_path / "backup")
+    monkeypatch.setattr(
+        _quarantine, "_PARTITION_PATTERN", re.compile(rf"^{re.escape(str(tmp_path))}/(?P<partition>[^/]+)/")
+    )
+    return tmp_path
+
+
+def _quarantine_blob(dandi_root, partition, name, size_in_bytes, grace_period_in_days, replaced=True):
+    original_path = dandi_root / partition / "s3dandiarchive" / "blobs" / name
+    original_path.parent.mkdir(parents=True, exist_ok=True)
+    path = original_path.with_name(f"{name}.rmv")
+    path.write_bytes(b"0" * size_in_bytes)
+    if replaced is True:
+        original_path.write_bytes(b"1")
+
+    with _quarantine._open_quarantine_store(manifests_directory=dandi_root / "backup" / "manifests") as store:
+        store.add(path=path, original_path=original_path, grace_period_in_days=grace_period_in_days)
+    return path
+
+
+def test_only_expired_and_replaced_copies_are_deleted(dandi_root):
+    expired_path = _quarantine_blob(dandi_root, "001", "a", size_in_bytes=8192, grace_period_in_days=0)
+    kept_path = _quarantine_blob(dandi_root, "001", "b", size_in_bytes=8192, grace_period_in_days=180)
+    awaiting_path = _quarantine_blob(dandi_root, "002", "c", size_in_bytes=8192, grace_period_in_days=0, replaced=False)
+    gone_path = _quarantine_blob(dandi_root, "002", "d", size_in_bytes=8192, grace_period_in_days=0)
+    gone_path.unlink()
+
+    dry_run_summary = _quarantine.collect_dandi_garbage(dry_run=True)
+    assert dry_run_summary["partitions"] == {"001": {"files": 1, "bytes": os.stat(expired_path).st_blocks * 512}}
+    assert expired_path.exists()
+
+    summary = _quarantine.collect_dandi_garbage()
+    assert summary["partitions"] == dry_run_summary["partitions"]
+    assert summary["awaiting_replacement"] == 1 and summary["missing"] == 1
+    assert not expired_path.exists() and kept_path.exists() and awaiting_path.exists()
+
+    # The copy awaiting its replacement is deleted by a later run once the blob has been downloaded again
+    awaiting_path.with_name("c").write_bytes(b"1")
+    summary = _quarantine.collect_dandi_garbage()
+    assert summary["partitions"] == {"002": {"files": 1, "bytes": summary["partitions"]["002"]["bytes"]}}
+    assert summary["awaiting_replacement"] == 0 and summary["missing"] == 0
+    assert not awaiting_path.exists() and kept_path.exists()
+
+    with _quarantine._open_quarantine_store(manifests_directory=dandi_root / "backup" / "manifests") as store:
+        assert len(store) == 1
+
+
+def test_legacy_removal_list_is_migrated(dandi_root):
+    manifests_directory = dandi_root / "backup" / "manifests"
+    legacy_file_path = manifests_directory / "blobs_to_remove.yaml"
+    old_path = pathlib.Path(dandi_root / "001" / "old.rmv")
+    recent_path = pathlib.Path(dandi_root / "001" / "recent.rmv")
+    with legacy_file_path.open(mode="w") as file_stream:
+        yaml.dump(data={old_path: 0, str(recent_path): 180}, stream=file_stream)
+    os.utime(legacy_file_path, times=(time.time() - 86_400, time.time() - 86_400))
+
+    with _quarantine._open_quarantine_store(manifests_directory=manifests_directory) as store:
+        assert len(store) == 2
+        expired_entries = [entry for batch in store.iter_expired(now=time.time()) for entry in batch]
+        assert expired_entries == [(str(old_path), str(dandi_root / "001" / "old"))]
+
+    assert not legacy_file_path.exists()
+    assert legacy_file_path.with_suffix(".yaml.migrated").exists()
@@ -0,0 +1,71 @@
+from simple_s3_backup._base._inventory import _BlobInventory
+from simple_s3_backup._base._reconcile import _classify_blobs
+
+
+def _blob_id(index: int) -> bytes:
+    return f"{index:08x}-0000-0000-0000-000000000000".encode("ascii")
+
+
+def _make_inventories():
+    remote_inventory = _BlobInventory()
+    local_inventory = _BlobInventory()
+    etag = b"0" * 32
+    # Index: (remote size, remote mtime, remote ETag), (local size, local mtime) or None
+    blobs = {
+        1: ((100, 1_000, etag), None),  # 1: not downloaded yet
+        2: ((100, 2_000, etag), (100, 1_000)),  # 2: remote is newer
+        3: ((100, 1_000, etag), (50, 2_000)),  # 3a: partially downloaded
+        4: ((100, 1_000, etag), (150, 2_000)),  # 3b: larger locally
+        5: ((100, 1_000, etag), (100, 2_000)),  # 4: same size, downloaded after upload
+        6: ((100, 1_000, None), (100, 2_000)),  # 4, but nothing to compare against
+        7: ((100, 1_000, None), (100, 2_000)),  # 4, compared by its remote checksum
+        9: (None, (100, 2_000)),  # Only local
+        10: (None, (100, 2_000)),  # Only local, after the last remote blob
+    }
+    for index, (remote, local) in blobs.items():
+        if remote is not None:
+            remote_inventory.append(blob_id=_blob_id(index), size=remote[0], mtime=remote[1], etag=remote[2])
+        if local is not None:
+            local_inventory.append(blob_id=_blob_id(index), size=local[0], mtime=local[1])
+    return remote_inventory, local_inventory
+
+
+def test_classify_blobs_covers_every_case():
+    remote_inventory, local_inventory = _make_inventories()
+    report = _classify_blobs(
+        remote_inventory=remote_inventory,
+        local_inventory=local_inventory,
+        remote_checksums={_blob_id(7).decode("ascii")},
+    )
+
+    expected_indices = {
+        "1": [1],
+        "2": [2],
+        "3a": [3],
+        "3b": [4],
+        "4": [5, 7],
+        "missing_remote_checksum": [6],
+        "local_only": [9, 10],
+    }
+    assert report.case_to_blob_ids == {
+        case: [_blob_id(index).decode("ascii") for index in indices] for case, indices in expected_indices.items()
+    }
+    assert report.blob_id_to_details[_blob_id(3).decode("ascii")] == (100, 1_000, 50, 2_000)
+    assert _blob_id(5).decode("ascii") not in report.blob_id_to_details
+
+
+def test_classify_blobs_with_limit_reports_no_trailing_orphans():
+    remote_inventory, local_inventory = _make_inventories()
+    report = _classify_blobs(
+        remote_inventory=remote_inventory, local_inventory=local_inventory, remote_checksums=set(), limit=2
+    )
+
+    assert report.get_counts() == {
+        "1": 1,
+        "2": 1,
+        "3a": 0,
+        "3b": 0,
+        "4": 0,
+        "missing_remote_checksum": 0,
+        "local_only": 0,
+    }
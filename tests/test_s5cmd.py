@@ -0,0 +1,109 @@
+import os
+import pathlib
+import sys
+
+import pytest
+
+from simple_s3_backup._base._s5cmd import _run_s5cmd_batch, _run_s5cmd_command
+
+# Answers each `cp` operation as `s5cmd --json` reports it, depending on the name of its source object
+_FAKE_S5CMD = f"""#!{sys.executable}
+import json
+import sys
+
+arguments = [argument for argument in sys.argv[1:] if argument != "--json"]
+if arguments[0] == "--numworkers":
+    arguments = arguments[2:]
+if arguments[0] == "run":
+    with open(arguments[1]) as file_stream:
+        operations = [line.split() for line in file_stream if line.strip()]
+else:
+    operations = [arguments]
+
+failed = False
+for operation, source, destination in operations:
+    name = source.rsplit("/", maxsplit=1)[-1]
+    if name.startswith("slowdown"):
+        error = (
+            f"{{operation}} {{source}} {{destination}}: SlowDown: Please reduce your request rate.\\n"
+            "\\tstatus code: 503, request id: 9B5A3E0C1D2F4A6B"
+        )
+    elif name.startswith("empty"):
+        error = f"{{operation}} {{source}} {{destination}}: no object found"
+    elif name.startswith("missing"):
+        error = (
+            f"{{operation}} {{source}} {{destination}}: NoSuchKey: The specified key does not exist.\\n"
+            "\\tstatus code: 404, request id: 503A1B2C3D4E5F60"
+        )
+    else:
+        record = {{"operation": operation, "success": True, "source": source, "destination": destination}}
+        print(json.dumps({{**record, "object": {{"type": "file", "size": len(name)}}}}))
+        continue
+
+    failed = True
+    command = f"{{operation}} {{source}} {{destination}}"
+    print(json.dumps({{"operation": operation, "command": command, "error": error}}))
+
+sys.exit(1 if failed else 0)
+"""
+
+
+@pytest.fixture
+def fake_s5cmd(tmp_path: pathlib.Path, monkeypatch: pytest.MonkeyPatch) -> pathlib.Path:
+    bin_directory = tmp_path / "bin"
+    bin_directory.mkdir()
+    s5cmd_file_path = bin_directory / "s5cmd"
+    s5cmd_file_path.write_text(_FAKE_S5CMD)
+    s5cmd_file_path.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_directory}{os.pathsep}{os.environ['PATH']}")
+    return s5cmd_file_path
+
+
+def test_run_s5cmd_batch_summarizes_json_output(fake_s5cmd: pathlib.Path, tmp_path: pathlib.Path) -> None:
+    # The key and request ID of a missing object contain "503", which is not throttling
+    names = ["abc", "defgh", "empty_*", "missing_1", "missing_503", "slowdown_1", "slowdown_2"]
+    commands = [f"cp s3://bucket/blobs/{name} {tmp_path / 'local' / name}" for name in names]
+
+    summary = _run_s5cmd_batch(commands=commands, command_file_path=tmp_path / "batches" / "test.txt")
+
+    assert summary == {
+        "objects": 2,
+        "errors": 4,
+        "throttled": 2,
+        "empty": 1,
+        "bytes": len("abc") + len("defgh"),
+    }
+    assert (tmp_path / "batches" / "test.txt").read_text().splitlines() == commands
+    assert len((tmp_path / "batches" / "test.jsonl").read_text().splitlines()) == len(names)
+
+
+def test_run_s5cmd_batch_without_errors(fake_s5cmd: pathlib.Path, tmp_path: pathlib.Path) -> None:
+    commands = [f"cp s3://bucket/blobs/{index:03d} {tmp_path / str(index)}" for index in range(100)]
+
+    summary = _run_s5cmd_batch(commands=commands, command_file_path=tmp_path / "test.txt", number_of_workers=8)
+
+    assert summary == {"objects": 100, "errors": 0, "throttled": 0, "empty": 0, "bytes": 300}
+
+
+def test_run_s5cmd_command_streams_json_output(fake_s5cmd: pathlib.Path, tmp_path: pathlib.Path) -> None:
+    assert _run_s5cmd_command(command=f"cp s3://bucket/blobs/abcd {tmp_path / 'abcd'}") == {
+        "objects": 1,
+        "errors": 0,
+        "throttled": 0,
+        "empty": 0,
+        "bytes": 4,
+    }
+    assert _run_s5cmd_command(command=f"cp s3://bucket/blobs/slowdown {tmp_path / 'slowdown'}") == {
+        "objects": 0,
+        "errors": 1,
+        "throttled": 1,
+        "empty": 0,
+        "bytes": 0,
+    }
+    assert _run_s5cmd_command(command=f"cp s3://bucket/blobs/empty_prefix* {tmp_path}/") == {
+        "objects": 0,
+        "errors": 0,
+        "throttled": 0,
+        "empty": 1,
+        "bytes": 0,
+    }
@@ -0,0 +1,30 @@
+import random
+import uuid
+
+from simple_s3_backup._base._scan import _scan_local_blobs
+
+
+def test_scan_local_blobs_merges_partitions_in_sorted_order(tmp_path):
+    random_generator = random.Random(0)
+    blobs_directories = [tmp_path / "001" / "blobs", tmp_path / "002" / "blobs"]
+    blob_id_to_size = dict()
+    for _ in range(300):
+        blob_id = str(uuid.UUID(int=random_generator.getrandbits(128), version=4))
+        # Split by the first hex digit, as the partitions are
+        blobs_directory = blobs_directories[int(blob_id[0], 16) % 2]
+        file_path = blobs_directory / blob_id[:3] / blob_id[3:6] / blob_id
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.write_bytes(b"0" * len(blob_id_to_size))
+        blob_id_to_size[blob_id] = len(blob_id_to_size)
+    (file_path.parent / f"{file_path.name}.rmv").write_bytes(b"")
+
+    # A window smaller than the number of directories keeps several batches of results pending
+    inventory = _scan_local_blobs(blobs_directories=[*blobs_directories, tmp_path / "missing"], max_workers=2)
+
+    assert [blob_id for blob_id, _, _ in inventory] == sorted(blob_id_to_size)
+    assert [size for _, size, _ in inventory] == [blob_id_to_size[blob_id] for blob_id in sorted(blob_id_to_size)]
+
+    inventory = _scan_local_blobs(blobs_directories=blobs_directories, max_workers=2, prefix_range=("400", "c00"))
+    assert [blob_id for blob_id, _, _ in inventory] == sorted(
+        blob_id for blob_id in blob_id_to_size if "400" <= blob_id[:3] < "c00"
+    )
@@ -0,0 +1,104 @@
+import collections
+import json
+import time
+
+import pytest
+
+from simple_s3_backup._base import _display, _scheduler
+
+
+@pytest.fixture
+def plans_directory(tmp_path, monkeypatch):
+    monkeypatch.setattr(_scheduler, "_PLANS_DIRECTORY", tmp_path)
+    units = [{"prefixes": [f"{index:03x}"], "bytes": 1, "objects": 1, "cost": 1} for index in range(3)]
+    with (tmp_path / "blobs.json").open(mode="w") as file_stream:
+        json.dump(obj={"kind": "blobs", "units": units}, fp=file_stream)
+    return tmp_path
+
+
+def test_claims_are_leased_completed_and_reissued(plans_directory, monkeypatch):
+    monkeypatch.setattr(_scheduler, "_get_task_name", lambda: "1_0")
+    assert _scheduler._claim_work_unit(kind="blobs")[0] == 0
+    _scheduler._complete_work_unit(kind="blobs", unit_index=0, errors=0)
+    assert _scheduler._claim_work_unit(kind="blobs")[0] == 1
+
+    # Another task skips the units held by the first one, until their lease expires
+    monkeypatch.setattr(_scheduler, "_get_task_name", lambda: "1_1")
+    assert _scheduler._claim_work_unit(kind="blobs")[0] == 2
+    _scheduler._complete_work_unit(kind="blobs", unit_index=2, errors=1)
+    assert _scheduler._claim_work_unit(kind="blobs") is None
+    assert _scheduler._claim_work_unit(kind="blobs", lease_in_seconds=0)[0] == 1
+
+    claims = json.loads((plans_directory / "blobs.claims.json").read_text())
+    assert claims["0"]["done"] is not None and claims["0"]["errors"] == 0
+    assert claims["1"]["task"] == "1_1" and claims["1"]["done"] is None
+
+    # The first task, restarted, neither takes back a re-issued unit nor marks it done
+    monkeypatch.setattr(_scheduler, "_get_task_name", lambda: "1_0")
+    assert _scheduler._claim_work_unit(kind="blobs") is None
+    _scheduler._complete_work_unit(kind="blobs", unit_index=1, errors=0)
+    assert json.loads((plans_directory / "blobs.claims.json").read_text())["1"]["done"] is None
+
+
+def test_restarted_task_takes_back_its_unit(plans_directory, monkeypatch):
+    monkeypatch.setattr(_scheduler, "_get_task_name", lambda: "1_0")
+    assert _scheduler._claim_work_unit(kind="blobs")[0] == 0
+    assert _scheduler._claim_work_unit(kind="blobs")[0] == 0
+
+
+def test_lease_is_renewed_while_held(plans_directory, monkeypatch):
+    monkeypatch.setattr(_scheduler, "_get_task_name", lambda: "1_0")
+    _scheduler._claim_work_unit(kind="blobs")
+    claimed = json.loads((plans_directory / "blobs.claims.json").read_text())["0"]["renewed"]
+
+    with _scheduler._renew_work_unit_lease(kind="blobs", unit_index=0, lease_in_seconds=0.15):
+        time.sleep(0.3)
+
+    assert json.loads((plans_directory / "blobs.claims.json").read_text())["0"]["renewed"] > claimed
+
+
+def test_zarr_plan_skips_empty_prefixes(tmp_path, monkeypatch):
+    class EmptyListingSource:
+        def get_usage(self, prefix, unit_width):
+            return dict()
+
+    def du(command):
+        if "/zarr/abc*" in command:
+            return "1024 bytes in 2 objects: s3://dandiarchive/zarr/abc*\n"
+        message = f'\n\nError code 1\n\nstderr: ERROR "du {command}": no object found\n\n'
+        raise RuntimeError(message)
+
+    monkeypatch.setattr(_scheduler, "BACKUP_DIRECTORY", tmp_path)
+    monkeypatch.setattr(_scheduler, "_PLANS_DIRECTORY", tmp_path / "plans")
+    monkeypatch.setattr(_scheduler, "_get_listing_source", lambda manifests_directory: EmptyListingSource())
+    monkeypatch.setattr(_display, "_deploy_subprocess", du)
+
+    plan_file_path = _scheduler.plan_dandi_backup(kind="zarr", number_of_units=4, per_object_cost_in_bytes=0)
+
+    units = json.loads(plan_file_path.read_text())["units"]
+    assert units == [{"prefixes": ["abc"], "bytes": 1024, "objects": 2, "cost": 1024}]
+
+
+def test_adaptive_work_copies_each_partition_to_its_own_destination(tmp_path, monkeypatch):
+    monkeypatch.setattr(_scheduler, "_PLANS_DIRECTORY", tmp_path)
+    monkeypatch.setattr(_scheduler, "_get_task_name", lambda: "1_0")
+    units = [{"prefixes": ["0ab", "fcd", "1ef"], "bytes": 3, "objects": 3, "cost": 3}]
+    with (tmp_path / "blobs.json").open(mode="w") as file_stream:
+        json.dump(obj={"kind": "blobs", "units": units}, fp=file_stream)
+
+    destination_to_commands = dict()
+
+    def run(commands, command_file_path, destination, controller, commands_per_run):
+        destination_to_commands[destination] = commands
+        return collections.Counter(objects=len(commands), errors=1, throttled=0, bytes=0)
+
+    monkeypatch.setattr(_scheduler, "_run_s5cmd_batch_adaptively", run)
+
+    _scheduler.work_dandi_backup(kind="blobs", adaptive=True)
+
+    blobs_001 = _scheduler.DANDI_ROOT / "001" / "s3dandiarchive" / "blobs"
+    blobs_002 = _scheduler.DANDI_ROOT / "002" / "s3dandiarchive" / "blobs"
+    assert list(destination_to_commands) == [blobs_001, blobs_002]
+    assert all(f"{blobs_001}/" in command for command in destination_to_commands[blobs_001])
+    assert len(destination_to_commands[blobs_001]) == 2 and "/blobs/fcd/" in destination_to_commands[blobs_002][0]
+    assert json.loads((tmp_path / "blobs.claims.json").read_text())["0"]["errors"] == 2
@@ -0,0 +1,41 @@
+from simple_s3_backup._base._controller import _MEBIBYTE
+from simple_s3_backup._base._simulation import simulate_transfer_controller
+
+_NUMBER_OF_TASKS = 16
+
+
+def test_controllers_converge():
+    rows = simulate_transfer_controller(number_of_tasks=_NUMBER_OF_TASKS)
+
+    settled_rows = rows[len(rows) // 2 :]
+    workers = [row["workers"] for row in settled_rows]
+    throughputs = [row["throughput"] for row in settled_rows]
+    assert max(workers) - min(workers) <= 0.1 * max(workers)
+    assert min(throughputs) >= 0.5 * max(throughputs)
+    assert all(row["throttled"] == 0 for row in settled_rows)
+
+
+def test_global_caps_are_respected():
+    max_workers = 64
+    max_bandwidth_in_bytes_per_second = 512 * _MEBIBYTE
+    rows = simulate_transfer_controller(
+        number_of_tasks=_NUMBER_OF_TASKS,
+        max_workers=max_workers,
+        max_bandwidth_in_bytes_per_second=max_bandwidth_in_bytes_per_second,
+    )
+
+    # Every task keeps one worker even over the cap, until the tasks that started first renew their leases
+    assert rows[0]["workers"] <= max_workers + _NUMBER_OF_TASKS
+    assert all(row["workers"] <= max_workers for row in rows[1:])
+
+    mean_throughput = sum(row["throughput"] for row in rows) / len(rows)
+    assert mean_throughput <= max_bandwidth_in_bytes_per_second
+
+
+def test_controllers_back_off_under_throttling():
+    rows = simulate_transfer_controller(number_of_tasks=_NUMBER_OF_TASKS, max_request_rate=200.0)
+
+    settled_rows = rows[len(rows) // 2 :]
+    assert rows[0]["throttled"] > 0
+    assert all(row["workers"] <= rows[0]["workers"] / 4 for row in settled_rows)
+    assert max(row["throttled"] for row in settled_rows) < rows[0]["throttled"]
@@ -0,0 +1,31 @@
+import json
+
+from simple_s3_backup._base import _metrics, _stats
+from simple_s3_backup._base._utils import _human_readable_size
+
+
+def test_metrics_are_aggregated_into_percentiles_and_throughput(tmp_path, monkeypatch):
+    monkeypatch.setattr(_metrics, "_METRICS_DIRECTORY", tmp_path)
+    monkeypatch.setattr(_stats, "_METRICS_DIRECTORY", tmp_path)
+    monkeypatch.setattr(_stats, "_get_today", lambda: "2024-01-02")
+
+    records = [
+        {"kind": "command", "name": "s5cmd cp", "prefix": "blobs/abc", "duration": duration, "bytes": 1_000}
+        for duration in range(1, 21)
+    ]
+    records.append({"kind": "command", "name": "s5cmd du", "prefix": "blobs/abc", "duration": 2, "surveyed_bytes": 10})
+    records.append({"kind": "log", "name": "s5cmd cp", "prefix": "blobs/abc", "duration": 100})
+    (tmp_path / "2024-01-02").mkdir()
+    with (tmp_path / "2024-01-02" / "1_0.jsonl").open(mode="w") as file_stream:
+        file_stream.writelines(f"{json.dumps(record)}\n" for record in records)
+        file_stream.write('{"kind": "command", "name": "s5cmd cp", "dur')  # Torn by preemption
+    (tmp_path / "2023-12-01").mkdir()  # Outside of the requested days
+    (tmp_path / "2023-12-01" / "1_0.jsonl").write_text(json.dumps(records[0]) + "\n")
+
+    copy_row, du_row = _stats.summarize_dandi_metrics(days=2)
+
+    assert copy_row["name"] == "s5cmd cp" and copy_row["count"] == 20
+    assert copy_row["p50 (s)"] == 10 and copy_row["p95 (s)"] == 19
+    assert copy_row["bytes"] == 20_000 and copy_row["surveyed"] == 0
+    assert du_row["name"] == "s5cmd du" and du_row["bytes"] == 0 and du_row["surveyed"] == 10
+    assert du_row["throughput"] == f"{_human_readable_size(size_in_bytes=0)}/s"
@@ -0,0 +1,22 @@
+import json
+
+import pytest
+
+from simple_s3_backup._base._streaming import _stream_subprocess
+
+
+def test_stream_subprocess_line_length() -> None:
+    assert list(_stream_subprocess(command="printf 'abcd\\nefgh'", max_line_length=4)) == ["abcd", "efgh"]
+
+    with pytest.raises(RuntimeError, match="exceeded 4 characters"):
+        list(_stream_subprocess(command="printf 'abcde\\n'", max_line_length=4))
+
+
+def test_stream_subprocess_logs_json_records(capsys: pytest.CaptureFixture) -> None:
+    lines = list(_stream_subprocess(command="echo warning >&2; seq 5", progress_interval=2))
+    assert lines == ["1", "2", "3", "4", "5"]
+
+    records = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [record["lines"] for record in records if record["name"] == "subprocess.progress"] == [2, 4]
+    assert [record["line"] for record in records if record["name"] == "subprocess.stderr"] == ["warning"]
+    assert all(record["kind"] == "log" and record["command"].startswith("echo") for record in records)
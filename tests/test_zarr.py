@@ -0,0 +1,129 @@
+import collections
+import pathlib
+
+import pytest
+
+from simple_s3_backup._base import _zarr
+from simple_s3_backup._base._zarr_pack import _ZarrPack
+
+_ZARR_ID = "abcdef01-2345-6789-abcd-ef0123456789"
+
+
+@pytest.fixture
+def remote_store(tmp_path, monkeypatch):
+    """A fake remote Zarr store, as a dictionary of key to data, that `s5cmd ls` and `s5cmd run` are served from."""
+    key_to_data = {".zarray": b"{}", "0/0": b"a" * 4, "0/1": b"b" * 4}
+    copied_commands = []
+
+    def write_zarr_listing(zarr_id, file_path):
+        with file_path.open(mode="w") as file_stream:
+            for key in sorted(key_to_data):
+                file_stream.write(f"{key}\t{len(key_to_data[key])}\t{sum(key_to_data[key])}\n")
+
+    def run_s5cmd_batch(commands, command_file_path, number_of_workers):
+        copied_commands.extend(commands)
+        summary = collections.Counter(objects=0, errors=0, bytes=0)
+        for command in commands:
+            source, destination = command.split(" ")[-2:]
+            key = source.removeprefix(f"s3://{_zarr.DANDI_BUCKET}/zarr/{_ZARR_ID}/")
+            if key not in key_to_data:
+                summary["errors"] += 1
+                continue
+            pathlib.Path(destination).parent.mkdir(parents=True, exist_ok=True)
+            pathlib.Path(destination).write_bytes(key_to_data[key])
+            summary["objects"] += 1
+            summary["bytes"] += len(key_to_data[key])
+        return summary
+
+    monkeypatch.setattr(_zarr, "BACKUP_DIRECTORY", tmp_path / "backup")
+    monkeypatch.setattr(_zarr, "_ZARR_MANIFESTS_DIRECTORY", tmp_path / "backup" / "manifests" / "zarr")
+    monkeypatch.setattr(_zarr, "_write_zarr_listing", write_zarr_listing)
+    monkeypatch.setattr(_zarr, "_run_s5cmd_batch", run_s5cmd_batch)
+    return key_to_data, copied_commands
+
+
+def test_diff_manifests(tmp_path):
+    previous_manifest_file_path = tmp_path / "previous.tsv"
+    current_manifest_file_path = tmp_path / "current.tsv"
+    previous_manifest_file_path.write_text("a\t1\t10\nb\t1\t10\nc\t1\t10\ne\t1\t10\n")
+    current_manifest_file_path.write_text("b\t2\t10\nc\t1\t10\nd\t1\t10\n")
+
+    assert list(
+        _zarr._diff_manifests(
+            previous_manifest_file_path=previous_manifest_file_path,
+            current_manifest_file_path=current_manifest_file_path,
+        )
+    ) == [
+        ("deleted", "a"),
+        ("listed", "b"),
+        ("changed", "b"),
+        ("listed", "c"),
+        ("listed", "d"),
+        ("changed", "d"),
+        ("deleted", "e"),
+    ]
+
+    # Without a previous manifest, every key is new
+    assert list(
+        _zarr._diff_manifests(
+            previous_manifest_file_path=tmp_path / "missing.tsv", current_manifest_file_path=current_manifest_file_path
+        )
+    ) == [("listed", "b"), ("changed", "b"), ("listed", "c"), ("changed", "c"), ("listed", "d"), ("changed", "d")]
+
+
+def test_nested_sync_only_copies_changes(tmp_path, remote_store):
+    key_to_data, copied_commands = remote_store
+    destination = _zarr._get_nested_zarr_directory(zarr_backup_directory=tmp_path / "zarr", zarr_id=_ZARR_ID)
+    assert destination == tmp_path / "zarr" / "abc" / "def" / _ZARR_ID
+
+    summary = _zarr._sync_zarr(zarr_id=_ZARR_ID, destination=destination)
+    assert summary["listed"] == 3 and summary["changed"] == 3 and summary["objects"] == 3
+    assert all("--if-size-differ --if-source-newer" in command for command in copied_commands)
+    assert (destination / "0" / "1").read_bytes() == b"b" * 4
+
+    # Once a manifest exists, only the chunks that changed since are copied, and removed chunks are only counted
+    copied_commands.clear()
+    key_to_data["0/1"] = b"c" * 5
+    del key_to_data["0/0"]
+    summary = _zarr._sync_zarr(zarr_id=_ZARR_ID, destination=destination)
+    assert summary["listed"] == 2 and summary["changed"] == 1 and summary["deleted"] == 1
+    assert copied_commands == [f"cp s3://{_zarr.DANDI_BUCKET}/zarr/{_ZARR_ID}/0/1 {destination}/0/1"]
+    assert (destination / "0" / "1").read_bytes() == b"c" * 5 and (destination / "0" / "0").exists()
+
+    # An unchanged store copies nothing
+    copied_commands.clear()
+    assert _zarr._sync_zarr(zarr_id=_ZARR_ID, destination=destination)["changed"] == 0
+    assert copied_commands == []
+
+
+def test_failed_sync_keeps_the_previous_manifest(tmp_path, remote_store, monkeypatch):
+    key_to_data, copied_commands = remote_store
+    destination = tmp_path / "zarr" / _ZARR_ID
+    _zarr._sync_zarr(zarr_id=_ZARR_ID, destination=destination)
+
+    key_to_data["0/2"] = b"d" * 4
+    monkeypatch.setattr(
+        _zarr, "_run_s5cmd_batch", lambda commands, command_file_path, number_of_workers: {"errors": len(commands)}
+    )
+    assert _zarr._sync_zarr(zarr_id=_ZARR_ID, destination=destination)["errors"] == 1
+
+    manifest_file_path = tmp_path / "backup" / "manifests" / "zarr" / f"{_ZARR_ID}.tsv"
+    assert "0/2" not in manifest_file_path.read_text()
+    assert not manifest_file_path.with_suffix(".tsv.new").exists()
+
+
+def test_packed_sync_appends_changes_to_the_pack(tmp_path, remote_store):
+    key_to_data, _ = remote_store
+    destination = tmp_path / "zarr" / "abc" / "def" / f"{_ZARR_ID}.zpack"
+
+    summary = _zarr._sync_zarr(zarr_id=_ZARR_ID, destination=destination, packed=True)
+    assert summary["objects"] == 3
+    assert not (destination / "staging").exists()
+    assert (tmp_path / "backup" / "manifests" / "zarr" / f"{_ZARR_ID}.packed.tsv").exists()
+
+    key_to_data["0/0"] = b"e" * 6
+    _zarr._sync_zarr(zarr_id=_ZARR_ID, destination=destination, packed=True)
+
+    pack = _ZarrPack(directory=destination)
+    assert sorted(pack) == [".zarray", "0/0", "0/1"]
+    assert pack.read(key="0/0") == b"e" * 6 and pack.read(key="0/1") == b"b" * 4
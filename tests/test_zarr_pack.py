@@ -0,0 +1,65 @@
+from simple_s3_backup._base._zarr_pack import _ZarrPack
+
+
+def _stage_chunks(staging_directory, key_to_data):
+    for key, data in key_to_data.items():
+        file_path = staging_directory / key
+        file_path.parent.mkdir(parents=True, exist_ok=True)
+        file_path.write_bytes(data)
+
+
+def test_append_reopen_and_overwrite(tmp_path):
+    pack_directory = tmp_path / "pack"
+    staging_directory = tmp_path / "staging"
+    _stage_chunks(staging_directory, {".zarray": b"{}", "0/0": b"a" * 6, "0/1": b"b" * 6})
+
+    pack = _ZarrPack(directory=pack_directory, max_pack_size_in_bytes=8)
+    summary = pack.append_files(source_directory=staging_directory)
+    assert summary == {"chunks": 3, "bytes": 14}
+    assert not staging_directory.exists()
+    assert len(list(pack_directory.glob("*.pack"))) == 2  # Rolled over past the maximum pack size
+
+    # A changed chunk is appended again, its latest index line wins, and a torn final line is ignored
+    _stage_chunks(staging_directory, {"0/1": b"c" * 3})
+    _ZarrPack(directory=pack_directory).append_files(source_directory=staging_directory)
+    with (pack_directory / "index.tsv").open(mode="a") as file_stream:
+        file_stream.write("0/2\t9\t0")
+
+    reopened_pack = _ZarrPack(directory=pack_directory)
+    assert sorted(reopened_pack) == [".zarray", "0/0", "0/1"]
+    assert reopened_pack.read(key="0/0") == b"a" * 6 and reopened_pack.read(key="0/1") == b"c" * 3
+
+    restored_directory = tmp_path / "restored"
+    assert reopened_pack.restore(destination=restored_directory) == 3
+    assert (restored_directory / "0" / "1").read_bytes() == b"c" * 3
+
+
+def test_files_are_only_removed_once_indexed(tmp_path, monkeypatch):
+    pack_directory = tmp_path / "pack"
+    staging_directory = tmp_path / "staging"
+    _stage_chunks(staging_directory, {f"0/{index}": b"x" * 4 for index in range(4)})
+
+    close_pack = _ZarrPack._close_pack
+    staged_file_counts = []
+
+    def record_staged_files(self, pack_stream, index_lines):
+        staged_file_counts.append(sum(1 for file_path in staging_directory.rglob("*") if file_path.is_file()))
+        close_pack(self, pack_stream=pack_stream, index_lines=index_lines)
+
+    monkeypatch.setattr(_ZarrPack, "_close_pack", record_staged_files)
+    _ZarrPack(directory=pack_directory, max_pack_size_in_bytes=8).append_files(source_directory=staging_directory)
+
+    # Each pack holds two chunks, whose files are still there when its index lines are written
+    assert staged_file_counts == [4, 2]
+
+
+def test_verify_against_manifest(tmp_path):
+    staging_directory = tmp_path / "staging"
+    _stage_chunks(staging_directory, {"0/0": b"a" * 4, "0/1": b"b" * 4})
+    pack = _ZarrPack(directory=tmp_path / "pack")
+    pack.append_files(source_directory=staging_directory, remove=False)
+    assert (staging_directory / "0" / "0").exists()
+
+    manifest_file_path = tmp_path / "manifest.tsv"
+    manifest_file_path.write_text("0/0\t4\t0\n0/1\t5\t0\n0/2\t4\t0\n")
+    assert pack.verify(manifest_file_path=manifest_file_path) == {"intact": 1, "missing": 1, "mismatched": 1}